@@ -0,0 +1,61 @@
+"""Shared fixtures: small synthetic rasters and study-area masks."""
+
+import json
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+
+@pytest.fixture
+def geotiff_path(tmp_path):
+    """A 3-band, 64 x 48 float32 GeoTIFF in EPSG:4326 with 16 x 16 blocks."""
+    path = tmp_path / "raster.tif"
+    count, height, width = 3, 48, 64
+    data = np.arange(count * height * width, dtype="float32").reshape(
+        count, height, width
+    )
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        count=count,
+        height=height,
+        width=width,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(8.0, 58.2, 0.001, 0.001),
+        nodata=-9999.0,
+        tiled=True,
+        blockxsize=16,
+        blockysize=16,
+    ) as dst:
+        dst.descriptions = ("DTM", "fractionBuilt", "LST")
+        dst.write(data)
+    return path
+
+
+@pytest.fixture
+def mask_path(tmp_path):
+    """A GeoJSON polygon covering the interior of ``geotiff_path``."""
+    path = tmp_path / "mask.geojson"
+    polygon = {
+        "type": "Polygon",
+        "coordinates": [
+            [
+                [8.005, 58.195],
+                [8.05, 58.195],
+                [8.05, 58.16],
+                [8.005, 58.16],
+                [8.005, 58.195],
+            ]
+        ],
+    }
+    feature_collection = {
+        "type": "FeatureCollection",
+        "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+        "features": [{"type": "Feature", "properties": {}, "geometry": polygon}],
+    }
+    path.write_text(json.dumps(feature_collection))
+    return path
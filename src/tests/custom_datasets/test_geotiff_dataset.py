@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+import rasterio
+import rasterio.mask
+from kedro.io.core import DatasetError
+
+from urban_climate.custom_datasets.geotiff_dataset import GeoTIFFDataSet
+from urban_climate.utils.raster.windows import RasterBlockReader
+
+
+class TestGeoTIFFDataSetBlocks:
+    def test_blocks_cover_raster(self, geotiff_path):
+        dataset = GeoTIFFDataSet(str(geotiff_path), load_args={"mode": "blocks"})
+        reader = dataset.load()
+
+        assert isinstance(reader, RasterBlockReader)
+        assert len(reader) == 12  # 3 x 4 blocks of 16 x 16
+        with rasterio.open(geotiff_path) as src:
+            np.testing.assert_array_equal(reader.read(), src.read())
+
+    def test_tile_shape_groups_blocks(self, geotiff_path):
+        dataset = GeoTIFFDataSet(
+            str(geotiff_path), load_args={"mode": "blocks", "tile_shape": [20, 64]}
+        )
+        windows = list(dataset.load().windows())
+
+        assert [(w.height, w.width) for w in windows] == [(32, 64), (16, 64)]
+
+    def test_masked_blocks_match_array_load(self, geotiff_path, mask_path):
+        load_args = {"mask": True, "mask_path": str(mask_path)}
+        data, meta = GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+        reader = GeoTIFFDataSet(
+            str(geotiff_path), load_args={**load_args, "mode": "blocks"}
+        ).load()
+
+        assert reader.meta["transform"] == meta["transform"]
+        for window, array, window_transform in reader:
+            rows, cols = window.toslices()
+            np.testing.assert_array_equal(array, data[:, rows, cols])
+            assert window_transform == rasterio.windows.transform(
+                window, meta["transform"]
+            )
+
+
+class TestGeoTIFFDataSetMask:
+    def test_masked_load_matches_rasterio_mask(self, geotiff_path, mask_path):
+        load_args = {"mask": True, "mask_path": str(mask_path)}
+        data, meta = GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+
+        import fiona
+
+        with fiona.open(mask_path) as shp:
+            shapes = [feature["geometry"] for feature in shp]
+        with rasterio.open(geotiff_path) as src:
+            expected, transform = rasterio.mask.mask(src, shapes, crop=True)
+
+        np.testing.assert_array_equal(data, expected)
+        assert meta["transform"] == transform
+        assert (meta["height"], meta["width"]) == expected.shape[1:]
+
+    def test_mask_is_read_once(self, geotiff_path, mask_path, monkeypatch):
+        import fiona
+
+        from urban_climate.utils.raster.mask import mask_cache
+
+        calls = []
+        fiona_open = fiona.open
+        monkeypatch.setattr(
+            fiona, "open", lambda *a, **k: calls.append(a) or fiona_open(*a, **k)
+        )
+        mask_cache.clear()
+        load_args = {"mask": True, "mask_path": str(mask_path)}
+        for _ in range(3):
+            GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+
+        assert len(calls) == 1
+
+
+class TestGeoTIFFDataSetSave:
+    def test_cog_profile(self, geotiff_path, tmp_path):
+        data, meta = GeoTIFFDataSet(str(geotiff_path)).load()
+        cog_path = tmp_path / "cog.tif"
+        GeoTIFFDataSet(
+            str(cog_path),
+            save_args={"profile": "cog", "compress": "zstd", "blocksize": 16},
+        ).save((data, meta))
+
+        with rasterio.open(cog_path) as src:
+            assert src.profile["tiled"]
+            assert src.block_shapes[0] == (16, 16)
+            assert src.compression.name == "zstd"
+            assert src.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"] == "3"
+            assert src.overviews(1)
+            assert src.descriptions == meta["descriptions"]
+            np.testing.assert_array_equal(src.read(), data)
+
+    def test_save_does_not_mutate_metadata(self, geotiff_path, tmp_path):
+        data, meta = GeoTIFFDataSet(str(geotiff_path)).load()
+        GeoTIFFDataSet(str(tmp_path / "out.tif")).save((data, meta))
+
+        assert "descriptions" in meta and "bounds" in meta
+
+
+class TestGeoTIFFDataSetHeader:
+    def test_header_reads_pixels_on_first_access(self, geotiff_path, mask_path):
+        load_args = {"mask": True, "mask_path": str(mask_path)}
+        data, meta = GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+        raster = GeoTIFFDataSet(
+            str(geotiff_path), load_args={**load_args, "mode": "header"}
+        ).load()
+
+        assert raster[1]["transform"] == meta["transform"]
+        assert raster.shape == data.shape
+        assert not raster.is_loaded
+
+        array, _ = raster
+        assert raster.is_loaded
+        np.testing.assert_array_equal(array, data)
+
+
+class TestGeoTIFFDataSetBands:
+    def test_bands_by_description_and_dtype(self, geotiff_path):
+        load_args = {"bands": ["LST", 1], "dtype": "float64"}
+        data, meta = GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+
+        with rasterio.open(geotiff_path) as src:
+            expected = src.read([3, 1])
+        assert data.dtype == np.float64
+        np.testing.assert_array_equal(data, expected)
+        assert meta["descriptions"] == ("LST", "DTM")
+        assert (meta["count"], meta["dtype"]) == (2, "float64")
+
+    def test_masked_array(self, geotiff_path, mask_path):
+        load_args = {"mask": True, "mask_path": str(mask_path)}
+        filled, meta = GeoTIFFDataSet(str(geotiff_path), load_args=load_args).load()
+        data, _ = GeoTIFFDataSet(
+            str(geotiff_path), load_args={**load_args, "masked": True}
+        ).load()
+
+        assert isinstance(data, np.ma.MaskedArray)
+        np.testing.assert_array_equal(data.mask, filled == meta["nodata"])
+
+    def test_unknown_band(self, geotiff_path):
+        dataset = GeoTIFFDataSet(str(geotiff_path), load_args={"bands": ["NDVI"]})
+        with pytest.raises(DatasetError, match="NDVI"):
+            dataset.load()
+
+
+class TestGeoTIFFDataSetWarp:
+    def test_warp_masks_in_target_crs(self, geotiff_path, mask_path):
+        from rasterio.vrt import WarpedVRT
+        from rasterio.warp import transform_geom
+
+        warp = {"crs": "EPSG:25832", "resolution": 100}
+        load_args = {"mask": True, "mask_path": str(mask_path), "warp": warp}
+        dataset = GeoTIFFDataSet(str(geotiff_path), load_args=load_args)
+        data, meta = dataset.load()
+
+        import fiona
+
+        with fiona.open(mask_path) as shp:
+            shapes = [
+                transform_geom("EPSG:4326", "EPSG:25832", feature["geometry"])
+                for feature in shp
+            ]
+        with rasterio.open(geotiff_path) as src:
+            options = dataset._vrt_options(src, warp)
+            with WarpedVRT(src, **options) as vrt:
+                expected, transform = rasterio.mask.mask(vrt, shapes, crop=True)
+
+        assert meta["crs"] == "EPSG:25832"
+        assert meta["transform"] == transform
+        assert (meta["transform"].a, meta["transform"].e) == (100, -100)
+        assert meta["transform"].c % 100 == 0 and meta["transform"].f % 100 == 0
+        np.testing.assert_array_equal(data, expected)
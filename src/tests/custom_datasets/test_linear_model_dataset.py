@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from urban_climate.custom_datasets.linear_model_dataset import LinearModelDataSet
+from urban_climate.utils.predictor import LinearPredictor
+
+
+class TestLinearModelDataSet:
+    @pytest.mark.parametrize("format", ["json", "npz"])
+    def test_save_sklearn_and_load_predictor(self, tmp_path, format):
+        X = pd.DataFrame({"a": [0.0, 1, 2, 3], "b": [1.0, 0, 1, 0]})
+        model = LinearRegression().fit(X, 2 * X["a"] - X["b"] + 1)
+        dataset = LinearModelDataSet(str(tmp_path / f"model.{format}"), format)
+
+        dataset.save(model)
+        loaded = dataset.load()
+
+        assert isinstance(loaded, LinearPredictor)
+        assert loaded.features == ["a", "b"]
+        np.testing.assert_allclose(loaded.predict(X), model.predict(X))
+        assert loaded.metadata["model"].endswith("LinearRegression")
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError, match="Unknown format"):
+            LinearModelDataSet("model.pkl", format="pickle")
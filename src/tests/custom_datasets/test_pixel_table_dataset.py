@@ -0,0 +1,108 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from urban_climate.custom_datasets.pixel_table_dataset import PixelTableDataSet
+from urban_climate.utils.raster.grid import RasterGrid
+from urban_climate.utils.raster.table import raster_to_table
+
+
+@pytest.fixture
+def pixel_table():
+    grid = RasterGrid.from_bounds((0, 0, 4000, 3000), "EPSG:25832", 100)
+    array = np.random.default_rng(0).random((3,) + grid.shape, dtype="float32")
+    meta = grid.to_meta(
+        {"count": 3, "dtype": "float32", "nodata": -9999, "descriptions": "ABC"}
+    )
+    return raster_to_table((array, meta))
+
+
+class TestPixelTableDataSet:
+    @pytest.mark.parametrize("format", ["parquet", "arrow"])
+    def test_save_and_load(self, tmp_path, pixel_table, format):
+        dataset = PixelTableDataSet(filepath=str(tmp_path / "t"), format=format)
+        dataset.save(pixel_table)
+
+        loaded = dataset.load()
+
+        assert loaded.equals(pixel_table)
+        assert loaded["A"].dtype == "float32"
+        assert loaded.attrs["crs"] == "EPSG:25832"
+
+    def test_projection_and_pushdown(self, tmp_path, pixel_table):
+        filepath = str(tmp_path / "t.parquet")
+        PixelTableDataSet(filepath, save_args={"row_group_size": 100}).save(pixel_table)
+        dataset = PixelTableDataSet(
+            filepath,
+            load_args={
+                "columns": ["pixel", "B"],
+                "filters": [["row", "<", 5], ["B", ">", 0.5]],
+                "geometry": True,
+            },
+        )
+
+        loaded = dataset.load()
+
+        expected = pixel_table[(pixel_table.row < 5) & (pixel_table.B > 0.5)]
+        assert list(loaded.columns) == ["pixel", "B", "X", "Y", "geometry"]
+        np.testing.assert_array_equal(loaded["pixel"], expected["pixel"])
+
+    @pytest.mark.parametrize("format", ["parquet", "arrow"])
+    def test_chunked_load(self, tmp_path, pixel_table, format):
+        filepath = str(tmp_path / "t")
+        PixelTableDataSet(filepath, format=format).save(pixel_table)
+        dataset = PixelTableDataSet(
+            filepath,
+            format=format,
+            load_args={"chunked": True, "columns": ["A"], "filters": [["B", "<", 0.5]]},
+        )
+
+        chunks = pickle.loads(pickle.dumps(dataset.load()))
+
+        loaded = pd.concat(list(chunks), ignore_index=True)
+        assert len(chunks) >= 1 and list(loaded.columns) == ["A"]
+        np.testing.assert_array_equal(
+            loaded["A"], pixel_table["A"][pixel_table.B < 0.5]
+        )
+
+    @pytest.mark.parametrize("format", ["parquet", "arrow"])
+    def test_chunked_file_is_closed(self, tmp_path, pixel_table, format):
+        filepath = str(tmp_path / "t")
+        PixelTableDataSet(filepath, format=format).save(pixel_table)
+        chunks = PixelTableDataSet(
+            filepath, format=format, load_args={"chunked": True}
+        ).load()
+
+        # exhausted iteration
+        list(chunks)
+        assert chunks._file is None
+
+        # unfinished iteration, once dropped
+        iterator = iter(chunks)
+        next(iterator)
+        f = chunks._file
+        assert not f.closed
+        del iterator
+        assert f.closed and chunks._file is None
+
+        with chunks:
+            chunks.read(0)
+            f = chunks._file
+        assert f.closed and chunks._file is None
+
+    def test_geometry_is_rebuilt_from_xy(self, tmp_path, pixel_table):
+        dataset = PixelTableDataSet(
+            str(tmp_path / "t.parquet"), load_args={"geometry": True}
+        )
+        dataset.save(pixel_table)
+
+        loaded = dataset.load()
+
+        assert loaded.crs == "EPSG:25832"
+        assert loaded.geometry.iloc[0].x == pixel_table.X.iloc[0]
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError, match="Unknown format"):
+            PixelTableDataSet("t.csv", format="csv")
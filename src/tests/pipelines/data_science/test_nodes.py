@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from urban_climate.pipelines.data_science.nodes import (
+    compare_models,
+    export_model,
+    prepare_model_matrix,
+    select_model,
+)
+
+
+@pytest.fixture
+def compared():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.random((200, 2)), columns=["a", "b"])
+    data["LST"] = 20 + 3 * data["a"] - 2 * data["b"]
+    options = {
+        "features": ["a", "b"],
+        "candidates": {
+            "linear": {"model": "sklearn.linear_model.LinearRegression"},
+            "only_a": {
+                "model": "sklearn.linear_model.LinearRegression",
+                "features": ["a"],
+            },
+        },
+        "random_state": 0,
+    }
+    return compare_models(prepare_model_matrix(data, options), options)
+
+
+class TestSelectModel:
+    def test_select_and_export(self, compared):
+        scores, models = compared
+
+        regressor = select_model(models, scores, {"candidate": "only_a"})
+        predictor = export_model(regressor, scores, {"candidate": "only_a"})
+
+        assert regressor is models["only_a"]
+        assert predictor.features == ["a"]
+        assert predictor.metadata["candidate"] == "only_a"
+        assert predictor.metadata["train_rows"] == 160
+        with pytest.raises(ValueError, match="not one of the compared"):
+            select_model(models, scores, {"candidate": "ridge"})
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from urban_climate.pipelines.raster_processing.nodes import stack_to_gdf
+from urban_climate.utils.raster.grid import RasterGrid
+
+
+@pytest.fixture
+def raster_stack():
+    grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+    array = np.arange(2 * 3 * 4, dtype="float32").reshape(2, 3, 4)
+    array[:, 0, 0] = -9999
+    array[1, 2, 3] = -9999
+    meta = grid.to_meta(
+        {
+            "count": 2,
+            "dtype": "float32",
+            "nodata": -9999,
+            "descriptions": ["DTM", "LST"],
+        }
+    )
+    return array, meta
+
+
+class TestStackToGdf:
+    def test_valid_pixels_at_pixel_centres(self, raster_stack):
+        study_area_mask = np.ones((3, 4), dtype=bool)
+        study_area_mask[:, 1] = False
+
+        gdf = stack_to_gdf(raster_stack, study_area_mask, {"geometry": True})
+
+        assert list(gdf.columns) == [
+            "pixel",
+            "row",
+            "col",
+            "X",
+            "Y",
+            "DTM",
+            "LST",
+            "geometry",
+        ]
+        assert len(gdf) == 3 * 3 - 1
+        first = gdf.iloc[0]
+        assert (first.X, first.Y) == (250.0, 250.0)
+        assert first.DTM == 2.0
+        assert gdf.LST.isna().sum() == 1
+        assert gdf.crs == "EPSG:25832"
+
+    def test_table_without_geometry(self, raster_stack):
+        table = stack_to_gdf(raster_stack, np.ones((3, 4), dtype=bool))
+
+        assert "geometry" not in table
+        assert table["pixel"].tolist() == list(range(1, 12))
+        assert table["DTM"].dtype == "float32"
+        assert table["row"].dtype == "int32"
+        assert table.attrs["crs"] == "EPSG:25832"
+
+    @pytest.mark.parametrize("nodata", [None, np.nan])
+    def test_stack_without_nodata_value(self, raster_stack, nodata):
+        array, meta = raster_stack
+        array[array == -9999] = np.nan
+        array[0, 1, 1] = np.inf
+        meta["nodata"] = nodata
+
+        table = stack_to_gdf((array, meta), np.ones((3, 4), dtype=bool))
+
+        assert table["pixel"].tolist() == list(range(1, 12))
+        assert np.isnan(table.loc[table["pixel"] == 5, "DTM"]).all()
+        assert table["LST"].isna().sum() == 1
+
+    def test_spatial_folds_column(self, raster_stack):
+        folds = {"block_size": 2, "n_folds": 2, "random_state": 0}
+
+        table = stack_to_gdf(raster_stack, np.ones((3, 4), dtype=bool), None, folds)
+
+        assert table["fold"].dtype == "int8"
+        assert set(table["fold"]) == {0, 1}
+        assert table.loc[table["row"] < 2].groupby("col")["fold"].nunique().max() == 1
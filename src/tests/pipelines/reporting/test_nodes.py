@@ -0,0 +1,23 @@
+import numpy as np
+
+from urban_climate.pipelines.reporting.nodes import plot_raster_stack
+from urban_climate.utils.raster.grid import RasterGrid
+
+
+class TestPlotRasterStack:
+    def test_one_panel_per_band(self, tmp_path):
+        grid = RasterGrid.from_bounds((0, 0, 300000, 200000), "EPSG:25832", 100)
+        array = np.random.default_rng(0).random((5,) + grid.shape, dtype="float32")
+        array[:, :10, :10] = -9999
+        meta = grid.to_meta(
+            {"count": 5, "nodata": -9999, "descriptions": list("ABCDE")}
+        )
+
+        fig = plot_raster_stack((array, meta), {"max_size": 500, "ncols": 3})
+        fig.savefig(tmp_path / "stack.png")
+
+        images = [ax.get_images()[0] for ax in fig.axes if ax.get_images()]
+        assert [image.axes.get_title() for image in images] == list("ABCDE")
+        assert images[0].get_array().shape == (334, 500)
+        assert images[0].get_array().mask[0, 0]
+        assert (tmp_path / "stack.png").stat().st_size > 0
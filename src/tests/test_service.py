@@ -0,0 +1,164 @@
+import asyncio
+import os
+
+import httpx
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from urban_climate.custom_datasets.linear_model_dataset import LinearModelDataSet
+from urban_climate.service import PredictionService, create_app, load_stack
+from urban_climate.utils.predictor import LinearPredictor
+
+NO_CANOPY = {"name": "no_canopy", "feature": "fractionCanopy", "set": 0}
+
+
+@pytest.fixture
+def service(tmp_path):
+    # 4 x 5 grid of 10 m pixels, origin (0, 40), with one nodata pixel
+    canopy = np.linspace(0, 1, 20, dtype="float32").reshape(4, 5)
+    dtm = np.full((4, 5), 10, dtype="float32")
+    dtm[0, 0] = -9999
+    stack_path = str(tmp_path / "stack.tif")
+    with rasterio.open(
+        stack_path,
+        "w",
+        driver="GTiff",
+        height=4,
+        width=5,
+        count=2,
+        dtype="float32",
+        crs="EPSG:25832",
+        transform=from_origin(0, 40, 10, 10),
+        nodata=-9999,
+    ) as dst:
+        dst.write(np.stack([dtm, canopy]))
+        dst.descriptions = ("DTM", "fractionCanopy")
+
+    model_path = str(tmp_path / "regressor.json")
+    LinearModelDataSet(model_path).save(
+        LinearPredictor(["fractionCanopy", "DTM"], [-10.0, 0.1], 30.0)
+    )
+    return PredictionService.from_files(
+        model_path, stack_path, cache_size=2, cache_dir=str(tmp_path / "cache")
+    )
+
+
+def test_load_stack_is_memory_mapped(service, tmp_path):
+    assert isinstance(service.array, np.memmap)
+    assert service.array.shape == (2, 4, 5)
+
+    # the cache is reused
+    array, metadata = load_stack(
+        str(tmp_path / "stack.tif"), cache_dir=str(tmp_path / "cache")
+    )
+    assert array.filename == service.array.filename
+    assert os.path.dirname(array.filename) == str(tmp_path / "cache")
+    assert metadata["descriptions"] == ("DTM", "fractionCanopy")
+
+
+def test_load_stack_cache_is_replaced_when_complete(service, tmp_path, monkeypatch):
+    stack_path, cache_dir = tmp_path / "stack.tif", tmp_path / "cache"
+    cache_path = service.array.filename
+    with rasterio.open(stack_path, "r+") as dst:
+        dst.write(np.zeros((4, 5), dtype="float32"), 1)
+    # the source changed, although the cache looks newer
+    os.utime(cache_path, ns=(2 * 10**18, 2 * 10**18))
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("interrupted")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(rasterio.io.DatasetReader, "read", fail)
+        with pytest.raises(RuntimeError, match="interrupted"):
+            load_stack(str(stack_path), cache_dir=str(cache_dir))
+    assert [p.name for p in cache_dir.iterdir()] == [os.path.basename(cache_path)]
+
+    array, _ = load_stack(str(stack_path), cache_dir=str(cache_dir))
+    assert (array[0] == 0).all()
+    np.testing.assert_array_equal(array[1], service.array[1])
+
+
+def test_query_bbox_and_polygon(service):
+    canopy = np.asarray(service.array[1])
+
+    result = service.query(bbox=(0, 20, 20, 40), scenarios=[NO_CANOPY], values=True)
+
+    # top left 2 x 2 pixels, without the nodata pixel
+    assert result["pixels"] == 3
+    assert result["values"]["row"] == [0, 1, 1]
+    assert result["values"]["col"] == [1, 0, 1]
+    expected = 31 - 10 * canopy[[0, 1, 1], [1, 0, 1]]
+    np.testing.assert_allclose(result["values"]["baseline"], expected, rtol=1e-6)
+    np.testing.assert_allclose(result["values"]["no_canopy"], 31)
+    delta = result["scenarios"]["no_canopy"]["delta"]
+    assert delta["min"] == pytest.approx((31 - expected).min())
+
+    # triangle covering the centres of the first 2 pixels of the bottom row
+    triangle = {"type": "Polygon", "coordinates": [[(0, 0), (50, 0), (0, 8), (0, 0)]]}
+    result = service.query(polygon=triangle, values=True)
+    assert result["values"]["row"] == [3, 3]
+    assert result["values"]["col"] == [0, 1]
+    assert service.query(bbox=(100, 100, 200, 200))["baseline"]["mean"] is None
+
+
+def test_query_cache(service, monkeypatch):
+    calls = []
+    predict = service._predict
+    monkeypatch.setattr(service, "_predict", lambda *a: calls.append(a) or predict(*a))
+
+    first = service.query(scenarios=[NO_CANOPY])
+    first["scenarios"]["no_canopy"]["mean"] = 0
+    cached = service.query(scenarios=[NO_CANOPY])
+
+    assert len(calls) == 1
+    assert cached["scenarios"]["no_canopy"]["mean"] == pytest.approx(31)
+    assert cached["pixels"] == 19
+
+    # least recently used results are evicted
+    service.query(bbox=(0, 0, 10, 10))
+    service.query(bbox=(0, 0, 20, 10))
+    assert len(service._cache) == 2
+    service.query(scenarios=[NO_CANOPY])
+    assert len(calls) == 4
+
+
+def request(app, method, url, **kwargs):
+    """Sends one request to the app, as a local client would."""
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://local") as c:
+            return await c.request(method, url, **kwargs)
+
+    return asyncio.run(send())
+
+
+def test_app(service):
+    app = create_app(service)
+
+    health = request(app, "GET", "/health").json()
+    assert health["features"] == ["fractionCanopy", "DTM"]
+
+    response = request(
+        app,
+        "POST",
+        "/predict",
+        json={
+            "queries": [
+                {"bbox": [0, 0, 50, 40], "scenarios": [NO_CANOPY]},
+                {"scenarios": [NO_CANOPY]},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0] == results[1]
+    assert results[0]["scenarios"]["no_canopy"]["mean"] == pytest.approx(31)
+
+    bad = {**NO_CANOPY, "feature": "LST"}
+    response = request(
+        app, "POST", "/predict", json={"queries": [{"scenarios": [bad]}]}
+    )
+    assert response.status_code == 422
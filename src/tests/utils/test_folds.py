@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from urban_climate.utils.folds import spatial_folds
+
+
+class TestSpatialFolds:
+    def test_spatial_folds_by_block(self):
+        row, col = np.divmod(np.arange(100), 10)
+
+        fold = spatial_folds(row, col, block_size=5, n_folds=4, random_state=1)
+
+        assert sorted(np.unique(fold)) == [0, 1, 2, 3]
+        blocks = fold.reshape(2, 5, 2, 5)
+        assert (blocks == blocks[:, :1, :, :1]).all()
+        with pytest.raises(ValueError, match="cannot be split"):
+            spatial_folds(row, col, block_size=10, n_folds=2)
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import mean_squared_error, r2_score
+
+from urban_climate.custom_datasets.pixel_table_dataset import PixelTableDataSet
+from urban_climate.utils.linear import (
+    LinearStats,
+    stats_from_chunks,
+    stats_from_raster,
+    to_regressor,
+)
+from urban_climate.utils.raster.grid import RasterGrid
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.random((300, 3))
+    y = X @ [1.0, -2.0, 0.5] + 3 + rng.normal(0, 0.1, 300)
+    return X, y
+
+
+class TestLinearStats:
+    @pytest.mark.parametrize(
+        "alpha, model", [(0.0, LinearRegression()), (2.0, Ridge(alpha=2.0))]
+    )
+    def test_solve_from_merged_chunks(self, data, alpha, model):
+        X, y = data
+        stats = sum(LinearStats.from_arrays(X[i::3], y[i::3]) for i in range(3))
+
+        coef, intercept = stats.solve(alpha)
+
+        model.fit(X, y)
+        np.testing.assert_allclose(coef, model.coef_, rtol=1e-8)
+        assert intercept == pytest.approx(model.intercept_)
+
+    def test_score_held_out(self, data):
+        X, y = data
+        total = LinearStats.from_arrays(X, y)
+        test = LinearStats.from_arrays(X[:50], y[:50])
+
+        coef, intercept = (total - test).solve()
+        r2, rmse = test.score(coef, intercept)
+
+        model = LinearRegression().fit(X[50:], y[50:])
+        y_pred = model.predict(X[:50])
+        assert r2 == pytest.approx(r2_score(y[:50], y_pred))
+        assert rmse == pytest.approx(mean_squared_error(y[:50], y_pred) ** 0.5)
+
+    def test_skip_missing_and_subset(self, data):
+        X, y = data
+        X = X.copy()
+        X[0, 1] = np.nan
+
+        stats = LinearStats.from_arrays(X, y).subset([0, 2])
+
+        assert stats.n == 299 and stats.sxx.shape == (2, 2)
+        with pytest.raises(ValueError, match="No rows"):
+            LinearStats.zeros(2).solve()
+
+
+class TestStreamingTrainer:
+    @pytest.mark.parametrize("processes", [None, 2])
+    def test_regressor_from_row_groups(self, tmp_path, data, processes):
+        X, y = data
+        table = pd.DataFrame(X, columns=["a", "b", "c"]).assign(LST=y)
+        table.loc[7, "b"] = np.nan
+        filepath = str(tmp_path / "t.parquet")
+        PixelTableDataSet(filepath, save_args={"row_group_size": 64}).save(table)
+        chunks = PixelTableDataSet(filepath, load_args={"chunked": True}).load()
+
+        stats = stats_from_chunks(chunks, ["a", "b", "c"], processes=processes)
+        model = to_regressor(stats, ["a", "b", "c"])
+
+        expected = LinearRegression().fit(
+            table.drop(index=7)[["a", "b", "c"]], y[table.index != 7]
+        )
+        assert len(chunks) == 5 and stats.n == 299
+        np.testing.assert_allclose(model.coef_, expected.coef_, rtol=1e-8)
+        np.testing.assert_allclose(
+            model.predict(table[["a", "b", "c"]].fillna(0)),
+            expected.predict(table[["a", "b", "c"]].fillna(0)),
+        )
+
+    def test_stats_from_raster_strips(self, data):
+        X, y = data
+        grid = RasterGrid.from_bounds((0, 0, 1500, 2000), "EPSG:25832", 100)
+        array = np.vstack([X.T, y[np.newaxis]]).reshape(4, 20, 15).astype("float32")
+        array[3, 0, 0] = -9999
+        meta = grid.to_meta(
+            {
+                "count": 4,
+                "dtype": "float32",
+                "nodata": -9999,
+                "descriptions": ("a", "b", "c", "LST"),
+            }
+        )
+        valid = np.ones((20, 15), dtype=bool)
+        valid[-1] = False
+
+        stats = stats_from_raster(
+            (array, meta), ["a", "b", "c"], valid=valid, strip_rows=3
+        )
+
+        expected = LinearStats.from_arrays(X[1:-15], y[1:-15])
+        assert stats.n == 300 - 1 - 15
+        np.testing.assert_allclose(stats.sxx, expected.sxx, rtol=1e-5)
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import r2_score
+
+from urban_climate.utils.folds import spatial_folds
+from urban_climate.utils.model_selection import (
+    compare_models,
+    prepare_features,
+    spatial_cross_validate,
+)
+
+FEATURES = ["DTM", "fractionCanopy"]
+CANDIDATES = {
+    "linear": {"model": "sklearn.linear_model.LinearRegression"},
+    "ridge": {"model": "sklearn.linear_model.Ridge", "kwargs": {"alpha": 0.1}},
+    "canopy_only": {
+        "model": "sklearn.linear_model.LinearRegression",
+        "features": ["fractionCanopy"],
+    },
+}
+
+
+@pytest.fixture
+def pixel_table():
+    rng = np.random.default_rng(0)
+    table = pd.DataFrame(rng.random((200, 2)), columns=FEATURES)
+    table["LST"] = 20 + 2 * table["DTM"] - 5 * table["fractionCanopy"]
+    table["pixel"] = np.arange(200)
+    table["fold"] = spatial_folds(*np.divmod(np.arange(200), 20), 5, 4, 0)
+    table.loc[3, "DTM"] = np.nan
+    table.loc[5, "LST"] = np.nan
+    return table
+
+
+class TestModelSelection:
+    def test_prepare_features_memmap(self, pixel_table, tmp_path):
+        matrix, meta = prepare_features(
+            pixel_table, FEATURES, out_path=tmp_path / "m.npy"
+        )
+
+        assert isinstance(matrix, np.memmap)
+        assert matrix.shape == (198, 3) and matrix.dtype == np.float32
+        assert meta["features"] == FEATURES and meta["target"] == "LST"
+        assert 3 not in meta["pixel"] and 5 not in meta["pixel"]
+
+    @pytest.mark.parametrize("processes", [None, 2])
+    def test_compare_models(self, pixel_table, processes):
+        model_matrix = prepare_features(pixel_table, FEATURES)
+
+        scores, models = compare_models(
+            model_matrix, CANDIDATES, random_state=0, processes=processes
+        )
+
+        assert list(scores.index) == list(CANDIDATES)
+        assert scores.loc["linear", "r2"] == pytest.approx(1, abs=1e-4)
+        assert scores.loc["canopy_only", "r2"] < scores.loc["linear", "r2"]
+        assert (scores["test_rows"] == 40).all()
+        assert list(models["canopy_only"].feature_names_in_) == ["fractionCanopy"]
+
+    def test_unknown_features(self, pixel_table):
+        candidates = {"a": {"model": "sklearn.linear_model.Ridge", "features": ["x"]}}
+        with pytest.raises(ValueError, match="unknown features"):
+            compare_models(prepare_features(pixel_table, FEATURES), candidates)
+
+    @pytest.mark.parametrize("processes", [None, 2])
+    def test_spatial_cross_validate(self, pixel_table, processes):
+        candidates = dict(CANDIDATES)
+        candidates["tree"] = {
+            "model": "sklearn.tree.DecisionTreeRegressor",
+            "kwargs": {"max_depth": 3},
+        }
+        model_matrix = prepare_features(pixel_table, FEATURES)
+
+        scores = spatial_cross_validate(model_matrix, candidates, processes)
+
+        assert scores.index.names == ["candidate", "fold"]
+        assert len(scores) == 4 * 4
+        assert (scores["train_rows"] + scores["test_rows"] == 198).all()
+
+        # linear folds from sufficient statistics match a refit
+        matrix, meta = model_matrix
+        test = meta["fold"] == 2
+        X, y = matrix[:, [1]], matrix[:, -1]
+        model = LinearRegression().fit(X[~test], y[~test])
+        expected = r2_score(y[test], model.predict(X[test]))
+        assert scores.loc[("canopy_only", 2), "r2"] == pytest.approx(expected, rel=1e-4)
+
+    def test_cross_validate_needs_folds(self, pixel_table):
+        model_matrix = prepare_features(pixel_table.drop(columns="fold"), FEATURES)
+        with pytest.raises(ValueError, match="no spatial folds"):
+            spatial_cross_validate(model_matrix, CANDIDATES)
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from urban_climate.utils.predictor import LinearPredictor
+
+
+@pytest.fixture
+def regressor():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((100, 3)), columns=["a", "b", "c"])
+    return LinearRegression().fit(X, X @ [1, 2, 3] + 4), X
+
+
+class TestLinearPredictor:
+    def test_matches_sklearn(self, regressor):
+        model, X = regressor
+        predictor = LinearPredictor.from_model(model, {"train_rows": 100})
+
+        y = predictor.predict(X.to_numpy(dtype="float32"), batch_size=7)
+
+        np.testing.assert_allclose(y, model.predict(X), rtol=1e-6)
+        np.testing.assert_allclose(predictor.predict(X[["c", "a", "b"]]), y)
+        assert predictor.metadata["model"].endswith("LinearRegression")
+
+    def test_round_trip_and_validation(self, regressor):
+        predictor = LinearPredictor.from_model(regressor[0])
+
+        copy = LinearPredictor.from_dict(predictor.to_dict())
+
+        np.testing.assert_array_equal(copy.coef, predictor.coef)
+        with pytest.raises(ValueError, match="Expected"):
+            predictor.predict(np.ones((2, 2)))
+        with pytest.raises(ValueError, match="without feature names"):
+            LinearPredictor.from_model(LinearRegression().fit([[0], [1]], [0, 1]))
+
+    def test_import_without_sklearn(self):
+        code = (
+            "import sys, urban_climate.utils.predictor; "
+            "assert 'sklearn' not in sys.modules"
+        )
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+        subprocess.run([sys.executable, "-c", code], check=True, env=env)
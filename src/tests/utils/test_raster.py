@@ -0,0 +1,435 @@
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+from scipy.ndimage import zoom
+
+from urban_climate.utils.raster.aggregate import aggregate_to_grid
+from urban_climate.utils.raster.fill import fill_nodata
+from urban_climate.utils.raster.grid import RasterGrid
+from urban_climate.utils.raster.mask import apply_mask, rasterize_mask
+from urban_climate.utils.raster.predict import predict_raster_scenarios
+from urban_climate.utils.raster.reproject import reproject_raster, reproject_tiled
+from urban_climate.utils.raster.resample import resample_raster
+from urban_climate.utils.raster.stack import stack_rasters
+
+
+def _raster(grid, count=2, dtype="float32"):
+    data = np.arange(count * grid.height * grid.width, dtype=dtype).reshape(
+        count, grid.height, grid.width
+    )
+    meta = grid.to_meta(
+        {
+            "driver": "GTiff",
+            "dtype": dtype,
+            "nodata": -9999.0,
+            "count": count,
+            "descriptions": tuple(f"b{i}" for i in range(count)),
+        }
+    )
+    return data, meta
+
+
+class TestRasterGrid:
+    def test_from_bounds_snaps_to_resolution(self):
+        grid = RasterGrid.from_bounds(
+            (438250.0, 6443610.0, 451120.0, 6450333.0), "EPSG:25832", 100
+        )
+
+        assert grid.transform == Affine(100, 0, 438200, 0, -100, 6450400)
+        assert grid.shape == (68, 130)
+        assert grid.bounds == (438200.0, 6443600.0, 451200.0, 6450400.0)
+
+    def test_window_of_aligned_and_unaligned_rasters(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 1000), "EPSG:25832", 100)
+        aligned = RasterGrid.from_bounds((200, 100, 1500, 700), "EPSG:25832", 100)
+        _, meta = _raster(aligned)
+
+        window = grid.window(meta)
+        assert (window.col_off, window.row_off) == (2, 3)
+        assert (window.width, window.height) == (13, 6)
+
+        meta["transform"] = meta["transform"] * Affine.translation(0.5, 0)
+        assert grid.window(meta) is None
+
+
+class TestReprojectRaster:
+    def test_aligned_raster_is_cropped_and_padded(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 1000), "EPSG:25832", 100)
+        other = RasterGrid.from_bounds((500, -300, 1500, 500), "EPSG:25832", 100)
+        data, meta = _raster(other)
+
+        out, out_meta = reproject_raster((data, meta), grid=grid)
+
+        assert out.shape == (2, 10, 10)
+        assert out_meta["transform"] == grid.transform
+        np.testing.assert_array_equal(out[:, 5:, 5:], data[:, :5, :5])
+        assert (out[:, :5, :] == -9999.0).all()
+
+        meta["nodata"] = None
+        out, out_meta = reproject_raster((data, meta), grid=grid)
+        assert np.isnan(out_meta["nodata"]) and np.isnan(out[:, :5, :]).all()
+
+    def test_raster_on_grid_is_not_copied(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 1000), "EPSG:25832", 100)
+        data, meta = _raster(grid)
+
+        out, _ = reproject_raster((data, meta), grid=grid)
+
+        assert out is data
+
+    def test_warp_onto_grid(self):
+        src_grid = RasterGrid.from_bounds((7.9, 58.1, 8.1, 58.2), "EPSG:4326", 0.001)
+        data, meta = _raster(src_grid, count=3)
+        grid = RasterGrid.from_bounds(
+            (440000, 6440000, 450000, 6450000), "EPSG:25832", 100
+        )
+
+        out, out_meta = reproject_raster((data, meta), grid=grid, num_threads=2)
+
+        assert out.shape == (3, 100, 100)
+        assert out_meta["crs"] == "EPSG:25832"
+        assert (out_meta["width"], out_meta["height"]) == (100, 100)
+
+
+class TestReprojectTiled:
+    @pytest.mark.parametrize("processes", [None, 2])
+    def test_matches_in_memory_reprojection(self, geotiff_path, tmp_path, processes):
+        grid = RasterGrid.from_bounds(
+            (440000, 6448000, 443000, 6451000), "EPSG:25832", 50
+        )
+        with rasterio.open(geotiff_path) as src:
+            raster = src.read(), {**src.meta, "descriptions": src.descriptions}
+        expected, _ = reproject_raster(raster, grid=grid)
+
+        dst_path = tmp_path / "tiled.tif"
+        meta = reproject_tiled(
+            geotiff_path, dst_path, grid, tile_size=16, processes=processes
+        )
+
+        with rasterio.open(dst_path) as dst:
+            assert dst.block_shapes[0] == (16, 16)
+            assert dst.descriptions == ("DTM", "fractionBuilt", "LST")
+            # GDAL's approximate transformer may break nearest ties differently
+            assert np.mean(dst.read() == expected) > 0.99
+        assert meta["transform"] == grid.transform
+
+    def test_uncovered_pixels_are_nodata(self, geotiff_path, tmp_path):
+        with rasterio.open(geotiff_path, "r+") as src:
+            src.nodata = None
+        # the source covers about 440000-443000 E, the grid extends further
+        grid = RasterGrid.from_bounds(
+            (438000, 6448000, 443000, 6451000), "EPSG:25832", 100
+        )
+
+        meta = reproject_tiled(geotiff_path, tmp_path / "out.tif", grid, tile_size=16)
+
+        with rasterio.open(tmp_path / "out.tif") as dst:
+            data = dst.read()
+            assert np.isnan(dst.nodata)
+        assert np.isnan(meta["nodata"])
+        assert np.isnan(data[:, :, 0]).all() and not np.isnan(data[:, :, -1]).any()
+
+    def test_tile_size_must_be_multiple_of_16(self, geotiff_path, tmp_path):
+        grid = RasterGrid.from_bounds((0, 0, 100, 100), "EPSG:25832", 10)
+        with pytest.raises(ValueError, match="multiple of 16"):
+            reproject_tiled(geotiff_path, tmp_path / "out.tif", grid, tile_size=10)
+
+
+class TestResampleRaster:
+    @pytest.mark.parametrize("order", [0, 1, 3])
+    def test_blocks_match_zoom(self, order):
+        grid = RasterGrid.from_bounds((0, 0, 2300, 1700), "EPSG:25832", 100)
+        data, meta = _raster(grid, count=2, dtype="float64")
+        data = np.sin(data / 7.0)
+        expected = zoom(data, (1, 5, 5), order=order, mode="nearest")
+
+        out, out_meta = resample_raster((data, meta), 5, order=order, block_size=16)
+
+        assert out.shape == expected.shape == (2, 85, 115)
+        np.testing.assert_allclose(out, expected, atol=1e-6 if order < 3 else 1e-3)
+        assert out_meta["transform"].a == pytest.approx(20)
+        assert (out_meta["width"], out_meta["height"]) == (115, 85)
+
+    def test_memmap_output_in_process_pool(self, tmp_path):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 800), "EPSG:25832", 100)
+        data, meta = _raster(grid)
+        original = meta.copy()
+
+        out, out_meta = resample_raster(
+            (data, meta), 4, block_size=16, processes=2, out_path=tmp_path / "r.npy"
+        )
+
+        assert isinstance(out, np.memmap)
+        np.testing.assert_allclose(
+            np.load(tmp_path / "r.npy"), zoom(data, (1, 4, 4), order=1, mode="nearest")
+        )
+        assert meta == original
+        assert out_meta is not meta
+
+
+class TestAggregateToGrid:
+    def _canopy(self, grid, factor):
+        rng = np.random.default_rng(0)
+        fine = RasterGrid(
+            grid.crs,
+            grid.resolution / factor,
+            grid.xmin,
+            grid.ymax,
+            grid.width * factor,
+            grid.height * factor,
+        )
+        data = (rng.random((1,) + fine.shape) < 0.3).astype("uint8")
+        data[0, :2, :3] = 255
+        return data, fine.to_meta(
+            {"count": 1, "dtype": "uint8", "nodata": 255, "descriptions": ("canopy",)}
+        )
+
+    @pytest.mark.parametrize("statistic", ["sum", "mean"])
+    def test_statistics(self, statistic):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 700), "EPSG:25832", 100)
+        data, meta = self._canopy(grid, factor=50)
+        blocks = np.where(data == 255, np.nan, data[0]).reshape(7, 50, 10, 50)
+
+        out, out_meta = aggregate_to_grid((data, meta), grid, statistic, strip_rows=3)
+
+        # the 6 nodata pixels of the first cell are not counted as covered
+        expected = {
+            "sum": np.nanmean(blocks, axis=(1, 3)) * 10000,
+            "mean": np.nanmean(blocks, axis=(1, 3)),
+        }[statistic]
+        np.testing.assert_allclose(out[0], expected, rtol=1e-6)
+        assert out_meta["transform"] == grid.transform
+        assert out_meta["descriptions"] == ("canopy",)
+
+    def test_cells_outside_the_raster_are_nodata(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 700), "EPSG:25832", 100)
+        data, meta = self._canopy(grid, factor=5)
+        larger = RasterGrid.from_bounds((-200, 0, 1000, 900), "EPSG:25832", 100)
+
+        out, _ = aggregate_to_grid((data, meta), larger, description="fractionCanopy")
+
+        assert out.shape == (1, 9, 12)
+        assert (out[0, :2] == -9999).all() and (out[0, :, :2] == -9999).all()
+        assert (out[0, 2:, 2:] >= 0).all()
+
+    def test_edge_cells(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 700), "EPSG:25832", 100)
+        data, meta = self._canopy(grid, factor=4)
+        # full canopy, covering a quarter of the first row of cells and half
+        # of the last column
+        data = np.ones((1, 25, 38), dtype="uint8")
+        meta.update(
+            height=25,
+            width=38,
+            transform=meta["transform"] * Affine.translation(0, 3),
+        )
+
+        out, _ = aggregate_to_grid((data, meta), grid, "mean")
+        total, _ = aggregate_to_grid((data, meta), grid, "sum")
+
+        assert (out[0, 0] == -9999).all()
+        np.testing.assert_allclose(out[0, 1:], 1)
+        np.testing.assert_allclose(total[0, 1:], 10000)
+
+        out, _ = aggregate_to_grid((data, meta), grid, min_coverage=0.25)
+        np.testing.assert_allclose(out[0, 0, :-1], 1)
+        assert out[0, 0, -1] == -9999
+        with pytest.raises(ValueError, match="min_coverage"):
+            aggregate_to_grid((data, meta), grid, min_coverage=0)
+
+    def test_unknown_statistic(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 700), "EPSG:25832", 100)
+        with pytest.raises(ValueError, match="Unknown statistic"):
+            aggregate_to_grid(self._canopy(grid, factor=5), grid, "fraction")
+
+    def test_unaligned_raster(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 700), "EPSG:25832", 100)
+        data, meta = self._canopy(grid, factor=5)
+        meta["transform"] = meta["transform"] * Affine.translation(0.5, 0)
+
+        with pytest.raises(ValueError, match="not aligned"):
+            aggregate_to_grid((data, meta), grid)
+
+
+class TestStudyAreaMask:
+    def test_rasterize_and_apply_mask(self):
+        grid = RasterGrid.from_bounds((0, 0, 1000, 800), "EPSG:25832", 100)
+        triangle = {
+            "type": "Polygon",
+            "coordinates": [[(0, 0), (1000, 0), (0, 800), (0, 0)]],
+        }
+        data, meta = _raster(grid)
+
+        inside = rasterize_mask([triangle], grid)
+        out, _ = apply_mask((data, meta), inside)
+
+        assert inside.shape == grid.shape and not inside.flags.writeable
+        assert inside[-1, 0] and not inside[0, -1]
+        assert out is data
+        assert (out[:, ~inside] == -9999).all()
+        assert (out[:, inside] != -9999).all()
+
+    def test_apply_mask_to_masked_array(self):
+        grid = RasterGrid.from_bounds((0, 0, 300, 300), "EPSG:25832", 100)
+        data, meta = _raster(grid)
+        inside = np.eye(3, dtype=bool)
+
+        out, _ = apply_mask((np.ma.MaskedArray(data), meta), inside)
+
+        np.testing.assert_array_equal(out.mask[0], ~inside)
+
+    def test_raster_without_nodata(self):
+        grid = RasterGrid.from_bounds((0, 0, 300, 300), "EPSG:25832", 100)
+        inside = np.eye(3, dtype=bool)
+        data, meta = _raster(grid)
+        meta["nodata"] = None
+
+        out, out_meta = apply_mask((data, meta), inside)
+
+        assert np.isnan(out_meta["nodata"]) and meta["nodata"] is None
+        assert np.isnan(out[:, ~inside]).all() and not np.isnan(out[:, inside]).any()
+
+        data, meta = _raster(grid, dtype="uint8")
+        meta["nodata"] = None
+        out, out_meta = apply_mask((data, meta), inside)
+        assert out_meta["nodata"] is None
+        np.testing.assert_array_equal(out.mask[1], ~inside)
+
+    def test_shape_mismatch(self):
+        grid = RasterGrid.from_bounds((0, 0, 300, 300), "EPSG:25832", 100)
+        with pytest.raises(ValueError, match="Mask shape"):
+            apply_mask(_raster(grid), np.ones((2, 2), dtype=bool))
+
+
+class TestStackRasters:
+    def test_stack_into_memmap(self, tmp_path):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        first, second = _raster(grid, count=2), _raster(grid, count=1, dtype="int16")
+        second[1]["nodata"] = -1
+        second[1]["descriptions"] = (None,)
+        second[0][0, 0, 0] = -1
+
+        stack, meta = stack_rasters([first, second], out_path=tmp_path / "s.npy")
+
+        assert isinstance(stack, np.memmap) and stack.shape == (3, 3, 4)
+        assert meta["dtype"] == "float32" and meta["count"] == 3
+        assert meta["descriptions"] == ["b0", "b1", "band_3"]
+        np.testing.assert_array_equal(stack[:2], first[0])
+        assert stack[2, 0, 0] == -9999
+        assert "count" in first[1] and first[1]["count"] == 2
+
+    def test_first_raster_without_nodata(self):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        first, second = _raster(grid, count=1), _raster(grid, count=1)
+        first[1]["nodata"] = None
+        first = (np.ma.masked_equal(first[0], 5), first[1])
+        second[0][0, 0, 0] = -9999
+        second[0][0, 0, 1] = np.nan
+
+        stack, meta = stack_rasters([first, second])
+
+        assert meta["nodata"] == -9999
+        assert stack[0].flat[5] == -9999
+        assert (stack[1, 0, :2] == -9999).all()
+        assert (stack[:, 2:] != -9999).all()
+
+        stack, meta = stack_rasters([first, second], nodata=-1)
+        assert meta["nodata"] == -1 and (stack[1, 0, :2] == -1).all()
+        with pytest.raises(ValueError, match="does not fit"):
+            stack_rasters([first, second], nodata=0.5, dtype="int16")
+
+    def test_nan_nodata(self):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        first, second = _raster(grid, count=1), _raster(grid, count=1)
+        first[1]["nodata"] = np.nan
+        first[0][0, 0, 0] = np.nan
+        second[0][0, 0, 1] = -9999
+
+        stack, meta = stack_rasters([first, second])
+
+        assert np.isnan(meta["nodata"])
+        assert np.isnan(stack[0, 0, 0]) and np.isnan(stack[1, 0, 1])
+        assert np.isnan(stack).sum() == 2
+        with pytest.raises(ValueError, match="does not fit"):
+            stack_rasters([first, second], dtype="int16")
+
+    def test_grids_must_match(self):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        other = RasterGrid.from_bounds((0, 0, 500, 300), "EPSG:25832", 100)
+        with pytest.raises(ValueError, match="same shape"):
+            stack_rasters([_raster(grid), _raster(other)])
+
+
+class _SumModel:
+    def predict(self, X):
+        return X.sum(axis=1).to_numpy()
+
+
+class TestPredictRaster:
+    def test_predict_in_batches(self):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        data, meta = _raster(grid, count=3)
+        data[1, 0, 0] = -9999
+
+        out = predict_raster_scenarios(
+            (data, meta), _SumModel(), ["b1", "b0"], [], batch_size=5
+        )
+
+        assert out.shape == (1, 3, 4) and out.dtype == np.float32
+        assert out[0, 0, 0] == -9999
+        np.testing.assert_array_equal(out[0].flat[1:], (data[0] + data[1]).flat[1:])
+
+    def test_scenarios(self):
+        grid = RasterGrid.from_bounds((0, 0, 400, 300), "EPSG:25832", 100)
+        data, meta = _raster(grid)
+        data[1, 0, 0] = -9999
+        scenarios = [{"name": "zero", "feature": "b1", "set": 0}]
+
+        out = predict_raster_scenarios(
+            (data, meta), _SumModel(), ["b0", "b1"], scenarios, batch_size=5
+        )
+
+        assert out.shape == (2, 3, 4)
+        assert (out[:, 0, 0] == -9999).all()
+        np.testing.assert_array_equal(out[0].flat[1:], data.sum(axis=0).flat[1:])
+        np.testing.assert_array_equal(out[1].flat[1:], data[0].flat[1:])
+
+
+class TestFillNodata:
+    def _gappy(self):
+        grid = RasterGrid.from_bounds((0, 0, 700, 700), "EPSG:25832", 100)
+        data, meta = _raster(grid)
+        data[:] = 5.0
+        data[0, 3, 3] = 1.0
+        data[:, 2:5, 2:5] = -9999
+        data[0, 3, 3] = -9999
+        data[:, :, 6] = np.nan
+        return data, meta
+
+    @pytest.mark.parametrize("method", ["nearest", "idw"])
+    def test_fill_within_radius(self, method):
+        data, meta = self._gappy()
+
+        out, _ = fill_nodata((data, meta), bands=["b0"], method=method, radius=1)
+
+        assert not np.isnan(out[0]).any()
+        np.testing.assert_allclose(out[0, 2:5, 2:5][[0, 0, 2], [0, 2, 2]], 5)
+        assert out[0, 3, 3] == -9999
+        assert (out[1, 2:5, 2:5] == -9999).all()
+
+    def test_fill_only_valid(self):
+        data, meta = self._gappy()
+        valid = np.zeros(data.shape[1:], dtype=bool)
+        valid[:, :3] = True
+
+        out, _ = fill_nodata((data, meta), method="idw", radius=3, valid=valid)
+
+        assert (out[:, 2:5, 2] == 5).all()
+        assert (out[:, 2:5, 3:5] == -9999).all()
+        assert np.isnan(out[:, :, 6]).all()
+
+    def test_invalid_method(self):
+        grid = RasterGrid.from_bounds((0, 0, 300, 300), "EPSG:25832", 100)
+        with pytest.raises(ValueError, match="Unknown method"):
+            fill_nodata(_raster(grid), method="kriging")
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from urban_climate.utils.scenarios import (
+    apply_scenarios,
+    check_scenarios,
+    predict_scenarios,
+)
+
+FEATURES = ["DTM", "fractionCanopy"]
+SCENARIOS = [
+    {"name": "no_canopy", "feature": "fractionCanopy", "set": 0},
+    {"name": "plus_10", "feature": "fractionCanopy", "add": 0.1, "clip": [0, 1]},
+    {"name": "max_50", "feature": "fractionCanopy", "clip": [None, 0.5]},
+]
+
+
+class TestScenarios:
+    def test_apply_scenarios(self):
+        X = np.array([[10, 0.2], [20, 0.95]], dtype="float32")
+
+        out = apply_scenarios(X, FEATURES, SCENARIOS)
+
+        assert out.shape == (3, 2, 2)
+        np.testing.assert_allclose(out[:, :, 1], [[0, 0], [0.3, 1], [0.2, 0.5]])
+        np.testing.assert_array_equal(out[:, :, 0], [[10, 20]] * 3)
+        assert X[1, 1] == np.float32(0.95)
+
+    def test_predict_scenarios_in_one_pass(self):
+        rng = np.random.default_rng(0)
+        X = rng.random((50, 2)).astype("float32")
+        model = LinearRegression().fit(pd.DataFrame(X, columns=FEATURES), X @ [1, -3])
+
+        y = predict_scenarios(model, X, FEATURES, SCENARIOS)
+
+        assert y.shape == (4, 50)
+        np.testing.assert_allclose(y[0], X @ [1, -3], atol=1e-5)
+        np.testing.assert_allclose(y[1] - y[0], 3 * X[:, 1], atol=1e-5)
+
+    @pytest.mark.parametrize(
+        "scenario, match",
+        [
+            ({"feature": "fractionCanopy", "set": 0}, "unique name"),
+            ({"name": "a", "feature": "LST", "set": 0}, "not one of"),
+            ({"name": "a", "feature": "DTM", "shift": 1}, "unknown keys"),
+            ({"name": "a", "feature": "DTM"}, "no transform"),
+        ],
+    )
+    def test_invalid_scenarios(self, scenario, match):
+        with pytest.raises(ValueError, match=match):
+            check_scenarios([scenario], FEATURES)
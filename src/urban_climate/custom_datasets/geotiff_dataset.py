@@ -1,17 +1,34 @@
 import logging
 import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from copy import deepcopy
+from functools import partial
 from pathlib import Path, PurePosixPath
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterator, Tuple
 
 import fsspec
 
 # import geopandas as gpd
 import numpy as np
 import rasterio
-import rasterio.mask
+import rasterio.shutil
 from kedro.io import AbstractDataset
 from kedro.io.core import get_filepath_str, get_protocol_and_path
+from rasterio.coords import BoundingBox
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling, transform_bounds
+from rasterio.windows import Window, bounds
+
+from urban_climate.utils.raster.grid import RasterGrid
+from urban_climate.utils.raster.lazy import LazyRaster
+from urban_climate.utils.raster.mask import mask_cache
+from urban_climate.utils.raster.windows import (
+    RasterBlockReader,
+    read_window,
+    resolve_bands,
+)
 
 logger = logging.getLogger(__name__)
 # Add project root to path
@@ -26,16 +43,96 @@ class GeoTIFFDataSet(AbstractDataset[np.ndarray, np.ndarray]):
     ::
 
         >>> ImageDataSet(filepath='/img/file/path.tif')
-    """
 
-    DEFAULT_LOAD_ARGS: Dict[str, Any] = {"mask": False}
+    Large rasters can be streamed tile by tile with ``mode: blocks``, which
+    returns a ``RasterBlockReader`` yielding ``(window, array, transform)``:
+    ::
+
+        >>> GeoTIFFDataSet(
+        ...     filepath='/img/file/path.tif',
+        ...     load_args={'mode': 'blocks', 'tile_shape': [1024, 1024]},
+        ... )
+
+    With ``mode: header`` only the header is read, and a ``LazyRaster`` handle
+    reads the pixels on first access, e.g. for CRS or shape checks:
+    ::
+
+        >>> raster = GeoTIFFDataSet(
+        ...     filepath='/img/file/path.tif', load_args={'mode': 'header'}
+        ... ).load()
+        >>> raster.crs, raster.shape
+
+    With ``warp``, the raster is reprojected while it is read and cropped
+    to the mask in the target CRS, without intermediate arrays or files:
+    ::
+
+        >>> GeoTIFFDataSet(
+        ...     filepath='/img/file/path.tif',
+        ...     load_args={
+        ...         'mask': True,
+        ...         'mask_path': 'data/01_raw/study_area.geojson',
+        ...         'warp': {'crs': 'EPSG:25832', 'resolution': 100},
+        ...     },
+        ... )
+
+    Bands can be selected by index or description and cast while reading:
+    ::
+
+        >>> GeoTIFFDataSet(
+        ...     filepath='/img/file/path.tif',
+        ...     load_args={'bands': ['DTM', 'LST'], 'dtype': 'float32'},
+        ... )
+
+    With ``profile: cog`` the data is saved as a Cloud-Optimized GeoTIFF
+    (internally tiled, compressed, with overviews):
+    ::
+
+        >>> GeoTIFFDataSet(
+        ...     filepath='/img/file/path.tif',
+        ...     save_args={'profile': 'cog', 'compress': 'zstd'},
+        ... )
+    """
 
-    def __init__(self, filepath: str, load_args: Dict[str, Any] = None) -> None:
+    DEFAULT_LOAD_ARGS: Dict[str, Any] = {"mask": False, "mode": "array"}
+    DEFAULT_SAVE_ARGS: Dict[str, Any] = {
+        "profile": "gtiff",
+        "compress": "deflate",
+        "blocksize": 512,
+        "overviews": True,
+        "num_threads": None,
+    }
+    LOAD_MODES = ("array", "blocks", "header")
+    SAVE_PROFILES = ("gtiff", "cog")
+
+    def __init__(
+        self,
+        filepath: str,
+        load_args: Dict[str, Any] = None,
+        save_args: Dict[str, Any] = None,
+    ) -> None:
         """Creates a new instance of ImageDataSet to load / save image data
         for given filepath.
 
         Args:
             filepath: The location of the image file to load / save data.
+            load_args: Options for loading. ``mask`` and ``mask_path`` crop
+                and mask the raster to the geometries of a vector file,
+                ``mode`` is ``array`` (default), ``blocks`` or ``header``, and
+                ``tile_shape`` sets the minimum tile shape in ``blocks`` mode.
+                In every mode, ``bands`` selects bands by 1-based index or
+                description, ``dtype`` casts while reading and ``masked``
+                returns a ``np.ma.MaskedArray`` instead of filling nodata.
+                ``warp`` reads through a warped virtual raster in
+                ``warp["crs"]`` (with optional ``resolution``, ``resampling``,
+                ``warp_mem_limit`` and ``num_threads``), masked in that CRS.
+                With a ``resolution`` the raster is warped onto the snapped
+                ``RasterGrid`` around the mask.
+            save_args: Options for saving. ``profile`` is ``gtiff`` (write
+                ``meta`` as is, default) or ``cog``. The ``cog`` profile uses
+                ``compress`` (deflate, zstd, lzw, ...), ``level``,
+                ``blocksize``, ``overviews`` (bool), ``overview_resampling``
+                and ``num_threads`` (e.g. ``ALL_CPUS``) for GDAL's
+                multi-threaded compression.
         """
         protocol, path = get_protocol_and_path(filepath)
         self._protocol = protocol
@@ -48,6 +145,21 @@ class GeoTIFFDataSet(AbstractDataset[np.ndarray, np.ndarray]):
         if load_args is not None:
             self._load_args.update(load_args)
 
+        self._save_args = deepcopy(self.DEFAULT_SAVE_ARGS)
+        if save_args is not None:
+            self._save_args.update(save_args)
+
+        if self._save_args["profile"] not in self.SAVE_PROFILES:
+            raise ValueError(
+                f"Unknown save profile '{self._save_args['profile']}', "
+                f"expected one of {self.SAVE_PROFILES}."
+            )
+        if self._load_args["mode"] not in self.LOAD_MODES:
+            raise ValueError(
+                f"Unknown load mode '{self._load_args['mode']}', "
+                f"expected one of {self.LOAD_MODES}."
+            )
+
     def exists(self) -> bool:
         """Checks if the data at the given filepath exists.
 
@@ -64,65 +176,192 @@ class GeoTIFFDataSet(AbstractDataset[np.ndarray, np.ndarray]):
             Data from the image file as a numpy array
         """
         load_path = get_filepath_str(self._filepath, self._protocol)
+        if self._load_args["mode"] == "blocks":
+            return self._load_blocks(load_path)
+        if self._load_args["mode"] == "header":
+            return self._load_header(load_path)
+
+        load_args = self._load_args
+        logger.info(load_args)
+        if load_args["mask"]:
+            logger.info("Loading data with mask...")
+            with self._open(load_path) as src:
+                # crop window and mask are cached per mask file and grid
+                mask = mask_cache.window(self._mask_path(), src, self._mask_crs())
+                read_args = self._read_args(src)
+                data = read_window(src, mask.window, mask.outside, **read_args)
+
+                out_meta = self._read_meta(src, mask.window, read_args)
+
+        else:
+            logger.info("Loading data without mask...")
+            with self._open(load_path) as src:
+                # load data
+                read_args = self._read_args(src)
+                data = read_window(src, **read_args)
+
+                # copy metadata to dict
+                out_meta = self._read_meta(src, read_args=read_args)
+
+        logger.info(f"Number of bands: {out_meta['count']}")
+        logger.info(f"Band names: {out_meta['descriptions']}")
+        logger.info(f"CRS: {out_meta['crs']}")
+        logger.info(f"time: {out_meta['creation_time']}")
+        logger.info(f"Geotransform: {out_meta['transform']}")
+        logger.info(f"Bounds: {out_meta['bounds']}")
+
+        return data, out_meta
+
+    @contextmanager
+    def _open(self, load_path: str) -> Iterator[Any]:
+        """Opens the raster, as a warped virtual raster if ``warp`` is set.
+
+        Reads from a ``WarpedVRT`` are reprojected on the fly, window by
+        window, so masking and reprojection happen in a single pass.
+        """
         with self._fs.open(load_path, mode="rb") as f:
-            load_args = self._load_args
-            logger.info(load_args)
-
-            if load_args["mask"]:
-                logger.info("Loading data with mask...")
-                logger.info(project_root)
-                import fiona
-
-                path = os.path.join(project_root, load_args["mask_path"])
-                logger.info(path)
-
-                with fiona.open(path, "r") as shp:
-                    shapes = [feature["geometry"] for feature in shp]
-                logger.info(f"Shapes: {shapes}")
-
-                with rasterio.open(f) as src:
-                    data, out_transform = rasterio.mask.mask(src, shapes, crop=True)
-                    out_meta = src.meta.copy()
-
-                    out_meta.update(
-                        {
-                            "driver": "GTiff",
-                            "height": data.shape[1],
-                            "width": data.shape[2],
-                            "transform": out_transform,
-                        }
-                    )
-
-                    # add additional metadata
-                    out_meta["bounds"] = src.bounds
-                    out_meta["descriptions"] = src.descriptions
-                    out_meta["creation_time"] = src.profile.get("creation_time")
-
-                    # from urban_climate_services.utils.raster.mask import mask_raster
-                    # masked_raster = mask_raster(data, mask_gdf)
-
+            with rasterio.open(f) as src:
+                warp = self._load_args.get("warp")
+                if not warp:
+                    yield src
+                    return
+
+                vrt_options = self._vrt_options(src, warp)
+                logger.info(f"Warping to {warp['crs']}: {vrt_options}")
+                with WarpedVRT(src, **vrt_options) as vrt:
+                    yield vrt
+
+    def _vrt_options(self, src, warp: Dict[str, Any]) -> Dict[str, Any]:
+        """Translates ``warp`` load arguments to ``WarpedVRT`` options.
+
+        With a ``resolution``, the raster is warped onto the ``RasterGrid``
+        snapped around the mask (or the raster) in the target CRS, so all
+        rasters sharing a mask, CRS and resolution share the same grid.
+        """
+        options = {
+            "crs": warp["crs"],
+            "resampling": Resampling[warp.get("resampling", "nearest")],
+        }
+        if warp.get("resolution"):
+            if self._load_args["mask"]:
+                bounds = mask_cache.geometries(self._mask_path(), warp["crs"]).bounds
             else:
-                logger.info("Loading data without mask...")
-                with rasterio.open(f) as src:
-                    # load data
-                    data = src.read()
-
-                    # copy metadata to dict
-                    out_meta = src.meta.copy()
+                bounds = transform_bounds(src.crs, warp["crs"], *src.bounds)
+            grid = RasterGrid.from_bounds(bounds, warp["crs"], warp["resolution"])
+            options.update(
+                transform=grid.transform, width=grid.width, height=grid.height
+            )
+        if warp.get("warp_mem_limit"):
+            options["warp_mem_limit"] = warp["warp_mem_limit"]
+        if warp.get("num_threads"):
+            options["warp_extras"] = {"NUM_THREADS": warp["num_threads"]}
+        return options
+
+    def _mask_crs(self) -> Any:
+        """Returns the CRS the mask geometries must be in, if not their own."""
+        warp = self._load_args.get("warp")
+        return warp["crs"] if warp else None
+
+    def _mask_path(self) -> str:
+        """Returns the absolute path of ``load_args["mask_path"]``."""
+        return os.path.join(project_root, self._load_args["mask_path"])
+
+    def _read_args(self, src) -> Dict[str, Any]:
+        """Translates ``bands``, ``dtype`` and ``masked`` load arguments to
+        arguments of ``read_window``."""
+        bands = self._load_args.get("bands")
+        return dict(
+            indexes=resolve_bands(src.descriptions, bands) if bands else None,
+            out_dtype=self._load_args.get("dtype"),
+            masked=self._load_args.get("masked", False),
+        )
+
+    @staticmethod
+    def _read_meta(
+        src, window: Window = None, read_args: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """Copies the metadata of an open raster, cropped to ``window`` and
+        restricted to the bands and data type of ``read_args``."""
+        out_meta = src.meta.copy()
+        out_meta["driver"] = "GTiff"
+        descriptions = src.descriptions
+        if window is not None:
+            out_meta.update(
+                {
+                    "height": int(window.height),
+                    "width": int(window.width),
+                    "transform": src.window_transform(window),
+                }
+            )
+        if read_args and read_args["indexes"]:
+            descriptions = tuple(descriptions[i - 1] for i in read_args["indexes"])
+            out_meta["count"] = len(descriptions)
+        if read_args and read_args["out_dtype"]:
+            out_meta["dtype"] = np.dtype(read_args["out_dtype"]).name
+
+        # add additional metadata
+        out_meta["bounds"] = src.bounds
+        if window is not None:
+            out_meta["bounds"] = BoundingBox(*bounds(window, src.transform))
+        out_meta["descriptions"] = descriptions
+        out_meta["creation_time"] = src.profile.get("creation_time")
+        return out_meta
+
+    def _read_header(self, load_path: str) -> Dict[str, Any]:
+        """Reads metadata, crop window and mask without reading any pixels."""
+        with self._open(load_path) as src:
+            window, outside = None, None
+            if self._load_args["mask"]:
+                mask = mask_cache.window(self._mask_path(), src, self._mask_crs())
+                window, outside = mask.window, mask.outside
+            read_args = self._read_args(src)
+            return dict(
+                meta=self._read_meta(src, window, read_args),
+                window=window,
+                outside=outside,
+                read_args=read_args,
+                block_shape=src.block_shapes[0],
+            )
+
+    def _load_blocks(self, load_path: str) -> RasterBlockReader:
+        """Reads the header only and returns a lazy, block-wise reader.
 
-                    # add additional metadata
-                    out_meta["bounds"] = src.bounds
-                    out_meta["descriptions"] = src.descriptions
-                    out_meta["creation_time"] = src.profile.get("creation_time")
-
-            logger.info(f"Number of bands: {out_meta['count']}")
-            logger.info(f"Band names: {out_meta['descriptions']}")
-            logger.info(f"CRS: {out_meta['crs']}")
-            logger.info(f"time: {out_meta['creation_time']}")
-            logger.info(f"Geotransform: {out_meta['transform']}")
-            logger.info(f"Bounds: {src.bounds}")
+        Returns:
+            RasterBlockReader: Iterable of (window, array, window_transform).
+        """
+        header = self._read_header(load_path)
+        tile_shape = self._load_args.get("tile_shape")
+        reader = RasterBlockReader(
+            partial(self._open, load_path),
+            header["meta"],
+            block_shape=header["block_shape"],
+            window=header["window"],
+            tile_shape=tuple(tile_shape) if tile_shape else None,
+            outside=header["outside"],
+            read_args=header["read_args"],
+        )
+        logger.info(
+            f"Block shape: {header['block_shape']}, number of tiles: {len(reader)}"
+        )
+        return reader
+
+    def _load_header(self, load_path: str) -> LazyRaster:
+        """Reads the header only and returns a handle that reads pixels on
+        first access.
 
-            return data, out_meta
+        Returns:
+            LazyRaster: Handle behaving like the ``(array, metadata)`` tuple.
+        """
+        header = self._read_header(load_path)
+        raster = LazyRaster(
+            partial(self._open, load_path),
+            header["meta"],
+            window=header["window"],
+            outside=header["outside"],
+            read_args=header["read_args"],
+        )
+        logger.info(raster)
+        return raster
 
     def _save(self, data: Tuple) -> None:
         """Saves GeoTIFF data to the specified filepath."""
@@ -144,10 +383,15 @@ class GeoTIFFDataSet(AbstractDataset[np.ndarray, np.ndarray]):
         logger.info("Creation time: {}".format(creation_time))
 
         # remove additional metadata from dict
+        metadata = dict(metadata)
         metadata.pop("bounds", None)
         metadata.pop("descriptions", None)
         metadata.pop("creation_time", None)
 
+        if self._save_args["profile"] == "cog":
+            self._save_cog(save_path, array, metadata, descriptions)
+            return
+
         # save numpy array as GeoTIFF file
         with self._fs.open(save_path, mode="wb") as f:
             with rasterio.open(
@@ -155,17 +399,80 @@ class GeoTIFFDataSet(AbstractDataset[np.ndarray, np.ndarray]):
                 "w",
                 **metadata,  # unpack metadata dict
             ) as dst:
-                # Set band descriptions
-                if dst.count == len(descriptions):
-                    dst.descriptions = descriptions
-                else:  # pragma: no cover
-                    logger.warning(
-                        "Number of band descriptions does not match number of bands.\
-                            Band descriptions will not be set."
-                    )
+                self._write_bands(dst, array, descriptions)
                 dst.profile["creation_time"] = creation_time
-                dst.write(array)
+
+    def _save_cog(
+        self, save_path: str, array: np.ndarray, metadata: Dict, descriptions
+    ) -> None:
+        """Saves GeoTIFF data as a Cloud-Optimized GeoTIFF.
+
+        The array is written to a temporary tiled GeoTIFF on disk, which
+        GDAL's COG driver copies into a tiled, compressed file with its
+        overviews stored ahead of the full resolution data. Both files are
+        on disk and the result is streamed to ``save_path``, so saving does
+        not hold copies of the raster in memory.
+        """
+        blocksize = self._save_args["blocksize"]
+        metadata.update(
+            driver="GTiff",
+            tiled=True,
+            blockxsize=blocksize,
+            blockysize=blocksize,
+            BIGTIFF="IF_SAFER",
+        )
+        options = self._cog_options(metadata["dtype"])
+        logger.info(f"COG options: {options}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gtiff_path = os.path.join(tmp_dir, "data.tif")
+            cog_path = os.path.join(tmp_dir, "cog.tif")
+            with rasterio.open(gtiff_path, "w", **metadata) as dst:
+                self._write_bands(dst, array, descriptions)
+            with rasterio.open(gtiff_path) as src:
+                rasterio.shutil.copy(src, cog_path, driver="COG", **options)
+
+            with open(cog_path, "rb") as cog, self._fs.open(save_path, "wb") as f:
+                shutil.copyfileobj(cog, f, length=16 * 2**20)
+
+    def _cog_options(self, dtype: str) -> Dict[str, Any]:
+        """Creation options of the COG driver for the save arguments."""
+        save_args = self._save_args
+        if np.issubdtype(np.dtype(dtype), np.floating):
+            predictor = "FLOATING_POINT"
+        else:
+            predictor = "STANDARD"
+
+        options = {
+            "compress": save_args["compress"].upper(),
+            "predictor": predictor,
+            "blocksize": save_args["blocksize"],
+            "overviews": "AUTO" if save_args["overviews"] else "NONE",
+            "bigtiff": "IF_SAFER",
+        }
+        for key in ("level", "overview_resampling", "num_threads"):
+            if save_args.get(key) is not None:
+                options[key] = save_args[key]
+        return options
+
+    @staticmethod
+    def _write_bands(dst, array: np.ndarray, descriptions) -> None:
+        """Writes the array and band descriptions to an open dataset."""
+        # Set band descriptions
+        if dst.count == len(descriptions):
+            dst.descriptions = descriptions
+        else:  # pragma: no cover
+            logger.warning(
+                "Number of band descriptions does not match number of bands.\
+                    Band descriptions will not be set."
+            )
+        dst.write(array)
 
     def _describe(self) -> Dict[str, Any]:
         """Returns a dict that describes the attributes of the dataset."""
-        return dict(filepath=self._filepath, protocol=self._protocol)
+        return dict(
+            filepath=self._filepath,
+            protocol=self._protocol,
+            load_args=self._load_args,
+            save_args=self._save_args,
+        )
@@ -0,0 +1,111 @@
+import io
+import json
+import logging
+from pathlib import PurePosixPath
+from typing import Any, Dict, Union
+
+import fsspec
+import numpy as np
+from kedro.io import AbstractDataset
+from kedro.io.core import get_filepath_str, get_protocol_and_path
+
+from urban_climate.utils.predictor import LinearPredictor
+
+logger = logging.getLogger(__name__)
+
+
+class LinearModelDataSet(AbstractDataset[Any, LinearPredictor]):
+    """``LinearModelDataSet`` loads / saves fitted linear models as a small
+    JSON or NPZ file: feature names, coefficients, intercept and training
+    metadata.
+
+    Fitted scikit-learn linear models are converted on save, and models are
+    loaded as a ``LinearPredictor``, which predicts with NumPy only, so
+    loading does not import scikit-learn.
+
+    Example:
+    ::
+
+        >>> LinearModelDataSet(filepath='data/06_models/regressor.json')
+        >>> LinearModelDataSet(filepath='regressor.npz', format='npz')
+    """
+
+    FORMATS = ("json", "npz")
+
+    def __init__(self, filepath: str, format: str = "json") -> None:
+        """Creates a new instance of LinearModelDataSet to load / save linear
+        models for given filepath.
+
+        Args:
+            filepath: The location of the model file to load / save data.
+            format: ``json`` (default, human readable) or ``npz`` (NumPy
+                archive, exact binary coefficients).
+
+        Raises:
+            ValueError: if the format is unknown.
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown format '{format}', use one of {self.FORMATS}")
+
+        protocol, path = get_protocol_and_path(filepath)
+        self._protocol = protocol
+        self._filepath = PurePosixPath(path)
+        self._fs = fsspec.filesystem(self._protocol)
+        self._format = format
+
+    def _load(self) -> LinearPredictor:
+        """Loads the model.
+
+        Returns:
+            The model as a ``LinearPredictor``.
+        """
+        load_path = get_filepath_str(self._filepath, self._protocol)
+        with self._fs.open(load_path, mode="rb") as f:
+            if self._format == "json":
+                return LinearPredictor.from_dict(json.load(f))
+            with np.load(f, allow_pickle=False) as archive:
+                return LinearPredictor(
+                    features=archive["features"].tolist(),
+                    coef=archive["coef"],
+                    intercept=archive["intercept"].item(),
+                    metadata=json.loads(archive["metadata"].item()),
+                )
+
+    def _save(self, data: Union[LinearPredictor, Any]) -> None:
+        """Saves a ``LinearPredictor`` or a fitted scikit-learn linear model."""
+        if not isinstance(data, LinearPredictor):
+            data = LinearPredictor.from_model(data)
+
+        save_path = get_filepath_str(self._filepath, self._protocol)
+        with self._fs.open(save_path, mode="wb") as f:
+            if self._format == "json":
+                f.write(json.dumps(data.to_dict(), indent=2, default=str).encode())
+            else:
+                # np.savez needs a seekable file
+                buffer = io.BytesIO()
+                np.savez(
+                    buffer,
+                    features=np.array(data.features),
+                    coef=data.coef,
+                    intercept=np.array(data.intercept),
+                    metadata=np.array(json.dumps(data.metadata, default=str)),
+                )
+                f.write(buffer.getvalue())
+        logger.info(f"Saved linear model with features {data.features} to {save_path}")
+
+        self._invalidate_cache()
+
+    def _exists(self) -> bool:
+        load_path = get_filepath_str(self._filepath, self._protocol)
+        return self._fs.exists(load_path)
+
+    def _invalidate_cache(self) -> None:
+        """Invalidate underlying filesystem caches."""
+        filepath = get_filepath_str(self._filepath, self._protocol)
+        self._fs.invalidate_cache(filepath)
+
+    def _describe(self) -> Dict[str, Any]:
+        """Returns a dict that describes the attributes of the dataset."""
+        return dict(
+            filepath=self._filepath, protocol=self._protocol, format=self._format
+        )
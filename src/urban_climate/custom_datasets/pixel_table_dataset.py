@@ -0,0 +1,332 @@
+import json
+import logging
+from copy import deepcopy
+from pathlib import PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import fsspec
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from kedro.io import AbstractDataset
+from kedro.io.core import get_filepath_str, get_protocol_and_path
+from pyarrow import fs as pafs
+
+from urban_climate.utils.raster.table import with_geometry
+
+logger = logging.getLogger(__name__)
+
+# schema metadata key of the table attributes (CRS and grid)
+ATTRS_KEY = b"urban_climate"
+
+
+class PixelTableChunks:
+    """Chunked reader of a pixel table file, returned by ``PixelTableDataSet``
+    with ``chunked: True``.
+
+    Chunks are the row groups of a Parquet file or the record batches of an
+    Arrow IPC file. The file is opened on first access in each process, so
+    the reader can be passed to worker processes, which then read their
+    chunks independently. The file is closed when an iteration ends, on
+    ``close()`` or when leaving a ``with`` block, and reopened by the next
+    read.
+
+    Example:
+    ::
+
+        >>> len(chunks)  # number of row groups
+        >>> for chunk in chunks:  # one DataFrame per row group
+        ...     ...
+        >>> with chunks:
+        ...     first = chunks.read(0)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        protocol: str,
+        format: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[List] = None,
+    ) -> None:
+        self.path = path
+        self.protocol = protocol
+        self.format = format
+        self.columns = columns
+        self.filters = filters
+        self._file = None
+        self._reader = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the open file is not pickled, workers open their own
+        return {**self.__dict__, "_file": None, "_reader": None}
+
+    def __enter__(self) -> "PixelTableChunks":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the open file, if any."""
+        reader, f = self._reader, self._file
+        self._reader = self._file = None
+        if isinstance(reader, pq.ParquetFile):
+            reader.close()
+        if f is not None:
+            f.close()
+
+    @property
+    def reader(self) -> Union[pq.ParquetFile, pa.ipc.RecordBatchFileReader]:
+        if self._reader is None:
+            self._file = fsspec.filesystem(self.protocol).open(self.path, mode="rb")
+            if self.format == "parquet":
+                self._reader = pq.ParquetFile(self._file)
+            else:
+                self._reader = pa.ipc.open_file(self._file)
+        return self._reader
+
+    def __len__(self) -> int:
+        if self.format == "parquet":
+            return self.reader.num_row_groups
+        return self.reader.num_record_batches
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        # closed when exhausted, or when an unfinished iteration is dropped
+        try:
+            for index in range(len(self)):
+                yield self.read(index)
+        finally:
+            self.close()
+
+    def read(self, index: int) -> pd.DataFrame:
+        """Reads one chunk, projected on ``columns`` and filtered."""
+        columns = self.columns
+        if columns is not None and self.filters:
+            columns = list(columns) + [
+                c for c in _filter_columns(self.filters) if c not in columns
+            ]
+        if self.format == "parquet":
+            table = self.reader.read_row_group(index, columns=columns)
+        else:
+            table = pa.Table.from_batches([self.reader.get_batch(index)])
+            if columns is not None:
+                table = table.select(columns)
+
+        if self.filters:
+            table = table.filter(pq.filters_to_expression(self.filters))
+            if self.columns is not None:
+                table = table.select(self.columns)
+        return table.to_pandas(split_blocks=True)
+
+
+def _filter_columns(filters: List) -> List[str]:
+    """Columns referenced by DNF filters (``[[column, op, value], ...]``)."""
+    if isinstance(filters[0], str):
+        return [filters[0]]
+    return [c for f in filters for c in _filter_columns(f)]
+
+
+class PixelTableDataSet(AbstractDataset[pd.DataFrame, pd.DataFrame]):
+    """``PixelTableDataSet`` loads / saves pixel tables (see
+    ``utils.raster.table``) as columnar Parquet or Arrow IPC files using
+    PyArrow.
+
+    Only the requested columns are read, and ``filters`` are pushed down to
+    the reader, so row groups whose statistics exclude the filter are
+    skipped. Point geometries are not stored, as they are given by the ``X``
+    and ``Y`` columns, but can be rebuilt on load with ``geometry: True``.
+
+    Example:
+    ::
+
+        >>> PixelTableDataSet(
+        ...     filepath='data/05_model_input/pixels.parquet',
+        ...     load_args={
+        ...         'columns': ['DTM', 'fractionCanopy', 'LST'],
+        ...         'filters': [['fractionWater', '<', 0.5]],
+        ...     },
+        ... )
+
+    Arrow IPC files (``format: arrow``) are uncompressed by default and read
+    through a memory map, without copying the columns into memory:
+    ::
+
+        >>> PixelTableDataSet(filepath='pixels.arrow', format='arrow')
+
+    Tables larger than memory can be loaded as a ``PixelTableChunks`` reader
+    with ``chunked: True``, and processed one row group at a time:
+    ::
+
+        >>> PixelTableDataSet(
+        ...     filepath='pixels.parquet', load_args={'chunked': True}
+        ... )
+    """
+
+    DEFAULT_LOAD_ARGS: Dict[str, Any] = {
+        "columns": None,
+        "filters": None,
+        "geometry": False,
+        "memory_map": True,
+        "chunked": False,
+    }
+    DEFAULT_SAVE_ARGS: Dict[str, Any] = {
+        "compression": "zstd",
+        "row_group_size": 65536,
+    }
+    FORMATS = ("parquet", "arrow")
+
+    def __init__(
+        self,
+        filepath: str,
+        format: str = "parquet",
+        load_args: Dict[str, Any] = None,
+        save_args: Dict[str, Any] = None,
+    ) -> None:
+        """Creates a new instance of PixelTableDataSet to load / save pixel
+        tables for given filepath.
+
+        Args:
+            filepath: The location of the table file to load / save data.
+            format: ``parquet`` (default) or ``arrow`` (Arrow IPC / Feather
+                v2).
+            load_args: Options for loading. ``columns`` projects the table
+                on these columns, ``filters`` keeps the rows matching
+                ``[[column, op, value], ...]`` (all conditions, or a list of
+                such lists for any of them), ``geometry`` adds point
+                geometries, ``memory_map`` reads local files through a
+                memory map and ``chunked`` returns a ``PixelTableChunks``
+                reader instead of the table.
+            save_args: Options for saving. ``compression`` (zstd, snappy,
+                lz4, none) and ``row_group_size`` (Parquet only, the
+                granularity of predicate pushdown). Arrow files are written
+                uncompressed unless ``compression`` is lz4 or zstd.
+
+        Raises:
+            ValueError: if the format is unknown.
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown format '{format}', use one of {self.FORMATS}")
+
+        protocol, path = get_protocol_and_path(filepath)
+        self._protocol = protocol
+        self._filepath = PurePosixPath(path)
+        self._fs = fsspec.filesystem(self._protocol)
+        self._format = format
+
+        # Handle default load and save arguments
+        self._load_args = deepcopy(self.DEFAULT_LOAD_ARGS)
+        if load_args is not None:
+            self._load_args.update(load_args)
+
+        self._save_args = deepcopy(self.DEFAULT_SAVE_ARGS)
+        if format == "arrow":
+            self._save_args["compression"] = None
+        if save_args is not None:
+            self._save_args.update(save_args)
+
+    def _arrow_filesystem(self) -> pafs.FileSystem:
+        """Local filesystem (with memory map) or the fsspec filesystem."""
+        if self._protocol == "file":
+            return pafs.LocalFileSystem(use_mmap=self._load_args["memory_map"])
+        return pafs.PyFileSystem(pafs.FSSpecHandler(self._fs))
+
+    def _load(self) -> Union[pd.DataFrame, gpd.GeoDataFrame, PixelTableChunks]:
+        """Loads the projected and filtered table.
+
+        Returns:
+            The pixel table as a pandas DataFrame (GeoDataFrame with
+            ``geometry``), with the table attributes (CRS, grid) restored, or
+            a ``PixelTableChunks`` reader with ``chunked``.
+        """
+        load_path = get_filepath_str(self._filepath, self._protocol)
+        if self._load_args["chunked"]:
+            return PixelTableChunks(
+                load_path,
+                self._protocol,
+                self._format,
+                columns=self._load_args["columns"],
+                filters=self._load_args["filters"],
+            )
+
+        dataset = ds.dataset(
+            load_path,
+            format="parquet" if self._format == "parquet" else "ipc",
+            filesystem=self._arrow_filesystem(),
+        )
+
+        # point geometries need the coordinates
+        columns = self._load_args["columns"]
+        if columns is not None and self._load_args["geometry"]:
+            columns = list(columns) + [c for c in ("X", "Y") if c not in columns]
+
+        filters = self._load_args["filters"]
+        table = dataset.to_table(
+            columns=columns,
+            filter=pq.filters_to_expression(filters) if filters else None,
+        )
+        logger.info(
+            f"Loaded {table.num_rows} rows, columns: {table.column_names} "
+            f"from {load_path}"
+        )
+
+        data = table.to_pandas(split_blocks=True)
+        metadata = dataset.schema.metadata or {}
+        if ATTRS_KEY in metadata:
+            data.attrs.update(json.loads(metadata[ATTRS_KEY]))
+        if self._load_args["geometry"]:
+            data = with_geometry(data)
+        return data
+
+    def _save(self, data: pd.DataFrame) -> None:
+        """Saves the table, without geometries, and its attributes."""
+        if isinstance(data, gpd.GeoDataFrame):
+            attrs = {"crs": data.crs.to_string() if data.crs else None}
+            attrs.update(data.attrs)
+            data = pd.DataFrame(data.drop(columns=data.geometry.name))
+            data.attrs.update(attrs)
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                ATTRS_KEY: json.dumps(data.attrs, default=str).encode(),
+            }
+        )
+
+        save_path = get_filepath_str(self._filepath, self._protocol)
+        with self._fs.open(save_path, mode="wb") as f:
+            if self._format == "parquet":
+                pq.write_table(table, f, **self._save_args)
+            else:
+                options = pa.ipc.IpcWriteOptions(
+                    compression=self._save_args["compression"]
+                )
+                with pa.ipc.new_file(f, table.schema, options=options) as writer:
+                    writer.write_table(table)
+
+        self._invalidate_cache()
+
+    def _exists(self) -> bool:
+        load_path = get_filepath_str(self._filepath, self._protocol)
+        return self._fs.exists(load_path)
+
+    def _invalidate_cache(self) -> None:
+        """Invalidate underlying filesystem caches."""
+        filepath = get_filepath_str(self._filepath, self._protocol)
+        self._fs.invalidate_cache(filepath)
+
+    def _describe(self) -> Dict[str, Any]:
+        """Returns a dict that describes the attributes of the dataset."""
+        return dict(
+            filepath=self._filepath,
+            protocol=self._protocol,
+            format=self._format,
+            load_args=self._load_args,
+            save_args=self._save_args,
+        )
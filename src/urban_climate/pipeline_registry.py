@@ -7,7 +7,7 @@ from typing import Dict
 from kedro.pipeline import Pipeline
 
 # import pipelines here
-from .pipelines import data_science, raster_processing
+from .pipelines import data_science, raster_processing, reporting
 
 
 def register_pipelines() -> Dict[str, Pipeline]:
@@ -24,4 +24,9 @@ def register_pipelines() -> Dict[str, Pipeline]:
     }
 
     pipelines["__default__"] = sum(pipelines.values())
+
+    # optional diagnostics, off by default: kedro run --pipeline reporting
+    pipelines["reporting"] = reporting.create_pipeline()
+    # out-of-memory training: kedro run --pipeline streaming_training
+    pipelines["streaming_training"] = data_science.create_streaming_pipeline()
     return pipelines
@@ -1,3 +1,3 @@
 """Complete Data Science pipeline for the spaceflights tutorial"""
 
-from .pipeline import create_pipeline  # NOQA
+from .pipeline import create_pipeline, create_streaming_pipeline  # NOQA
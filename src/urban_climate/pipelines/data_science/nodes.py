@@ -1,104 +1,270 @@
 import logging
-from typing import Dict, Tuple
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
-from sklearn.model_selection import train_test_split
 
+from urban_climate.utils import model_selection
+from urban_climate.utils.linear import stats_from_chunks, to_regressor
+from urban_climate.utils.predictor import LinearPredictor
+from urban_climate.utils.raster.predict import predict_raster_scenarios
+from urban_climate.utils.scenarios import check_scenarios, predict_scenarios
 
-def split_data(data, parameters: Dict) -> Tuple:
-    """Splits data into features and targets training and test sets.
+logger = logging.getLogger(__name__)
+
+
+def select_model(
+    candidate_models: Dict[str, Any],
+    model_comparison_scores: pd.DataFrame,
+    model_options: Dict,
+) -> Any:
+    """Selects one of the compared candidate models by name.
+
+    The candidates are trained once on the shared feature matrix (see
+    ``compare_models``), so the modelling pipelines do not split and train
+    again.
 
     Args:
-        data: Data containing features and target.
-        parameters: Parameters defined in parameters/data_science.yml.
+        candidate_models: Fitted models by candidate.
+        model_comparison_scores: Scores of the candidates.
+        model_options: Model options, with the name of the ``candidate``.
+
+    Raises:
+        ValueError: if the candidate was not compared.
+
     Returns:
-        Split data.
+        The fitted model of the candidate.
     """
+    name = model_options["candidate"]
+    if name not in candidate_models:
+        raise ValueError(
+            f"Candidate '{name}' is not one of the compared models "
+            f"{sorted(candidate_models)}"
+        )
+    scores = model_comparison_scores.loc[name]
+    logger.info(
+        f"Selected candidate {name}: R^2 {scores['r2']:.3f}, "
+        f"RMSE {scores['rmse']:.3f} on test data."
+    )
+    return candidate_models[name]
 
-    # drop rows with missing values
-    data = data.dropna()
 
-    X = data[parameters["features"]]
-    y = data["LST"]
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=parameters["test_size"], random_state=parameters["random_state"]
+def train_model_streaming(model_input_chunks, parameters: Dict) -> LinearRegression:
+    """Trains the linear regression model chunk by chunk.
+
+    The sufficient statistics (X'X, X'y) of each chunk of the pixel table
+    are accumulated in parallel and merged, then solved once, so the table
+    is never loaded in full.
+
+    Args:
+        model_input_chunks: Chunked pixel table (``PixelTableChunks``).
+        parameters: Streaming training options: ``features``, ``target``,
+            ``alpha`` (ridge penalty, 0 for least squares) and
+            ``processes``.
+
+    Returns:
+        Trained model, like the candidates of ``compare_models``.
+    """
+    features = parameters["features"]
+    stats = stats_from_chunks(
+        model_input_chunks,
+        features,
+        target=parameters.get("target", "LST"),
+        processes=parameters.get("processes"),
     )
-    return X_train, X_test, y_train, y_test
+    return to_regressor(stats, features, alpha=parameters.get("alpha", 0.0))
 
 
-def train_model(X_train: pd.DataFrame, y_train: pd.Series) -> LinearRegression:
-    """Trains the linear regression model.
+def export_model(
+    regressor: LinearRegression,
+    model_comparison_scores: pd.DataFrame,
+    model_options: Dict,
+) -> LinearPredictor:
+    """Exports the selected model as a lightweight predictor.
 
     Args:
-        X_train: Training data of independent features.
-        y_train: Training data for price.
+        regressor: Trained model.
+        model_comparison_scores: Scores of the candidates.
+        model_options: Model options, with the name of the ``candidate``.
 
     Returns:
-        Trained model.
+        NumPy-only predictor with the training metadata, saved with
+        ``LinearModelDataSet``.
     """
-    regressor = LinearRegression()
-    regressor.fit(X_train, y_train)
-    return regressor
+    name = model_options["candidate"]
+    scores = model_comparison_scores.loc[name]
+    return LinearPredictor.from_model(
+        regressor,
+        metadata={
+            "candidate": name,
+            "train_rows": int(scores["train_rows"]),
+            "test_r2": float(scores["r2"]),
+            "test_rmse": float(scores["rmse"]),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+    )
 
 
-def evaluate_model(
-    regressor: LinearRegression, X_test: pd.DataFrame, y_test: pd.Series
-):
-    """Calculates and logs the coefficient of determination.
+def prepare_model_matrix(
+    data: pd.DataFrame, model_comparison: Dict
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Prepares the cleaned float32 feature matrix shared by all candidates.
 
     Args:
-        regressor: Trained model.
-        X_test: Testing data of independent features.
-        y_test: Testing data for price.
+        data: Data containing features and target.
+        model_comparison: Model comparison options: ``features``, ``target``
+            and ``out_path`` (``.npy`` file to memory-map the matrix).
+
+    Returns:
+        Feature matrix (features and target) and metadata (see
+        ``utils.model_selection.prepare_features``).
     """
-    y_pred = regressor.predict(X_test)
-    score = r2_score(y_test, y_pred)
-    logger = logging.getLogger(__name__)
-    logger.info("Model has a coefficient R^2 of %.3f on test data.", score)
+    return model_selection.prepare_features(
+        data,
+        model_comparison["features"],
+        target=model_comparison.get("target", "LST"),
+        out_path=model_comparison.get("out_path"),
+    )
 
 
-# Create a copy of the dataframe with LST column removed and
-# canopyFraction set to 0 or nodata if nodata
-# TODO add node to predict LST from model
+def compare_models(
+    model_matrix: Tuple[np.ndarray, Dict[str, Any]], model_comparison: Dict
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Trains and scores all candidate models in parallel.
 
+    Args:
+        model_matrix: Feature matrix and metadata (see
+            ``prepare_model_matrix``).
+        model_comparison: Model comparison options: ``candidates``,
+            ``test_size``, ``random_state`` and ``processes`` (see
+            ``utils.model_selection.compare_models``).
 
-def predict_counterfactual(
-    data, regressor: LinearRegression, parameters: Dict
+    Returns:
+        Scores of the candidates and fitted models by candidate.
+    """
+    return model_selection.compare_models(
+        model_matrix,
+        model_comparison["candidates"],
+        test_size=model_comparison.get("test_size", 0.2),
+        random_state=model_comparison.get("random_state"),
+        processes=model_comparison.get("processes"),
+    )
+
+
+def cross_validate_spatial(
+    model_matrix: Tuple[np.ndarray, Dict[str, Any]], model_comparison: Dict
 ) -> pd.DataFrame:
-    """Predicts the counterfactual LST values for the input data.
+    """Scores all candidate models on the spatial folds, in parallel.
 
     Args:
-        data: Data containing features and target.
-        regressor: Trained model.
+        model_matrix: Feature matrix and metadata, with the spatial folds
+            (see ``prepare_model_matrix``).
+        model_comparison: Model comparison options: ``candidates`` and
+            ``processes`` (see
+            ``utils.model_selection.spatial_cross_validate``).
 
     Returns:
-        Dataframe with counterfactual LST values.
+        Scores per candidate and fold.
     """
+    return model_selection.spatial_cross_validate(
+        model_matrix,
+        model_comparison["candidates"],
+        processes=model_comparison.get("processes"),
+    )
 
-    # interpolate missing values BUT NOT IN ROW GEOMETRY!
-    data["DTM"] = data["DTM"].interpolate(distance=2)
-    data["fractionGrass"] = data["fractionGrass"].interpolate(distance=2)
-    data["fractionCropland"] = data["fractionCropland"].interpolate(distance=2)
-    data["fractionBuilt"] = data["fractionBuilt"].interpolate(distance=2)
-    data["fractionWater"] = data["fractionWater"].interpolate(distance=2)
 
-    # set canopyFraction to 0
-    data["fractionCanopy"] = 0
+def predict_counterfactual(
+    data, regressor: LinearRegression, counterfactual: Dict
+) -> pd.DataFrame:
+    """Predicts the LST of the input data for the baseline and each scenario.
+
+    Nodata gaps of the features are filled on the raster grid before the
+    pixel table is built (see ``fill_gaps``), pixels still missing a feature
+    are dropped.
+
+    Args:
+        data: Data containing features and target.
+        regressor: Trained model, fitted on a DataFrame of its features.
+        counterfactual: Counterfactual options, with the feature
+        ``scenarios`` (see ``utils.scenarios.check_scenarios``).
+
+    Returns:
+        Dataframe with the features, the predicted LST (``LST_predicted``)
+        and one ``LST_<scenario>`` column per scenario.
+    """
 
-    # remove column LST and canopyFraction
+    # remove column LST
     data = data.drop(columns=["LST"])
 
     # drop rows with missing values
     data = data.dropna()
 
-    # predict LST
-    X = data[parameters["features"]]
-    y_pred = regressor.predict(X)
+    # predict LST for the baseline and all scenarios at once
+    features = list(regressor.feature_names_in_)
+    scenarios = check_scenarios(counterfactual["scenarios"], features)
+    X = data[features].to_numpy(dtype="float32")
+    y_pred = predict_scenarios(regressor, X, features, scenarios)
 
-    # add predicted LST to dataframe
-    # created new columen predicted LST
-    data["predicted_LST"] = y_pred
+    data["LST_predicted"] = y_pred[0]
+    for scenario, y in zip(scenarios, y_pred[1:]):
+        data[f"LST_{scenario['name']}"] = y
 
     return data
+
+
+def predict_counterfactual_raster(
+    raster_stack: Tuple[np.ndarray, Dict[str, Any]],
+    regressor: LinearRegression,
+    counterfactual: Dict,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Predicts the LST and counterfactual LST directly on the raster stack.
+
+    The baseline and all scenarios are predicted on the same pixels, those
+    with data in all features, so the deltas are defined wherever the model
+    applies. The output is on the grid of the stack and can be saved with
+    ``GeoTIFFDataSet``.
+
+    Args:
+        raster_stack: Raster stack (numpy array and metadata) with the
+        features as band descriptions.
+        regressor: Trained model, fitted on a DataFrame of its features.
+        counterfactual: Counterfactual options: feature ``scenarios`` (see
+        ``utils.scenarios.check_scenarios``), ``batch_size`` (pixels
+        predicted at once) and ``nodata``.
+
+    Returns:
+        Raster with bands ``LST_predicted``, then ``LST_<scenario>`` and
+        ``delta_LST_<scenario>`` (scenario - predicted) for each scenario,
+        and metadata.
+    """
+    scenarios = counterfactual["scenarios"]
+    nodata = counterfactual.get("nodata", -9999.0)
+    predicted = predict_raster_scenarios(
+        raster_stack,
+        regressor,
+        list(regressor.feature_names_in_),
+        scenarios,
+        batch_size=counterfactual.get("batch_size", 65536),
+        nodata=nodata,
+    )
+
+    delta = np.full_like(predicted[1:], nodata)
+    valid = predicted[0] != nodata
+    delta[:, valid] = predicted[1:, valid] - predicted[0, valid]
+    out = np.concatenate([predicted, delta])
+
+    names = [scenario["name"] for scenario in scenarios]
+    metadata = raster_stack[1].copy()
+    metadata.update(
+        {
+            "count": len(out),
+            "dtype": "float32",
+            "nodata": nodata,
+            "descriptions": ["LST_predicted"]
+            + [f"LST_{name}" for name in names]
+            + [f"delta_LST_{name}" for name in names],
+        }
+    )
+    return out, metadata
@@ -12,78 +12,113 @@
 from kedro.pipeline import Pipeline, node
 from kedro.pipeline.modular_pipeline import pipeline
 
-from .nodes import evaluate_model, predict_counterfactual, split_data, train_model
+from .nodes import (
+    compare_models,
+    cross_validate_spatial,
+    export_model,
+    predict_counterfactual,
+    predict_counterfactual_raster,
+    prepare_model_matrix,
+    select_model,
+    train_model_streaming,
+)
 
 
 def create_pipeline(**kwargs) -> Pipeline:
-    pipeline_instance = pipeline(
+    # N-way comparison: the feature matrix is prepared once, and all
+    # candidates are trained on it in one pass
+    comparison_pipeline = pipeline(
         [
             node(
-                func=split_data,
-                inputs=["gdf_model_input", "params:model_options"],
-                outputs=["X_train", "X_test", "y_train", "y_test"],
-                name="split_data_node",
+                func=prepare_model_matrix,
+                inputs=["gdf_model_input@table", "params:model_comparison"],
+                outputs="model_matrix",
+                name="prepare_model_matrix_node",
+            ),
+            node(
+                func=compare_models,
+                inputs=["model_matrix", "params:model_comparison"],
+                outputs=["model_comparison_scores", "candidate_models"],
+                name="compare_models_node",
+            ),
+            node(
+                func=cross_validate_spatial,
+                inputs=["model_matrix", "params:model_comparison"],
+                outputs="spatial_cv_scores",
+                name="cross_validate_spatial_node",
             ),
+        ]
+    )
+
+    # modelling pipelines pick their model from the compared candidates
+    pipeline_instance = pipeline(
+        [
             node(
-                func=train_model,
-                inputs=["X_train", "y_train"],
+                func=select_model,
+                inputs=[
+                    "candidate_models",
+                    "model_comparison_scores",
+                    "params:model_options",
+                ],
                 outputs="regressor",
-                name="train_model_node",
+                name="select_model_node",
             ),
             node(
-                func=evaluate_model,
-                inputs=["regressor", "X_test", "y_test"],
-                outputs=None,
-                name="evaluate_model_node",
+                func=export_model,
+                inputs=["regressor", "model_comparison_scores", "params:model_options"],
+                outputs="regressor_compact",
+                name="export_model_node",
             ),
             node(
                 func=predict_counterfactual,
-                inputs=["gdf_model_input", "regressor", "params:model_options"],
+                inputs=[
+                    "gdf_model_input@table",
+                    "regressor",
+                    "params:counterfactual",
+                ],
                 outputs="gdf_counterfactual",
                 name="predict_counterfactual_node",
             ),
+            node(
+                func=predict_counterfactual_raster,
+                inputs=["raster_stack", "regressor", "params:counterfactual"],
+                outputs="lst_counterfactual_raster",
+                name="predict_counterfactual_raster_node",
+            ),
         ]
     )
+    shared = {
+        "gdf_model_input@table",
+        "raster_stack",
+        "candidate_models",
+        "model_comparison_scores",
+    }
     ds_pipeline_1 = pipeline(
         pipe=pipeline_instance,
-        inputs="gdf_model_input",
+        inputs=shared,
         namespace="active_modelling_pipeline",
     )
     ds_pipeline_2 = pipeline(
         pipe=pipeline_instance,
-        inputs="gdf_model_input",
+        inputs=shared,
         namespace="candidate_modelling_pipeline",
     )
 
-    return ds_pipeline_1 + ds_pipeline_2
-
-
-# non-modular pipeline
-# from kedro.pipeline import Pipeline, node, pipeline
-
-# from .nodes import evaluate_model, split_data, train_model
+    return comparison_pipeline + ds_pipeline_1 + ds_pipeline_2
 
 
-# def create_pipeline(**kwargs) -> Pipeline:
-#     return pipeline(
-#         [
-#             node(
-#                 func=split_data,
-#                 inputs=["model_input_table", "params:model_options"],
-#                 outputs=["X_train", "X_test", "y_train", "y_test"],
-#                 name="split_data_node",
-#             ),
-#             node(
-#                 func=train_model,
-#                 inputs=["X_train", "y_train"],
-#                 outputs="regressor",
-#                 name="train_model_node",
-#             ),
-#             node(
-#                 func=evaluate_model,
-#                 inputs=["regressor", "X_test", "y_test"],
-#                 outputs=None,
-#                 name="evaluate_model_node",
-#             ),
-#         ]
-#     )
+def create_streaming_pipeline(**kwargs) -> Pipeline:
+    # Not part of the default pipeline, run it with:
+    # kedro run --pipeline streaming_training
+    # trains on the pixel table one row group at a time, for tables larger
+    # than memory (e.g. national runs at 10 m)
+    return pipeline(
+        [
+            node(
+                func=train_model_streaming,
+                inputs=["gdf_model_input@chunks", "params:streaming_training"],
+                outputs="streaming_regressor",
+                name="train_model_streaming_node",
+            ),
+        ]
+    )
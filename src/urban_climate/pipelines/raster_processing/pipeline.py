@@ -1,60 +1,118 @@
 from kedro.pipeline import Pipeline, node
 
-from .nodes import mask_raster, reproject_raster, stack_rasters, stack_to_gdf
+from .nodes import (
+    aggregate_canopy,
+    define_target_grid,
+    fill_gaps,
+    mask_raster,
+    rasterize_study_area,
+    reproject_raster,
+    stack_rasters,
+    stack_to_gdf,
+)
 
-# TODO store reprojected rasters in memory and pass them to stack_rasters node
-# TODO move stack_rasters to a util function
-# TODO update custom load to include mask (finished but not very elegant)
 # TODO load crowns as vectors and convert to raster (now performed in GIS)
+#      (the canopy raster is aggregated to canopy fraction in aggregate_canopy)
 
 
 def create_pipeline(**kwargs) -> Pipeline:
-    name_list = ["terrain", "landcover_fraction", "land_surface_temperature"]
-    mask_list = ["masked_" + raster for raster in name_list]
-    reprojected_rasters = ["r_" + raster for raster in mask_list]
+    name_list = [
+        "terrain",
+        "landcover_fraction",
+        "land_surface_temperature",
+        "canopy_fraction",
+    ]
+    reprojected_list = ["r_" + raster for raster in name_list]
+    masked_rasters = ["r_masked_" + raster for raster in name_list]
 
-    # Node: mask_rasters (loop over raster_list)
-    mask_nodes = []
-    for raster in name_list:
-        mask_node = node(
-            mask_raster,
-            inputs=[raster],
-            outputs=f"masked_{raster}",
-            name=f"mask_{raster}",
-            tags=["mask_raster"],
-        )
-        mask_nodes.append(mask_node)
+    # Node: target grid shared by all rasters
+    grid_node = node(
+        define_target_grid,
+        inputs=["study_area", "params:target_grid"],
+        outputs="target_grid",
+        name="define_target_grid",
+        tags=["reproject_raster"],
+    )
+
+    # Node: study area mask on the target grid, shared by all rasters
+    study_area_mask_node = node(
+        rasterize_study_area,
+        inputs=["study_area", "target_grid"],
+        outputs="study_area_mask",
+        name="rasterize_study_area",
+        tags=["mask_raster"],
+    )
 
-    # Node: reproject_raster (loop over raster_list)
+    # Node: canopy fraction per grid cell, from the high-resolution canopy cover
+    canopy_node = node(
+        aggregate_canopy,
+        inputs=["canopy_cover", "target_grid", "params:canopy_aggregation"],
+        outputs="canopy_fraction",
+        name="aggregate_canopy",
+        tags=["aggregate_canopy"],
+    )
+
+    # Node: reproject_raster onto the target grid (loop over raster_list)
     reproject_nodes = []
-    for raster, name in zip(mask_list, name_list):
+    for raster in name_list:
         reproject_node = node(
             reproject_raster,
-            inputs=[raster, "params:dst_crs"],
+            inputs=[raster, "target_grid", "params:reproject_options"],
             outputs=f"r_{raster}",
-            name=f"reproject_{name}",
+            name=f"reproject_{raster}",
             tags=["reproject_raster"],
         )
         reproject_nodes.append(reproject_node)
 
+    # Node: mask_rasters with the study area mask (loop over raster_list)
+    mask_nodes = []
+    for raster, name in zip(reprojected_list, name_list):
+        mask_node = node(
+            mask_raster,
+            inputs=[raster, "study_area_mask"],
+            outputs=f"r_masked_{name}",
+            name=f"mask_{name}",
+            tags=["mask_raster"],
+        )
+        mask_nodes.append(mask_node)
+
     # Node: raster stack
     stack_node = node(
         stack_rasters,
-        inputs=[f"{name}" for name in reprojected_rasters] + ["canopy_fraction"],
-        outputs="raster_stack",
+        inputs=["params:stack_options"] + masked_rasters,
+        outputs="raster_stack_unfilled",
         name="raster_stack",
         tags=["raster_stack"],
     )
 
+    # Node: fill nodata gaps on the grid, before the pixel table is built
+    fill_gaps_node = node(
+        fill_gaps,
+        inputs=["raster_stack_unfilled", "study_area_mask", "params:gap_filling"],
+        outputs="raster_stack",
+        name="fill_gaps",
+        tags=["raster_stack"],
+    )
+
     # Node: stack to gdf
     stack_to_gdf_node = node(
         stack_to_gdf,
-        inputs=["raster_stack", "study_area", "params:path_to_stack"],
-        outputs="gdf_model_input",
+        inputs=[
+            "raster_stack",
+            "study_area_mask",
+            "params:pixel_table",
+            "params:spatial_folds",
+        ],
+        outputs="gdf_model_input@table",
         name="stack_to_gdf",
         tags=["stack_to_gdf"],
     )
     # Define the pipeline by combining reproject and stack nodes
-    pipeline = Pipeline(mask_nodes + reproject_nodes + [stack_node, stack_to_gdf_node])
+    pipeline = Pipeline(
+        [grid_node, study_area_mask_node, canopy_node]
+        + reproject_nodes
+        + mask_nodes
+        + [stack_node, fill_gaps_node, stack_to_gdf_node]
+    )
 
     return pipeline
@@ -0,0 +1,3 @@
+"""Optional diagnostic plots, not part of the default pipeline"""
+
+from .pipeline import create_pipeline  # NOQA
@@ -0,0 +1,63 @@
+import logging
+import math
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from matplotlib.figure import Figure
+from rasterio.transform import array_bounds
+
+logger = logging.getLogger(__name__)
+
+
+def plot_raster_stack(
+    raster_stack: Tuple[np.ndarray, Dict[str, Any]],
+    plot_options: Dict[str, Any] = None,
+) -> Figure:
+    """Plots each band of the raster stack on its grid.
+
+    The bands are drawn with ``imshow`` from the (decimated) arrays, not from
+    point geometries, on a figure that does not need a display, so the plot
+    can be written by ``MatplotlibWriter`` in batch runs.
+
+    Args:
+        raster_stack: Stacked rasters, numpy array and metadata.
+        plot_options: ``max_size``, the maximum number of pixels drawn along
+            each axis (larger grids are decimated), ``ncols`` and ``cmap``.
+
+    Returns:
+        The figure, one panel per band.
+    """
+    options = {"max_size": 1000, "ncols": 4, "cmap": "viridis"}
+    options.update(plot_options or {})
+
+    array, meta = raster_stack
+    bands, height, width = array.shape
+
+    # decimate large grids, a view of every n-th pixel
+    step = max(1, math.ceil(max(height, width) / options["max_size"]))
+    decimated = array[:, ::step, ::step]
+    xmin, ymin, xmax, ymax = array_bounds(height, width, meta["transform"])
+    logger.info(f"Plotting {bands} bands of {decimated.shape[1:]} pixels")
+
+    ncols = min(bands, options["ncols"])
+    nrows = math.ceil(bands / ncols)
+    fig = Figure(figsize=(4 * ncols, 3.5 * nrows), layout="constrained")
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+
+    nodata = meta.get("nodata")
+    descriptions = meta.get("descriptions") or [None] * bands
+    for ax, band, description in zip(axes, decimated, descriptions):
+        data = np.ma.masked_equal(band, nodata) if nodata is not None else band
+        image = ax.imshow(
+            data,
+            extent=(xmin, xmax, ymin, ymax),
+            cmap=options["cmap"],
+            interpolation="nearest",
+        )
+        ax.set_title(description)
+        ax.set_axis_off()
+        fig.colorbar(image, ax=ax, shrink=0.8)
+    for ax in axes[bands:]:
+        ax.set_axis_off()
+
+    return fig
@@ -0,0 +1,19 @@
+from kedro.pipeline import Pipeline, node
+
+from .nodes import plot_raster_stack
+
+# Not part of the default pipeline, run it with:
+# kedro run --pipeline reporting
+
+
+def create_pipeline(**kwargs) -> Pipeline:
+    # Node: plot of the raster stack, written to data/08_reporting
+    plot_stack_node = node(
+        plot_raster_stack,
+        inputs=["raster_stack", "params:plot_options"],
+        outputs="raster_stack_plot",
+        name="plot_raster_stack",
+        tags=["reporting"],
+    )
+
+    return Pipeline([plot_stack_node])
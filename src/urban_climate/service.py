@@ -0,0 +1,410 @@
+""" Local prediction service for counterfactual LST queries.
+
+The trained model (``LinearModelDataSet`` file) and the raster stack are
+loaded once, the stack memory-mapped, and queries by bounding box, polygon
+and canopy scenario are answered from the preloaded arrays. Run it with:
+::
+
+    urban-climate-service --model data/06_models/regressor_active.json \\
+        --stack data/02_intermediate/kristiansand_raster_stack_100m_25832.tif
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, from_bounds
+from shapely.geometry import shape
+
+from urban_climate.custom_datasets.linear_model_dataset import LinearModelDataSet
+from urban_climate.utils.predictor import LinearPredictor
+from urban_climate.utils.raster.windows import resolve_bands
+from urban_climate.utils.scenarios import check_scenarios, predict_scenarios
+
+logger = logging.getLogger(__name__)
+
+
+# decoded raster stacks, reused between starts of the service
+CACHE_DIR = "data/cache"
+
+
+def load_stack(
+    path: str, cache_path: Optional[str] = None, cache_dir: str = CACHE_DIR
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Loads a raster stack as a read-only memory-mapped array.
+
+    GeoTIFFs (usually compressed COGs) are decoded once into a ``.npy``
+    cache in ``cache_dir``, so later starts only map the file. The cache is
+    decoded into a temporary file and moved into place once complete, and a
+    ``.json`` sidecar records the size and modification time of the
+    GeoTIFF it was decoded from. The cache is decoded again if the sidecar
+    is missing or does not match the GeoTIFF.
+
+    Args:
+        path (str): Path of the GeoTIFF raster stack.
+        cache_path (str, optional): Path of the ``.npy`` cache. Defaults to
+        the GeoTIFF name, with a hash of its path, in ``cache_dir``.
+        cache_dir (str): Directory of the default cache, created if needed.
+        Defaults to ``data/cache`` (ignored by git).
+
+    Returns:
+        Tuple: Memory-mapped array of shape (bands, height, width) and
+        metadata (dict).
+    """
+    if cache_path is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+        cache_path = os.path.join(cache_dir, f"{stem}-{key}.npy")
+    signature_path = cache_path + ".json"
+    with rasterio.open(path) as src:
+        metadata = src.meta.copy()
+        metadata["descriptions"] = src.descriptions
+        stat = os.stat(path)
+        signature = {
+            "source": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "shape": [src.count, src.height, src.width],
+            "dtype": src.dtypes[0],
+        }
+        if _read_signature(signature_path) != signature or not os.path.exists(
+            cache_path
+        ):
+            _decode_stack(src, cache_path)
+            _write_atomic(signature_path, json.dumps(signature).encode())
+
+    array = np.load(cache_path, mmap_mode="r")
+    logger.info(f"Mapped raster stack {array.shape} from {cache_path}")
+    return array, metadata
+
+
+def _read_signature(path: str) -> Optional[Dict[str, Any]]:
+    """Source signature recorded with a cache, None if missing or invalid."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _decode_stack(src: Any, cache_path: str) -> None:
+    """Decodes an open raster into a ``.npy`` file, replaced when complete."""
+    logger.info(f"Decoding {src.name} into {cache_path}")
+    # an existing signature no longer describes the cache being replaced
+    if os.path.exists(cache_path + ".json"):
+        os.remove(cache_path + ".json")
+
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=".npy", dir=os.path.dirname(os.path.abspath(cache_path))
+    )
+    os.close(fd)
+    try:
+        array = np.lib.format.open_memmap(
+            tmp_path,
+            mode="w+",
+            dtype=src.dtypes[0],
+            shape=(src.count, src.height, src.width),
+        )
+        for _, window in src.block_windows(1):
+            rows, cols = window.toslices()
+            array[:, rows, cols] = src.read(window=window)
+        array.flush()
+        del array
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    """Writes a file through a temporary file in the same directory."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class PredictionService:
+    """Answers LST queries from a preloaded model and raster stack.
+
+    For each query, the feature bands of the pixels in the region are
+    gathered with one slice of the stack, and the baseline and all
+    scenarios are predicted in one batch (see
+    ``utils.scenarios.predict_scenarios``). The results of the most recent
+    queries are kept in an LRU cache.
+
+    Example:
+    ::
+
+        >>> service = PredictionService.from_files(model_path, stack_path)
+        >>> service.query(
+        ...     bbox=(441000, 6445000, 443000, 6447000),
+        ...     scenarios=[{"name": "no_canopy", "feature": "fractionCanopy",
+        ...                 "set": 0}],
+        ... )
+    """
+
+    def __init__(
+        self,
+        predictor: LinearPredictor,
+        raster_stack: Tuple[np.ndarray, Dict[str, Any]],
+        cache_size: int = 128,
+    ) -> None:
+        """Creates a new prediction service.
+
+        Args:
+            predictor (LinearPredictor): Trained model.
+            raster_stack (Tuple): Raster stack (numpy array or memmap) and
+            metadata (dict) with the model features as band descriptions.
+            cache_size (int): Number of query results kept. Defaults to 128.
+
+        Raises:
+            ValueError: if a model feature is not a band of the stack.
+        """
+        self.predictor = predictor
+        self.array, self.metadata = raster_stack
+        self.bands = (
+            np.array(resolve_bands(self.metadata["descriptions"], predictor.features))
+            - 1
+        )
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(
+        cls,
+        model_path: str,
+        stack_path: str,
+        cache_size: int = 128,
+        cache_dir: str = CACHE_DIR,
+    ) -> "PredictionService":
+        """Loads the model file and memory-maps the raster stack."""
+        predictor = LinearModelDataSet(model_path).load()
+        stack = load_stack(stack_path, cache_dir=cache_dir)
+        return cls(predictor, stack, cache_size=cache_size)
+
+    def query(
+        self,
+        bbox: Optional[Sequence[float]] = None,
+        polygon: Optional[Dict[str, Any]] = None,
+        scenarios: Sequence[Dict[str, Any]] = (),
+        values: bool = False,
+    ) -> Dict[str, Any]:
+        """Predicts the LST of a region for the baseline and scenarios.
+
+        Args:
+            bbox (Sequence[float], optional): (xmin, ymin, xmax, ymax) in the
+            CRS of the stack.
+            polygon (Dict, optional): GeoJSON geometry in the CRS of the
+            stack. Pixels with their centre inside are included.
+            scenarios (Sequence[Dict]): Scenario definitions (see
+            ``utils.scenarios.check_scenarios``).
+            values (bool): Include the row, column and predictions of each
+            pixel.
+
+        Raises:
+            ValueError: if a scenario is not valid.
+
+        Returns:
+            Dict: Number of pixels, summary of the baseline and of each
+            scenario (mean, and mean, min and max of the delta to the
+            baseline), and optionally the pixel values. A copy, so callers
+            can change it without changing the cached result.
+        """
+        scenarios = check_scenarios(list(scenarios), self.predictor.features)
+        key = json.dumps([bbox, polygon, scenarios, values], sort_keys=True)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return copy.deepcopy(self._cache[key])
+
+        result = self._predict(bbox, polygon, scenarios, values)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return copy.deepcopy(result)
+
+    def _region(
+        self, bbox: Optional[Sequence[float]], polygon: Optional[Dict[str, Any]]
+    ) -> Tuple[Window, Optional[np.ndarray]]:
+        """Window of the region, clipped to the grid, and polygon mask."""
+        height, width = self.array.shape[1:]
+        if polygon is not None:
+            bbox = shape(polygon).bounds
+        if bbox is None:
+            return Window(0, 0, width, height), None
+
+        window = from_bounds(*bbox, transform=self.metadata["transform"])
+        row0 = min(max(int(np.floor(window.row_off)), 0), height)
+        col0 = min(max(int(np.floor(window.col_off)), 0), width)
+        row1 = min(max(int(np.ceil(window.row_off + window.height)), row0), height)
+        col1 = min(max(int(np.ceil(window.col_off + window.width)), col0), width)
+        window = Window(col0, row0, col1 - col0, row1 - row0)
+        if polygon is None or window.width == 0 or window.height == 0:
+            return window, None
+
+        inside = geometry_mask(
+            [polygon],
+            out_shape=(window.height, window.width),
+            transform=rasterio.windows.transform(window, self.metadata["transform"]),
+            invert=True,
+        )
+        return window, inside
+
+    def _predict(
+        self,
+        bbox: Optional[Sequence[float]],
+        polygon: Optional[Dict[str, Any]],
+        scenarios: List[Dict[str, Any]],
+        values: bool,
+    ) -> Dict[str, Any]:
+        window, inside = self._region(bbox, polygon)
+        rows, cols = window.toslices()
+        block = np.asarray(self.array[self.bands, rows, cols], dtype="float32")
+        block = block.reshape(len(self.bands), -1)
+
+        # pixels in the region with data in all features
+        valid = ~np.isnan(block).any(axis=0)
+        nodata = self.metadata.get("nodata")
+        if nodata is not None:
+            valid &= (block != nodata).all(axis=0)
+        if inside is not None:
+            valid &= inside.ravel()
+        pixels = np.flatnonzero(valid)
+
+        features = self.predictor.features
+        y = predict_scenarios(self.predictor, block[:, pixels].T, features, scenarios)
+
+        result = {"pixels": len(pixels), "baseline": _summary(y[0])}
+        result["scenarios"] = {
+            scenario["name"]: {
+                **_summary(scenario_y),
+                "delta": _summary(scenario_y - y[0], ("mean", "min", "max")),
+            }
+            for scenario, scenario_y in zip(scenarios, y[1:])
+        }
+        if values:
+            row, col = np.divmod(pixels, max(window.width, 1))
+            result["values"] = {
+                "row": (row + window.row_off).tolist(),
+                "col": (col + window.col_off).tolist(),
+                "baseline": y[0].tolist(),
+                **{s["name"]: v.tolist() for s, v in zip(scenarios, y[1:])},
+            }
+        return result
+
+
+def _summary(
+    values: np.ndarray, statistics: Sequence[str] = ("mean",)
+) -> Dict[str, Optional[float]]:
+    """Summary statistics of predictions, None when there are no pixels."""
+    if len(values) == 0:
+        return {statistic: None for statistic in statistics}
+    return {
+        statistic: float(getattr(np, statistic)(values)) for statistic in statistics
+    }
+
+
+class Scenario(BaseModel):
+    name: str
+    feature: str
+    set: Optional[float] = None
+    scale: Optional[float] = None
+    add: Optional[float] = None
+    clip: Optional[Tuple[Optional[float], Optional[float]]] = None
+
+
+class Query(BaseModel):
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    polygon: Optional[Dict[str, Any]] = None
+    scenarios: List[Scenario] = []
+    values: bool = False
+
+
+class PredictRequest(BaseModel):
+    queries: List[Query]
+
+
+def create_app(service: PredictionService) -> FastAPI:
+    """Creates the FastAPI application of a prediction service.
+
+    Endpoints:
+
+    - ``GET /health``: model features, grid and cache size.
+    - ``POST /predict``: batch of queries (``{"queries": [...]}``), each
+      with an optional ``bbox`` or ``polygon``, ``scenarios`` and
+      ``values`` (see ``PredictionService.query``).
+
+    Args:
+        service (PredictionService): The loaded service.
+
+    Returns:
+        FastAPI: The application, e.g. for ``uvicorn`` or
+        ``fastapi.testclient.TestClient``.
+    """
+    app = FastAPI(title="urban-climate LST prediction")
+
+    @app.get("/health")
+    def health() -> Dict[str, Any]:
+        return {
+            "features": service.predictor.features,
+            "crs": str(service.metadata["crs"]),
+            "shape": list(service.array.shape),
+            "cached": len(service._cache),
+        }
+
+    @app.post("/predict")
+    def predict(request: PredictRequest) -> Dict[str, Any]:
+        try:
+            results = [
+                service.query(
+                    bbox=query.bbox,
+                    polygon=query.polygon,
+                    scenarios=[s.dict(exclude_none=True) for s in query.scenarios],
+                    values=query.values,
+                )
+                for query in request.queries
+            ]
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"results": results}
+
+    return app
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Runs the prediction service with uvicorn."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", required=True, help="LinearModelDataSet file")
+    parser.add_argument("--stack", required=True, help="GeoTIFF raster stack")
+    parser.add_argument("--cache-size", type=int, default=128)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    service = PredictionService.from_files(
+        args.model, args.stack, args.cache_size, args.cache_dir
+    )
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
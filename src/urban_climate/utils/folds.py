@@ -0,0 +1,48 @@
+""" Module for assigning pixels to spatial cross-validation folds. """
+
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def spatial_folds(
+    row: np.ndarray,
+    col: np.ndarray,
+    block_size: int = 10,
+    n_folds: int = 5,
+    random_state: Optional[int] = None,
+) -> np.ndarray:
+    """Assigns pixels to cross-validation folds by spatial block.
+
+    The grid is divided in square blocks of ``block_size`` pixels, and the
+    blocks (not the pixels) are shuffled and dealt to the folds, so
+    neighbouring, autocorrelated pixels are held out together.
+
+    Args:
+        row (np.ndarray): Row of each pixel in the grid.
+        col (np.ndarray): Column of each pixel in the grid.
+        block_size (int): Side of the blocks, in pixels. Defaults to 10.
+        n_folds (int): Number of folds. Defaults to 5.
+        random_state (int, optional): Seed of the block shuffle.
+
+    Raises:
+        ValueError: if there are fewer blocks than folds.
+
+    Returns:
+        np.ndarray: Fold (0 to ``n_folds`` - 1) of each pixel, int8.
+    """
+    row, col = np.asarray(row, dtype="int64"), np.asarray(col, dtype="int64")
+    block_cols = int(col.max()) // block_size + 1 if len(col) else 1
+    blocks, block = np.unique(
+        (row // block_size) * block_cols + col // block_size, return_inverse=True
+    )
+    if len(blocks) < n_folds:
+        raise ValueError(f"{len(blocks)} blocks cannot be split in {n_folds} folds")
+
+    rng = np.random.default_rng(random_state)
+    fold = rng.permutation(len(blocks)) % n_folds
+    logger.info(f"{len(blocks)} blocks of {block_size} pixels in {n_folds} folds")
+    return fold[block].astype("int8")
@@ -0,0 +1,326 @@
+""" Module for linear regression from sufficient statistics. """
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from rasterio.windows import Window
+from sklearn.linear_model import LinearRegression, Ridge
+
+from urban_climate.utils.parallel import imap_bounded
+from urban_climate.utils.raster.windows import resolve_bands
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LinearStats:
+    """Sufficient statistics of a linear regression of y on X.
+
+    The sums are additive, so statistics of chunks, blocks or folds can be
+    computed separately (e.g. in parallel) and merged with ``+``, or a
+    subset removed with ``-``. A fit or a score then costs a (features x
+    features) solve, independent of the number of rows.
+
+    Example:
+    ::
+
+        >>> stats = sum(LinearStats.from_arrays(X, y) for X, y in chunks)
+        >>> coef, intercept = stats.solve()
+
+    All sums are float64.
+    """
+
+    n: float
+    sx: np.ndarray  # sum of X, (features,)
+    sy: float  # sum of y
+    sxx: np.ndarray  # X.T @ X, (features, features)
+    sxy: np.ndarray  # X.T @ y, (features,)
+    syy: float  # y @ y
+
+    @classmethod
+    def zeros(cls, n_features: int) -> "LinearStats":
+        """Empty statistics, the neutral element of ``+``."""
+        return cls(
+            n=0.0,
+            sx=np.zeros(n_features),
+            sy=0.0,
+            sxx=np.zeros((n_features, n_features)),
+            sxy=np.zeros(n_features),
+            syy=0.0,
+        )
+
+    @classmethod
+    def from_arrays(
+        cls, X: np.ndarray, y: np.ndarray, skip_missing: bool = True
+    ) -> "LinearStats":
+        """Statistics of the rows of X (rows, features) and y (rows,).
+
+        Args:
+            X (np.ndarray): Features.
+            y (np.ndarray): Target.
+            skip_missing (bool): Skip rows with NaN in X or y, counting only
+            complete rows.
+
+        Returns:
+            LinearStats: The statistics.
+        """
+        X = np.asarray(X, dtype="float64")
+        y = np.asarray(y, dtype="float64")
+        if skip_missing:
+            complete = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+            if not complete.all():
+                X, y = X[complete], y[complete]
+        return cls(
+            n=float(len(y)),
+            sx=X.sum(axis=0),
+            sy=float(y.sum()),
+            sxx=X.T @ X,
+            sxy=X.T @ y,
+            syy=float(y @ y),
+        )
+
+    def __add__(self, other: "LinearStats") -> "LinearStats":
+        return LinearStats(
+            self.n + other.n,
+            self.sx + other.sx,
+            self.sy + other.sy,
+            self.sxx + other.sxx,
+            self.sxy + other.sxy,
+            self.syy + other.syy,
+        )
+
+    def __radd__(self, other: int) -> "LinearStats":
+        # support sum(), which starts from 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other: "LinearStats") -> "LinearStats":
+        return LinearStats(
+            self.n - other.n,
+            self.sx - other.sx,
+            self.sy - other.sy,
+            self.sxx - other.sxx,
+            self.sxy - other.sxy,
+            self.syy - other.syy,
+        )
+
+    def subset(self, columns: Sequence[int]) -> "LinearStats":
+        """Statistics of a subset of the features (by column index)."""
+        columns = np.asarray(columns)
+        return LinearStats(
+            self.n,
+            self.sx[columns],
+            self.sy,
+            self.sxx[np.ix_(columns, columns)],
+            self.sxy[columns],
+            self.syy,
+        )
+
+    def solve(
+        self, alpha: float = 0.0, fit_intercept: bool = True
+    ) -> Tuple[np.ndarray, float]:
+        """Least squares (ridge if ``alpha`` > 0) coefficients.
+
+        With an intercept, the normal equations are centred as in
+        scikit-learn, so the intercept is not penalized.
+
+        Args:
+            alpha (float): L2 penalty of the coefficients.
+            fit_intercept (bool): Fit an intercept.
+
+        Raises:
+            ValueError: if there are no rows.
+
+        Returns:
+            Tuple: Coefficients (features,) and intercept.
+        """
+        if self.n <= 0:
+            raise ValueError("No rows to fit.")
+        if fit_intercept:
+            mean_x, mean_y = self.sx / self.n, self.sy / self.n
+            gram = self.sxx - self.n * np.outer(mean_x, mean_x)
+            moment = self.sxy - self.n * mean_x * mean_y
+        else:
+            mean_x, mean_y = np.zeros_like(self.sx), 0.0
+            gram, moment = self.sxx, self.sxy
+
+        gram = gram + alpha * np.eye(len(gram))
+        # least squares solution, also for collinear features
+        coef = np.linalg.lstsq(gram, moment, rcond=None)[0]
+        return coef, float(mean_y - mean_x @ coef)
+
+    def score(
+        self, coef: np.ndarray, intercept: float, mean_y: Optional[float] = None
+    ) -> Tuple[float, float]:
+        """R^2 and RMSE of a linear model on these rows.
+
+        Args:
+            coef (np.ndarray): Coefficients (features,).
+            intercept (float): Intercept.
+            mean_y (float, optional): Reference mean of the R^2. Defaults to
+            the mean of y over these rows, as ``sklearn.metrics.r2_score``.
+
+        Returns:
+            Tuple: R^2 and RMSE.
+        """
+        # sum of squared residuals of y - (X @ coef + intercept), expanded
+        sse = (
+            self.syy
+            - 2 * (coef @ self.sxy + intercept * self.sy)
+            + coef @ self.sxx @ coef
+            + 2 * intercept * (coef @ self.sx)
+            + self.n * intercept**2
+        )
+        mean_y = self.sy / self.n if mean_y is None else mean_y
+        sst = self.syy - 2 * mean_y * self.sy + self.n * mean_y**2
+        sse = max(sse, 0.0)
+        return 1 - sse / sst, float(np.sqrt(sse / self.n))
+
+
+def stats_from_chunks(
+    chunks: Any,
+    features: Sequence[str],
+    target: str = "LST",
+    processes: Optional[int] = None,
+) -> LinearStats:
+    """Accumulates the statistics of a chunked pixel table.
+
+    The statistics of each chunk are computed independently, in parallel
+    with ``processes``, and merged, so only one chunk per process is in
+    memory. Rows with a missing feature or target are skipped.
+
+    Example:
+    ::
+
+        >>> chunks = catalog.load("gdf_model_input@chunks")
+        >>> stats = stats_from_chunks(chunks, features, processes=4)
+
+    Args:
+        chunks: Sized reader with ``read(index)`` returning a DataFrame, e.g.
+        ``PixelTableChunks`` (picklable when ``processes`` is set).
+        features (Sequence[str]): Feature columns.
+        target (str): Target column. Defaults to "LST".
+        processes (int, optional): Number of worker processes, None to read
+        the chunks in the calling process.
+
+    Returns:
+        LinearStats: Statistics of all chunks.
+    """
+    results = imap_bounded(
+        _chunk_stats_worker,
+        range(len(chunks)),
+        processes=processes,
+        initializer=_init_worker,
+        initargs=(chunks, list(features), target),
+    )
+    try:
+        stats = sum(results, LinearStats.zeros(len(features)))
+    finally:
+        # the file read in the calling process (processes=None)
+        if hasattr(chunks, "close"):
+            chunks.close()
+    logger.info(f"Statistics of {int(stats.n)} rows in {len(chunks)} chunks")
+    return stats
+
+
+def stats_from_raster(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    features: Sequence[str],
+    target: str = "LST",
+    valid: Optional[np.ndarray] = None,
+    strip_rows: int = 256,
+) -> LinearStats:
+    """Accumulates the statistics of a raster stack, strip by strip.
+
+    A lazily loaded stack (``LazyRaster``) is read one strip of
+    ``strip_rows`` rows at a time, so it is never read in full. Nodata
+    pixels are skipped.
+
+    Args:
+        input_raster (Tuple): Raster stack (numpy array or ``LazyRaster``)
+        and metadata (dict) with band descriptions.
+        features (Sequence[str]): Band descriptions of the features.
+        target (str): Band description of the target. Defaults to "LST".
+        valid (np.ndarray, optional): Boolean mask of shape (height, width),
+        True for pixels to include (e.g. the study area).
+        strip_rows (int): Number of rows read at once. Defaults to 256.
+
+    Returns:
+        LinearStats: Statistics of the valid pixels.
+    """
+    metadata = input_raster[1]
+    indexes = np.array(
+        resolve_bands(metadata["descriptions"], list(features) + [target])
+    )
+    nodata = metadata.get("nodata")
+    height, width = metadata["height"], metadata["width"]
+
+    stats = LinearStats.zeros(len(features))
+    for r0 in range(0, height, strip_rows):
+        r1 = min(r0 + strip_rows, height)
+        if hasattr(input_raster, "read"):
+            strip = input_raster.read(Window(0, r0, width, r1 - r0))
+        else:
+            strip = input_raster[0][:, r0:r1]
+        values = np.ma.filled(np.ma.asarray(strip, dtype="float64"), np.nan)
+        values = values[indexes - 1].reshape(len(indexes), -1)
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        if valid is not None:
+            values = values[:, valid[r0:r1].ravel()]
+        stats = stats + LinearStats.from_arrays(values[:-1].T, values[-1])
+
+    logger.info(f"Statistics of {int(stats.n)} of {height * width} pixels")
+    return stats
+
+
+def to_regressor(
+    stats: LinearStats,
+    features: Sequence[str],
+    alpha: float = 0.0,
+    fit_intercept: bool = True,
+) -> Union[LinearRegression, Ridge]:
+    """Solves the statistics into a fitted scikit-learn regressor.
+
+    The regressor can be used and saved like one fitted on the full table
+    (e.g. with the ``regressor`` pickle dataset).
+
+    Args:
+        stats (LinearStats): Statistics of the training rows.
+        features (Sequence[str]): Feature names, in the order of the
+        statistics.
+        alpha (float): L2 penalty, a ``Ridge`` model if > 0.
+        fit_intercept (bool): Fit an intercept.
+
+    Returns:
+        ``LinearRegression`` (or ``Ridge``) with the solved coefficients.
+    """
+    if alpha > 0:
+        model = Ridge(alpha=alpha, fit_intercept=fit_intercept)
+    else:
+        model = LinearRegression(fit_intercept=fit_intercept)
+    model.coef_, model.intercept_ = stats.solve(alpha, fit_intercept)
+    model.n_features_in_ = len(features)
+    model.feature_names_in_ = np.asarray(features, dtype=object)
+    return model
+
+
+_worker_chunks = None
+_worker_columns = None
+
+
+def _init_worker(chunks: Any, features: Sequence[str], target: str) -> None:
+    """Keeps the chunk reader (opened on first read) once per worker."""
+    global _worker_chunks, _worker_columns
+    _worker_chunks = chunks
+    _worker_columns = (features, target)
+
+
+def _chunk_stats_worker(index: int) -> LinearStats:
+    """Statistics of one chunk of the reader set by ``_init_worker``."""
+    features, target = _worker_columns
+    chunk = _worker_chunks.read(index)
+    return LinearStats.from_arrays(chunk[features].to_numpy(), chunk[target].to_numpy())
@@ -0,0 +1,328 @@
+""" Module for training and comparing models on a shared feature matrix. """
+
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from kedro.utils import load_obj
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+from urban_climate.utils.linear import LinearStats
+from urban_climate.utils.parallel import imap_bounded
+
+logger = logging.getLogger(__name__)
+
+# scores of each candidate and fold in spatial cross-validation
+CV_METRICS = ("r2", "rmse", "train_rows", "test_rows")
+
+
+def prepare_features(
+    data: pd.DataFrame,
+    features: Sequence[str],
+    target: str = "LST",
+    out_path: Optional[str] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Builds the cleaned float32 feature matrix of a pixel table, once.
+
+    Rows with a missing feature or target are dropped. The last column of
+    the matrix is the target, so features and target are shared as one
+    array. With ``out_path``, the matrix is a memory-mapped ``.npy`` file.
+
+    Args:
+        data (pd.DataFrame): Pixel table (see ``utils.raster.table``).
+        features (Sequence[str]): Feature columns.
+        target (str): Target column. Defaults to "LST".
+        out_path (str, optional): Path of a ``.npy`` file backing the matrix.
+
+    Returns:
+        Tuple: Matrix of shape (rows, features + 1), float32, and metadata
+        (dict) with the ``features``, the ``target`` and the ``pixel`` index
+        and spatial ``fold`` of each row (if the table has them).
+    """
+    columns = list(features) + [target]
+    valid = data[columns].notna().all(axis=1).to_numpy()
+    shape = (int(valid.sum()), len(columns))
+    if out_path is not None:
+        matrix = np.lib.format.open_memmap(
+            out_path, mode="w+", dtype="float32", shape=shape
+        )
+    else:
+        matrix = np.empty(shape, dtype="float32")
+    for i, column in enumerate(columns):
+        matrix[:, i] = data[column].to_numpy()[valid]
+    if isinstance(matrix, np.memmap):
+        matrix.flush()
+    logger.info(f"Feature matrix: {shape[0]} of {len(data)} rows, {columns}")
+
+    metadata = {"features": list(features), "target": target}
+    for column in ("pixel", "fold"):
+        if column in data:
+            metadata[column] = data[column].to_numpy()[valid]
+    return matrix, metadata
+
+
+def compare_models(
+    model_matrix: Tuple[np.ndarray, Dict[str, Any]],
+    candidates: Dict[str, Dict[str, Any]],
+    test_size: float = 0.2,
+    random_state: Optional[int] = None,
+    processes: Optional[int] = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Trains and scores candidate models in parallel on one feature matrix.
+
+    All candidates share the same train / test split. The matrix is not
+    pickled to the workers: each worker maps it read-only from a ``.npy``
+    file (the memory-mapped matrix itself, or a temporary copy written
+    once), so adding candidates does not add data preparation or copies.
+
+    Example:
+    ::
+
+        >>> candidates = {
+        ...     "linear": {"model": "sklearn.linear_model.LinearRegression"},
+        ...     "ridge": {
+        ...         "model": "sklearn.linear_model.Ridge",
+        ...         "kwargs": {"alpha": 10},
+        ...     },
+        ...     "no_dtm": {
+        ...         "model": "sklearn.linear_model.LinearRegression",
+        ...         "features": ["fractionBuilt", "fractionCanopy"],
+        ...     },
+        ... }
+        >>> scores, models = compare_models(model_matrix, candidates)
+
+    Args:
+        model_matrix (Tuple): Matrix and metadata (see ``prepare_features``).
+        candidates (Dict[str, Dict]): Candidates by name: ``model`` (import
+        path of a scikit-learn style regressor), optional ``kwargs`` and
+        ``features`` (a subset of the matrix features).
+        test_size (float): Fraction of rows held out for scoring.
+        random_state (int, optional): Seed of the split.
+        processes (int, optional): Number of worker processes, None to train
+        in the calling process.
+
+    Raises:
+        ValueError: if a candidate has no model or unknown features.
+
+    Returns:
+        Tuple: Scores (DataFrame indexed by candidate: r2, rmse, mae, rows
+        and fit seconds) and fitted models (dict by candidate).
+    """
+    matrix, metadata = model_matrix
+    features = metadata["features"]
+    columns = _candidate_columns(candidates, features)
+    jobs = [
+        (name, candidate, columns[name], 1) for name, candidate in candidates.items()
+    ]
+
+    # test rows in group 1, training rows in group 0
+    rng = np.random.default_rng(random_state)
+    test = np.zeros(len(matrix), dtype="int8")
+    test[rng.permutation(len(matrix))[: int(round(test_size * len(matrix)))]] = 1
+
+    with _shared_matrix(matrix) as path:
+        results = imap_bounded(
+            partial(_fit_candidate_worker, feature_names=features),
+            jobs,
+            processes=min(processes, len(jobs)) if processes else None,
+            initializer=_init_worker,
+            initargs=(path, test),
+        )
+        results = {name: (model, scores) for name, _, model, scores in results}
+
+    models = {name: results[name][0] for name in candidates}
+    scores = pd.DataFrame.from_dict(
+        {name: results[name][1] for name in candidates}, orient="index"
+    )
+    scores.index.name = "candidate"
+    logger.info(f"Model comparison:\n{scores}")
+    return scores, models
+
+
+def spatial_cross_validate(
+    model_matrix: Tuple[np.ndarray, Dict[str, Any]],
+    candidates: Dict[str, Dict[str, Any]],
+    processes: Optional[int] = None,
+) -> pd.DataFrame:
+    """Scores candidate models on each spatial fold, in parallel.
+
+    Each fold is held out in turn and the candidate trained on the others
+    (see ``utils.folds.spatial_folds``). Linear candidates (``LinearRegression`` and
+    ``Ridge``) are not refitted on the rows: the sufficient statistics of
+    each fold are computed once, in parallel, and every fold model is
+    solved and scored from the totals minus the held-out fold, so all
+    folds and linear candidates cost about one pass over the data. Other
+    candidates are fitted per fold, with folds spread over the processes.
+
+    Args:
+        model_matrix (Tuple): Matrix and metadata with the ``fold`` of each
+        row (see ``prepare_features``).
+        candidates (Dict[str, Dict]): Candidates by name (see
+        ``compare_models``).
+        processes (int, optional): Number of worker processes, None to run
+        in the calling process.
+
+    Raises:
+        ValueError: if the rows have no folds, or a candidate is not valid.
+
+    Returns:
+        pd.DataFrame: Scores per candidate and fold: r2, rmse, train_rows and
+        test_rows.
+    """
+    matrix, metadata = model_matrix
+    if "fold" not in metadata:
+        raise ValueError("The model matrix has no spatial folds.")
+    features = metadata["features"]
+    folds = np.asarray(metadata["fold"])
+    columns = _candidate_columns(candidates, features)
+
+    linear, other = {}, []
+    for name, candidate in candidates.items():
+        model = load_obj(candidate["model"])(**(candidate.get("kwargs") or {}))
+        if isinstance(model, (LinearRegression, Ridge)) and not model.positive:
+            linear[name] = model
+        else:
+            other.extend(
+                (name, candidate, columns[name], fold) for fold in np.unique(folds)
+            )
+
+    jobs = [("stats", fold) for fold in np.unique(folds)] if linear else []
+    jobs += [("fit", job) for job in other]
+    with _shared_matrix(matrix) as path:
+        results = list(
+            imap_bounded(
+                partial(_cv_worker, feature_names=features),
+                jobs,
+                processes=min(processes, len(jobs)) if processes else None,
+                initializer=_init_worker,
+                initargs=(path, folds),
+            )
+        )
+
+    rows = []
+    stats = {fold: payload for kind, fold, payload in results if kind == "stats"}
+    total = sum(stats.values())
+    for name, model in linear.items():
+        for fold, held_out in sorted(stats.items()):
+            train = (total - held_out).subset(columns[name])
+            test = held_out.subset(columns[name])
+            coef, intercept = train.solve(
+                getattr(model, "alpha", 0.0), model.fit_intercept
+            )
+            r2, rmse = test.score(coef, intercept)
+            rows.append((name, fold, r2, rmse, int(train.n), int(test.n)))
+    for kind, fold, (name, scores) in (r for r in results if r[0] == "fit"):
+        rows.append((name, fold) + tuple(scores[m] for m in CV_METRICS))
+
+    scores = pd.DataFrame(rows, columns=["candidate", "fold"] + list(CV_METRICS))
+    scores = scores.sort_values(["candidate", "fold"]).set_index(["candidate", "fold"])
+    logger.info(
+        f"Spatial cross-validation (mean of folds):\n"
+        f"{scores.groupby(level='candidate')[['r2', 'rmse']].mean()}"
+    )
+    return scores
+
+
+def _candidate_columns(
+    candidates: Dict[str, Dict[str, Any]], features: Sequence[str]
+) -> Dict[str, list]:
+    """Matrix columns of the features of each candidate.
+
+    Raises:
+        ValueError: if a candidate has no model or unknown features.
+    """
+    columns = {}
+    for name, candidate in candidates.items():
+        if "model" not in candidate:
+            raise ValueError(f"Candidate '{name}' has no model")
+        subset = candidate.get("features") or features
+        unknown = set(subset) - set(features)
+        if unknown:
+            raise ValueError(f"Candidate '{name}': unknown features {sorted(unknown)}")
+        columns[name] = [list(features).index(f) for f in subset]
+    return columns
+
+
+@contextmanager
+def _shared_matrix(matrix: np.ndarray) -> Iterator[str]:
+    """Path of a ``.npy`` file with the matrix, written once if needed."""
+    path = getattr(matrix, "filename", None)
+    if path is not None:
+        matrix.flush()
+        yield str(path)
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "model_matrix.npy")
+        np.save(path, matrix)
+        yield path
+
+
+_worker_matrix = None
+_worker_groups = None
+
+
+def _init_worker(path: str, groups: np.ndarray) -> None:
+    """Maps the shared matrix read-only once per worker process."""
+    global _worker_matrix, _worker_groups
+    _worker_matrix = np.load(path, mmap_mode="r")
+    _worker_groups = groups
+
+
+def _fit_candidate_worker(
+    job: Tuple[str, Dict[str, Any], Sequence[int], int],
+    feature_names: Sequence[str],
+) -> Tuple[str, int, Any, Dict[str, float]]:
+    """Fits and scores one candidate on the matrix mapped by ``_init_worker``.
+
+    The rows of group ``test_group`` are held out for scoring, the other
+    rows are used for training. The training and test rows of the
+    candidate's columns are each gathered from the mapped matrix in one
+    step, and wrapped in DataFrames without copying, so a job holds one
+    copy of its own rows and columns rather than of the whole matrix.
+    """
+    name, candidate, columns, test_group = job
+    names = [feature_names[i] for i in columns]
+    test = np.flatnonzero(_worker_groups == test_group)
+    train = np.flatnonzero(_worker_groups != test_group)
+
+    def gather(rows: np.ndarray) -> Tuple[pd.DataFrame, np.ndarray]:
+        X = _worker_matrix[np.ix_(rows, columns)]
+        return pd.DataFrame(X, columns=names, copy=False), _worker_matrix[rows, -1]
+
+    X_train, y_train = gather(train)
+    model = load_obj(candidate["model"])(**(candidate.get("kwargs") or {}))
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    seconds = time.perf_counter() - start
+    del X_train, y_train
+
+    X_test, y_test = gather(test)
+    y_pred = model.predict(X_test)
+    scores = {
+        "r2": r2_score(y_test, y_pred),
+        "rmse": mean_squared_error(y_test, y_pred) ** 0.5,
+        "mae": mean_absolute_error(y_test, y_pred),
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "fit_seconds": seconds,
+    }
+    logger.info(f"Candidate {name}: R^2 {scores['r2']:.3f}")
+    return name, test_group, model, scores
+
+
+def _cv_worker(job: Tuple[str, Any], feature_names: Sequence[str]) -> Tuple:
+    """Computes the linear statistics of a fold, or fits a candidate on it."""
+    kind, item = job
+    if kind == "stats":
+        rows = _worker_groups == item
+        block = np.asarray(_worker_matrix[rows])
+        return kind, item, LinearStats.from_arrays(block[:, :-1], block[:, -1])
+    name, test_group, _, scores = _fit_candidate_worker(item, feature_names)
+    return kind, test_group, (name, scores)
@@ -0,0 +1,61 @@
+""" Module for running tasks in a process pool with bounded memory. """
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def imap_bounded(
+    func: Callable[..., Any],
+    items: Iterable[Any],
+    processes: Optional[int] = None,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple = (),
+    max_pending: Optional[int] = None,
+) -> Iterator[Any]:
+    """Applies ``func`` to each item, optionally in a process pool.
+
+    Unlike ``Executor.map``, items are submitted lazily and results are
+    yielded as soon as they complete, so at most ``max_pending`` items and
+    results are held in memory at any time. Results are therefore yielded in
+    completion order; include a key (e.g. the window) in the result if the
+    order matters.
+
+    Args:
+        func (Callable): Picklable function of one item.
+        items (Iterable): Items to process, consumed lazily.
+        processes (int, optional): Number of worker processes, None to run in
+        the calling process (with ``initializer`` called once first).
+        initializer (Callable, optional): Called once per worker process.
+        initargs (Tuple): Arguments of ``initializer``.
+        max_pending (int, optional): Maximum number of items in flight.
+        Defaults to twice the number of processes.
+
+    Yields:
+        Any: ``func(item)`` for each item.
+    """
+    if not processes:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+
+    max_pending = max_pending or 2 * processes
+    with ProcessPoolExecutor(
+        processes, initializer=initializer, initargs=initargs
+    ) as executor:
+        items = iter(items)
+        pending = set()
+        while True:
+            for item in items:
+                pending.add(executor.submit(func, item))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,120 @@
+""" Module for a lightweight linear model predictor, using NumPy only. """
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LinearPredictor:
+    """Fitted linear model: feature names, coefficients and intercept.
+
+    A drop-in replacement of a fitted scikit-learn linear model for
+    prediction (``predict`` accepts arrays and DataFrames), which imports
+    NumPy only, so prediction jobs and services start fast. It is saved as a
+    small JSON or NPZ file with ``LinearModelDataSet``.
+
+    Example:
+    ::
+
+        >>> predictor = LinearPredictor.from_model(regressor)
+        >>> y = predictor.predict(X, batch_size=1_000_000)
+    """
+
+    features: List[str]
+    coef: np.ndarray
+    intercept: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.features = [str(f) for f in self.features]
+        self.coef = np.asarray(self.coef, dtype="float64").ravel()
+        self.intercept = float(self.intercept)
+        if len(self.coef) != len(self.features):
+            raise ValueError(
+                f"{len(self.coef)} coefficients for {len(self.features)} features"
+            )
+
+    @classmethod
+    def from_model(
+        cls, model: Any, metadata: Optional[Dict[str, Any]] = None
+    ) -> "LinearPredictor":
+        """Creates a predictor from a fitted scikit-learn linear model.
+
+        Args:
+            model: Fitted linear model with ``coef_``, ``intercept_`` and
+            ``feature_names_in_`` (fitted on a DataFrame).
+            metadata (Dict, optional): Training metadata to keep with the
+            model, e.g. the number of training rows.
+
+        Raises:
+            ValueError: if the model is not linear or has no feature names.
+
+        Returns:
+            LinearPredictor: The predictor.
+        """
+        if not hasattr(model, "coef_") or np.ndim(model.coef_) != 1:
+            raise ValueError(f"{type(model).__name__} is not a fitted linear model")
+        if not hasattr(model, "feature_names_in_"):
+            raise ValueError("The model was fitted without feature names.")
+        metadata = {
+            "model": f"{type(model).__module__}.{type(model).__name__}",
+            **(metadata or {}),
+        }
+        return cls(
+            list(model.feature_names_in_), model.coef_, model.intercept_, metadata
+        )
+
+    def predict(self, X: Any, batch_size: Optional[int] = None) -> np.ndarray:
+        """Predicts from a feature matrix, one matrix-vector product per batch.
+
+        Args:
+            X: Array of shape (rows, features), in the order of
+            ``features``, or a DataFrame with the feature columns.
+            batch_size (int, optional): Rows per product, to bound the float64
+            temporaries for large float32 inputs. Defaults to all rows.
+
+        Raises:
+            ValueError: if X has the wrong number of features.
+
+        Returns:
+            np.ndarray: Predictions (rows,), float64.
+        """
+        if hasattr(X, "columns"):
+            X = X[self.features].to_numpy()
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != len(self.features):
+            raise ValueError(
+                f"Expected (rows, {len(self.features)}) features, got {X.shape}"
+            )
+
+        batch_size = batch_size or max(len(X), 1)
+        out = np.empty(len(X), dtype="float64")
+        for start in range(0, len(X), batch_size):
+            batch = slice(start, start + batch_size)
+            np.dot(X[batch], self.coef, out=out[batch])
+        out += self.intercept
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable representation (see ``from_dict``)."""
+        return {
+            "features": self.features,
+            "coef": self.coef.tolist(),
+            "intercept": self.intercept,
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LinearPredictor":
+        """Creates a predictor from ``to_dict`` output."""
+        return cls(
+            data["features"],
+            data["coef"],
+            data["intercept"],
+            data.get("metadata") or {},
+        )
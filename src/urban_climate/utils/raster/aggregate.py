@@ -0,0 +1,184 @@
+""" Module for aggregating high-resolution rasters onto a coarser grid. """
+
+import logging
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.windows import Window
+
+from urban_climate.utils.raster.grid import RasterGrid
+
+logger = logging.getLogger(__name__)
+
+STATISTICS = ("sum", "mean")
+
+
+def aggregate_to_grid(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    grid: RasterGrid,
+    statistic: str = "mean",
+    band: int = 1,
+    strip_rows: int = 16,
+    nodata: float = -9999.0,
+    description: Optional[str] = None,
+    min_coverage: float = 0.5,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Aggregates a high-resolution raster onto a coarser grid.
+
+    Each grid cell covers a block of ``k x k`` source pixels, which are
+    reduced at once by reshaping the source to (rows, k, cols, k). The
+    source is read in strips of ``strip_rows`` grid rows, so a lazily loaded
+    raster (``LazyRaster``) is never read in full. Statistics:
+
+    - ``mean``: mean of the valid source pixels, i.e. the area-weighted
+      mean over the covered part of the cell (e.g. the canopy fraction of
+      each cell for a 0/1 canopy raster).
+    - ``sum``: area-weighted sum over the cell, i.e. the mean times the
+      cell area (e.g. m2 of canopy for a 0/1 canopy raster).
+
+    Cells only partly covered by valid source pixels (at the edge of the
+    raster or with nodata pixels) are estimated from the covered part, so
+    edge cells are not biased low. Cells with less than ``min_coverage`` of
+    their area covered are set to ``nodata``.
+
+    Example:
+    ::
+
+        >>> canopy_fraction = aggregate_to_grid(canopy_2m, grid, "mean")
+
+    Args:
+        input_raster (Tuple): Raster (numpy array or ``LazyRaster``) and
+        metadata (dict), in the grid CRS, with a resolution dividing the grid
+        resolution and pixel edges on the grid's cell edges.
+        grid (RasterGrid): Target grid.
+        statistic (str): "mean" or "sum". Defaults to "mean".
+        band (int): 1-based band of the raster to aggregate. Defaults to 1.
+        strip_rows (int): Number of grid rows aggregated at once. Defaults
+        to 16.
+        nodata (float): Nodata value of the output. Defaults to -9999.
+        description (str, optional): Band description of the output.
+        Defaults to the description of the source band.
+        min_coverage (float): Minimum fraction of a cell covered by valid
+        source pixels, in (0, 1]. Defaults to 0.5.
+
+    Raises:
+        ValueError: if the statistic or ``min_coverage`` is not valid, or if
+        the raster is not aligned with the grid (other CRS, resolution not
+        dividing the grid's, or offset pixel edges).
+
+    Returns:
+        Tuple: Aggregated raster (float32 numpy array of shape (1, height,
+        width)) and metadata (dict).
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"Unknown statistic '{statistic}', use one of {STATISTICS}")
+    if not 0 < min_coverage <= 1:
+        raise ValueError(f"min_coverage must be in (0, 1], got {min_coverage}")
+
+    metadata = input_raster[1]
+    factors, offsets = _block_layout(metadata, grid)
+    fy, fx = factors
+    row_off, col_off = offsets
+    cell_area = grid.resolution**2
+    min_count = max(math.ceil(min_coverage * fy * fx - 1e-9), 1)
+    logger.info(
+        f"Aggregating {fy}x{fx} pixel blocks onto {grid.shape} grid ({statistic})"
+    )
+
+    out = np.full((1, grid.height, grid.width), nodata, dtype="float32")
+    src_nodata = metadata.get("nodata")
+
+    for r0 in range(0, grid.height, strip_rows):
+        r1 = min(r0 + strip_rows, grid.height)
+        strip = _read_strip(
+            input_raster,
+            band,
+            Window(col_off, row_off + r0 * fy, grid.width * fx, (r1 - r0) * fy),
+        )
+        if src_nodata is not None:
+            strip[strip == src_nodata] = np.nan
+
+        # (rows, k, cols, k) blocks, reduced over the source pixels of a cell
+        blocks = strip.reshape(r1 - r0, fy, grid.width, fx)
+        count = np.count_nonzero(~np.isnan(blocks), axis=(1, 3))
+        # area-weighted sum over the covered area (count x pixel area) is the
+        # mean of the valid pixels, as all pixels have the same area
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.nansum(blocks, axis=(1, 3), dtype="float64") / count
+        if statistic == "sum":
+            values *= cell_area
+        out[0, r0:r1] = np.where(count >= min_count, values, nodata)
+
+    descriptions = metadata.get("descriptions") or [None] * metadata["count"]
+    aggregated_metadata = grid.to_meta(metadata)
+    aggregated_metadata.update(
+        {
+            "count": 1,
+            "dtype": "float32",
+            "nodata": nodata,
+            "descriptions": (description or descriptions[band - 1],),
+        }
+    )
+
+    return out, aggregated_metadata
+
+
+def _block_layout(
+    metadata: Dict[str, Any], grid: RasterGrid
+) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """Returns the block size and the offset of the grid origin, in pixels.
+
+    Raises:
+        ValueError: if the raster is not aligned with the grid.
+    """
+    transform = metadata["transform"]
+    if CRS.from_user_input(metadata["crs"]) != CRS.from_user_input(grid.crs):
+        raise ValueError(f"Raster CRS {metadata['crs']} differs from grid {grid.crs}")
+    if (transform.b, transform.d) != (0.0, 0.0):
+        raise ValueError("Rotated rasters cannot be aggregated.")
+
+    # block size and source pixel of the grid origin, along rows and columns
+    fy, fx = grid.resolution / -transform.e, grid.resolution / transform.a
+    row_off = (grid.ymax - transform.f) / transform.e
+    col_off = (grid.xmin - transform.c) / transform.a
+    if not all(
+        math.isclose(value, round(value), abs_tol=1e-6)
+        for value in (fy, fx, row_off, col_off)
+    ):
+        raise ValueError(
+            f"Raster with {transform.a} x {-transform.e} pixels is not aligned "
+            f"with the grid, warp it onto a {grid.resolution} / k grid first."
+        )
+    fy, fx, row_off, col_off = (round(v) for v in (fy, fx, row_off, col_off))
+
+    return (fy, fx), (row_off, col_off)
+
+
+def _read_strip(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]], band: int, window: Window
+) -> np.ndarray:
+    """Reads a window of one band as float32, NaN where outside the raster."""
+    metadata = input_raster[1]
+    strip = np.full((window.height, window.width), np.nan, dtype="float32")
+
+    # overlap of the window and the raster
+    row0, col0 = max(window.row_off, 0), max(window.col_off, 0)
+    row1 = min(window.row_off + window.height, metadata["height"])
+    col1 = min(window.col_off + window.width, metadata["width"])
+    if row1 <= row0 or col1 <= col0:
+        return strip
+
+    overlap = Window(col0, row0, col1 - col0, row1 - row0)
+    if hasattr(input_raster, "read"):
+        data = input_raster.read(overlap)[band - 1]
+    else:
+        rows, cols = overlap.toslices()
+        data = input_raster[0][band - 1, rows, cols]
+
+    strip[
+        row0 - window.row_off : row1 - window.row_off,
+        col0 - window.col_off : col1 - window.col_off,
+    ] = np.ma.filled(np.ma.asarray(data, dtype="float32"), np.nan)
+    return strip
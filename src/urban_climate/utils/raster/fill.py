@@ -0,0 +1,123 @@
+""" Module for filling nodata gaps of rasters from nearby valid pixels. """
+
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import ndimage
+
+from urban_climate.utils.raster.windows import resolve_bands
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("nearest", "idw")
+
+
+def fill_nodata(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    bands: Optional[Sequence[Union[int, str]]] = None,
+    method: str = "nearest",
+    radius: float = 2,
+    power: float = 2,
+    valid: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Fills nodata pixels from the valid pixels within a radius, in place.
+
+    Gaps are filled on the 2-D grid, so the value of a pixel comes from its
+    spatial neighbours:
+
+    - ``nearest``: value of the nearest valid pixel, from a Euclidean
+      distance transform.
+    - ``idw``: inverse-distance weighted mean (weights ``1 / d**power``) of
+      the valid pixels within ``radius``, computed as the ratio of two
+      convolutions (weighted values and weights).
+
+    Pixels further than ``radius`` pixels from any valid pixel stay nodata.
+
+    Example:
+    ::
+
+        >>> fill_nodata(raster_stack, bands=["DTM"], method="idw", radius=3)
+
+    Args:
+        input_raster (Tuple): Raster (numpy array of shape (bands, height,
+        width)) and metadata (dict).
+        bands (Sequence, optional): Bands to fill, by 1-based index or
+        description. Defaults to all bands.
+        method (str): "nearest" or "idw". Defaults to "nearest".
+        radius (float): Maximum distance of the source pixels, in pixels.
+        Defaults to 2.
+        power (float): Power of the inverse distance weights (``idw``).
+        valid (np.ndarray, optional): Boolean mask of shape (height, width),
+        True where gaps may be filled (e.g. the study area). Defaults to
+        everywhere.
+
+    Raises:
+        ValueError: if the method is unknown or the radius is less than 1.
+
+    Returns:
+        Tuple: The raster, with filled gaps, and metadata.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', use one of {METHODS}")
+    if radius < 1:
+        raise ValueError(f"Radius must be at least 1 pixel, got {radius}")
+
+    array, metadata = input_raster
+    descriptions = metadata.get("descriptions") or [None] * array.shape[0]
+    indexes = resolve_bands(descriptions, bands or range(1, array.shape[0] + 1))
+    nodata = metadata.get("nodata")
+
+    for index in indexes:
+        band = array[index - 1]
+        missing = _missing(band, nodata)
+        gaps = missing if valid is None else missing & valid
+        if not gaps.any() or missing.all():
+            continue
+
+        if method == "nearest":
+            distance, (rows, cols) = ndimage.distance_transform_edt(
+                missing, return_indices=True
+            )
+            fill = gaps & (distance <= radius)
+            band[fill] = band[rows[fill], cols[fill]]
+        else:
+            values, weights = _idw(band, missing, radius, power)
+            fill = gaps & (weights > 0)
+            band[fill] = values[fill] / weights[fill]
+
+        logger.info(
+            f"Band {descriptions[index - 1] or index}: filled {fill.sum()} of "
+            f"{gaps.sum()} nodata pixels ({method}, radius {radius})"
+        )
+
+    return array, metadata
+
+
+def _missing(band: np.ndarray, nodata: Optional[float]) -> np.ndarray:
+    """Boolean mask of the nodata (or NaN) pixels of a band."""
+    missing = np.zeros(band.shape, dtype=bool)
+    if band.dtype.kind == "f":
+        missing |= np.isnan(band)
+    if nodata is not None:
+        missing |= band == nodata
+    return missing
+
+
+def _idw(
+    band: np.ndarray, missing: np.ndarray, radius: float, power: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sums of the weighted values and of the weights of valid neighbours."""
+    r = int(radius)
+    dy, dx = np.mgrid[-r : r + 1, -r : r + 1]
+    distance = np.hypot(dy, dx)
+    kernel = np.zeros(distance.shape)
+    ring = (distance > 0) & (distance <= radius)
+    kernel[ring] = distance[ring] ** -power
+
+    present = (~missing).astype("float64")
+    values = np.where(missing, 0.0, band).astype("float64")
+    return (
+        ndimage.correlate(values, kernel, mode="constant"),
+        ndimage.correlate(present, kernel, mode="constant"),
+    )
@@ -0,0 +1,130 @@
+""" Module for defining a common target grid for all rasters. """
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.windows import Window
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RasterGrid:
+    """Target grid shared by all rasters: CRS, resolution, origin and shape.
+
+    The grid is snapped to multiples of the resolution, so grids derived from
+    different extents with the same CRS and resolution are always aligned.
+
+    Example:
+    ::
+
+        >>> grid = RasterGrid.from_bounds(study_area.total_bounds,
+        ...                               crs="EPSG:25832", resolution=100)
+        >>> grid.transform, grid.shape
+    """
+
+    crs: str
+    resolution: float
+    xmin: float
+    ymax: float
+    width: int
+    height: int
+
+    @classmethod
+    def from_bounds(
+        cls,
+        bounds: Tuple[float, float, float, float],
+        crs: Any,
+        resolution: float,
+    ) -> "RasterGrid":
+        """Creates the smallest snapped grid covering ``bounds``.
+
+        Args:
+            bounds (Tuple): (xmin, ymin, xmax, ymax) in ``crs``.
+            crs: CRS of the grid (e.g. "EPSG:25832").
+            resolution (float): Pixel size in units of ``crs``.
+
+        Returns:
+            RasterGrid: The grid.
+        """
+        xmin, ymin, xmax, ymax = bounds
+        xmin = math.floor(xmin / resolution) * resolution
+        ymin = math.floor(ymin / resolution) * resolution
+        xmax = math.ceil(xmax / resolution) * resolution
+        ymax = math.ceil(ymax / resolution) * resolution
+        grid = cls(
+            crs=CRS.from_user_input(crs).to_string(),
+            resolution=float(resolution),
+            xmin=float(xmin),
+            ymax=float(ymax),
+            width=int(round((xmax - xmin) / resolution)),
+            height=int(round((ymax - ymin) / resolution)),
+        )
+        logger.debug(f"Target grid: {grid}")
+        return grid
+
+    @property
+    def transform(self) -> Affine:
+        return Affine(self.resolution, 0.0, self.xmin, 0.0, -self.resolution, self.ymax)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return (
+            self.xmin,
+            self.ymax - self.height * self.resolution,
+            self.xmin + self.width * self.resolution,
+            self.ymax,
+        )
+
+    def window(self, meta: Dict[str, Any]) -> Optional[Window]:
+        """Returns the window of this grid covered by an aligned raster.
+
+        Args:
+            meta (Dict): Raster metadata (crs, transform, width, height).
+
+        Returns:
+            Window: Window of the grid (possibly extending beyond it) that
+            the raster covers, or None if the raster is not aligned with the
+            grid (other CRS, resolution, rotation or sub-pixel offset).
+        """
+        transform = meta["transform"]
+        if CRS.from_user_input(meta["crs"]) != CRS.from_user_input(self.crs):
+            return None
+        if (transform.b, transform.d) != (0.0, 0.0):
+            return None
+        if not (
+            math.isclose(transform.a, self.resolution)
+            and math.isclose(transform.e, -self.resolution)
+        ):
+            return None
+
+        col_off = (transform.c - self.xmin) / self.resolution
+        row_off = (self.ymax - transform.f) / self.resolution
+        if not (
+            math.isclose(col_off, round(col_off), abs_tol=1e-6)
+            and math.isclose(row_off, round(row_off), abs_tol=1e-6)
+        ):
+            return None
+        return Window(round(col_off), round(row_off), meta["width"], meta["height"])
+
+    def to_meta(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns a copy of ``meta`` describing a raster on this grid."""
+        grid_meta = meta.copy()
+        grid_meta.update(
+            {
+                "crs": self.crs,
+                "transform": self.transform,
+                "width": self.width,
+                "height": self.height,
+                "bounds": self.bounds,
+            }
+        )
+        return grid_meta
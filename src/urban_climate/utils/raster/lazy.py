@@ -0,0 +1,141 @@
+""" Module for lazy (header-first) reading of rasters using rasterio. """
+
+import logging
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from urban_climate.utils.raster.windows import read_window
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRaster:
+    """Raster handle that holds the header and reads pixels on first access.
+
+    The handle behaves like the ``(array, metadata)`` tuple returned by
+    ``GeoTIFFDataSet``: ``raster[1]`` returns the metadata without touching
+    the pixels, while ``raster[0]``, ``raster.data`` or tuple unpacking read
+    the pixels once and keep them.
+
+    Example:
+    ::
+
+        >>> raster.crs, raster.shape  # header only
+        >>> array, meta = raster  # reads the pixels
+    """
+
+    def __init__(
+        self,
+        opener: Callable[[], Any],
+        meta: Dict[str, Any],
+        window: Optional[Window] = None,
+        outside: Optional[np.ndarray] = None,
+        read_args: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Creates a new lazy raster handle.
+
+        Args:
+            opener (Callable): Returns a context manager yielding the open
+            raster (a rasterio dataset or ``WarpedVRT``).
+            meta (Dict): Metadata of the grid that is read (cropped if masked).
+            window (Window, optional): Window of the file to read. Defaults to
+            the full file.
+            outside (np.ndarray, optional): Boolean mask of shape (height,
+            width), True for pixels to set to nodata.
+            read_args (Dict, optional): ``indexes``, ``out_dtype`` and
+            ``masked`` options of ``read_window``.
+        """
+        self._opener = opener
+        self.meta = meta
+        self.window = window
+        self.outside = outside
+        self.read_args = read_args or {}
+        self._data = None
+
+    @property
+    def crs(self):
+        return self.meta["crs"]
+
+    @property
+    def transform(self):
+        return self.meta["transform"]
+
+    @property
+    def bounds(self):
+        return rasterio.transform.array_bounds(
+            self.meta["height"], self.meta["width"], self.meta["transform"]
+        )
+
+    @property
+    def descriptions(self):
+        return self.meta["descriptions"]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.meta["count"], self.meta["height"], self.meta["width"]
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> np.ndarray:
+        """Pixel data of shape (bands, height, width), read on first access."""
+        if self._data is None:
+            logger.info(f"Reading pixels: {self.shape}")
+            with self._opener() as src:
+                self._data = read_window(
+                    src, self.window, self.outside, **self.read_args
+                )
+        return self._data
+
+    def read(self, window: Optional[Window] = None) -> np.ndarray:
+        """Reads a window of the raster without keeping it.
+
+        Use this to stream rasters that are too large to load at once.
+
+        Args:
+            window (Window, optional): Window relative to ``meta`` (the crop
+            window if the raster was masked). Defaults to the full raster.
+
+        Returns:
+            np.ndarray: Data of shape (bands, rows, cols).
+        """
+        if window is None:
+            return self.data
+        outside = None
+        if self.outside is not None:
+            rows, cols = window.toslices()
+            outside = self.outside[rows, cols]
+        if self.window is not None:
+            window = Window(
+                window.col_off + self.window.col_off,
+                window.row_off + self.window.row_off,
+                window.width,
+                window.height,
+            )
+        with self._opener() as src:
+            return read_window(src, window, outside, **self.read_args)
+
+    def __len__(self) -> int:
+        return 2
+
+    def __getitem__(self, index: int) -> Any:
+        if index in (1, -1):
+            return self.meta
+        if index in (0, -2):
+            return self.data
+        raise IndexError("LazyRaster index out of range")
+
+    def __iter__(self) -> Iterator[Any]:
+        yield self.data
+        yield self.meta
+
+    def __repr__(self) -> str:
+        return (
+            f"LazyRaster(shape={self.shape}, crs={self.crs}, "
+            f"loaded={self.is_loaded})"
+        )
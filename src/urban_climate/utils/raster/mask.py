@@ -0,0 +1,243 @@
+""" Module for masking rasters with vector geometries using rasterio. """
+# Adapted from:
+# https://rasterio.readthedocs.io/en/stable/topics/masking-by-shapefile.html
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.errors import WindowError
+from rasterio.features import bounds, geometry_mask, geometry_window
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+from urban_climate.utils.raster.grid import RasterGrid
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MaskGeometries:
+    """Parsed geometries of a mask file."""
+
+    shapes: List[Dict[str, Any]]
+    bounds: Tuple[float, float, float, float]
+    crs_wkt: str
+
+
+@dataclass(frozen=True)
+class MaskWindow:
+    """Crop window and rasterized mask of a mask file on one raster grid.
+
+    ``outside`` is True for pixels of the crop window outside the geometries.
+    """
+
+    window: Window
+    transform: Affine
+    outside: np.ndarray
+
+
+class MaskCache:
+    """Process-wide LRU cache of mask geometries and crop windows.
+
+    Geometries are keyed by the absolute path and modification time of the
+    mask file, so an edited file is read again. Crop windows and rasterized
+    masks are additionally keyed by the raster grid (transform, width,
+    height), so rasters sharing a grid share one rasterization.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self.maxsize = maxsize
+        self._geometries: "OrderedDict[Tuple, MaskGeometries]" = OrderedDict()
+        self._windows: "OrderedDict[Tuple, MaskWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._geometries.clear()
+            self._windows.clear()
+
+    def _get(self, cache: OrderedDict, key: Tuple) -> Any:
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _put(self, cache: OrderedDict, key: Tuple, value: Any) -> None:
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+    @staticmethod
+    def _file_key(path: str) -> Tuple[str, float]:
+        path = os.path.abspath(path)
+        return path, os.path.getmtime(path)
+
+    def geometries(self, path: str, crs: Any = None) -> MaskGeometries:
+        """Returns the geometries of a mask file, reading it on a cache miss.
+
+        Args:
+            path (str): Path to the vector file (e.g. GeoJSON).
+            crs (optional): CRS to reproject the geometries to. Defaults to
+            the CRS of the file (which must then match the raster).
+
+        Returns:
+            MaskGeometries: Shapes, bounds and CRS (WKT) of the geometries.
+        """
+        key = self._file_key(path) + (str(crs) if crs else None,)
+        entry = self._get(self._geometries, key)
+        if entry is None:
+            if crs:
+                entry = self._reproject(self.geometries(path), crs)
+            else:
+                import fiona
+
+                logger.info(f"Reading mask geometries: {path}")
+                with fiona.open(path, "r") as shp:
+                    shapes = [dict(feature["geometry"]) for feature in shp]
+                    entry = MaskGeometries(shapes, tuple(shp.bounds), shp.crs_wkt)
+                logger.debug(f"Shapes: {shapes}")
+            self._put(self._geometries, key, entry)
+        return entry
+
+    @staticmethod
+    def _reproject(geometries: MaskGeometries, crs: Any) -> MaskGeometries:
+        """Reprojects geometries (GeoJSON without CRS is EPSG:4326)."""
+        src_crs = geometries.crs_wkt or "EPSG:4326"
+        shapes = [transform_geom(src_crs, crs, shape) for shape in geometries.shapes]
+        all_bounds = np.array([bounds(shape) for shape in shapes])
+        return MaskGeometries(
+            shapes,
+            (*all_bounds[:, :2].min(axis=0), *all_bounds[:, 2:].max(axis=0)),
+            CRS.from_user_input(crs).to_wkt(),
+        )
+
+    def window(self, path: str, src, crs: Any = None) -> MaskWindow:
+        """Returns the crop window and mask of a mask file on a raster grid.
+
+        Matches ``rasterio.mask.mask(src, shapes, crop=True)``.
+
+        Args:
+            path (str): Path to the vector file (e.g. GeoJSON).
+            src: Raster dataset (or any object with ``transform``, ``width``
+            and ``height``) defining the grid.
+            crs (optional): CRS of the grid, if the geometries have to be
+            reprojected (e.g. for a warped raster).
+
+        Raises:
+            ValueError: if the geometries do not overlap the raster.
+
+        Returns:
+            MaskWindow: Crop window, its transform and the outside mask.
+        """
+        key = self._file_key(path) + (
+            str(crs) if crs else None,
+            tuple(src.transform),
+            src.width,
+            src.height,
+        )
+        entry = self._get(self._windows, key)
+        if entry is None:
+            shapes = self.geometries(path, crs).shapes
+            try:
+                window = geometry_window(src, shapes)
+            except WindowError:
+                raise ValueError("Input shapes do not overlap raster.")
+            transform = window_transform(window, src.transform)
+            outside = geometry_mask(
+                shapes,
+                out_shape=(int(window.height), int(window.width)),
+                transform=transform,
+            )
+            outside.setflags(write=False)
+            entry = MaskWindow(window, transform, outside)
+            self._put(self._windows, key, entry)
+        return entry
+
+
+# shared by all datasets of the process
+mask_cache = MaskCache()
+
+
+def rasterize_mask(
+    shapes: Iterable[Dict[str, Any]], grid: RasterGrid, all_touched: bool = False
+) -> np.ndarray:
+    """Rasterizes geometries once onto a grid, as a boolean mask.
+
+    A pixel is inside if its centre is inside a geometry (or if it touches a
+    geometry with ``all_touched``), which matches clipping pixel centres with
+    ``gpd.clip``.
+
+    Args:
+        shapes (Iterable[Dict]): GeoJSON-like geometries in the grid CRS.
+        grid (RasterGrid): Target grid.
+        all_touched (bool): Include all pixels touched by the geometries.
+
+    Returns:
+        np.ndarray: Read-only boolean array of shape (height, width), True
+        for pixels inside the geometries.
+    """
+    inside = geometry_mask(
+        shapes,
+        out_shape=grid.shape,
+        transform=grid.transform,
+        all_touched=all_touched,
+        invert=True,
+    )
+    inside.setflags(write=False)
+    logger.info(f"Mask: {inside.sum()} of {inside.size} pixels inside")
+    return inside
+
+
+def apply_mask(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]], inside: np.ndarray
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Sets the pixels outside a mask to nodata, in place.
+
+    Rasters without a nodata value get one rather than a fill value that
+    could be valid data: float rasters get NaN (set in a copy of the
+    metadata), other rasters are returned as a masked array.
+
+    Args:
+        input_raster (Tuple): Raster (numpy array of shape (bands, height,
+        width)) and metadata (dict).
+        inside (np.ndarray): Boolean mask of shape (height, width), True for
+        pixels to keep (see ``rasterize_mask``).
+
+    Raises:
+        ValueError: if the mask and the raster have different shapes.
+
+    Returns:
+        Tuple: The raster, with pixels outside the mask set to nodata, or
+        masked for a masked array, and metadata.
+    """
+    array, metadata = input_raster
+    if array.shape[-2:] != inside.shape:
+        raise ValueError(
+            f"Mask shape {inside.shape} differs from raster shape {array.shape[-2:]}"
+        )
+
+    nodata = metadata.get("nodata")
+    if nodata is None and not isinstance(array, np.ma.MaskedArray):
+        if array.dtype.kind == "f":
+            nodata = np.nan
+            metadata = {**metadata, "nodata": nodata}
+        else:
+            array = np.ma.MaskedArray(array)
+
+    if isinstance(array, np.ma.MaskedArray):
+        array.mask = np.ma.getmaskarray(array) | ~inside
+    else:
+        np.copyto(array, nodata, where=~inside)
+    return array, metadata
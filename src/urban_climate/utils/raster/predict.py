@@ -0,0 +1,124 @@
+""" Module for applying a fitted model to the pixels of a raster stack. """
+
+import logging
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from urban_climate.utils.raster.windows import resolve_bands
+from urban_climate.utils.scenarios import check_scenarios, predict_scenarios
+
+logger = logging.getLogger(__name__)
+
+
+def valid_pixels(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    bands: Sequence[str],
+    valid: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Returns the flat indices of the pixels with data in all given bands.
+
+    Args:
+        input_raster (Tuple): Raster (numpy array of shape (bands, height,
+        width)) and metadata (dict).
+        bands (Sequence[str]): Band descriptions (or 1-based indexes).
+        valid (np.ndarray, optional): Boolean mask of shape (height, width),
+        True for pixels to consider (e.g. the study area).
+
+    Returns:
+        np.ndarray: Flat indices (``row * width + col``) of the valid pixels.
+    """
+    array, metadata = input_raster
+    indexes = [i - 1 for i in resolve_bands(metadata["descriptions"], bands)]
+    nodata = metadata.get("nodata")
+
+    mask = np.ones(array.shape[1:], dtype=bool) if valid is None else valid.copy()
+    for index in indexes:
+        if array.dtype.kind == "f":
+            mask &= ~np.isnan(array[index])
+        if nodata is not None:
+            mask &= array[index] != nodata
+    return np.flatnonzero(mask)
+
+
+def predict_raster_scenarios(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    model: Any,
+    features: Sequence[str],
+    scenarios: Sequence[Dict[str, Any]],
+    pixels: Optional[np.ndarray] = None,
+    batch_size: int = 65536,
+    nodata: float = -9999.0,
+) -> np.ndarray:
+    """Predicts the baseline and feature scenarios from a raster stack.
+
+    Each batch of the feature matrix is gathered once, and the baseline and
+    all scenarios are predicted from it in one call of the model (see
+    ``utils.scenarios.predict_scenarios``). The feature matrix is gathered
+    from the valid pixels only, in batches of ``batch_size`` pixels, so
+    memory stays bounded by the batch size rather than the number of
+    pixels. Predictions are scattered back into the grid; other pixels are
+    set to ``nodata``.
+
+    Example:
+    ::
+
+        >>> # baseline and counterfactual LST without canopy
+        >>> lst, no_canopy = predict_raster_scenarios(
+        ...     raster_stack, regressor, features,
+        ...     [{"name": "no_canopy", "feature": "fractionCanopy", "set": 0}],
+        ... )
+
+    Args:
+        input_raster (Tuple): Raster stack (numpy array of shape (bands,
+        height, width)) and metadata (dict) with band descriptions.
+        model: Fitted model with a scikit-learn style ``predict``.
+        features (Sequence[str]): Band descriptions of the features, in the
+        order the model was trained with.
+        scenarios (Sequence[Dict]): Scenario definitions (see
+        ``utils.scenarios.check_scenarios``).
+        pixels (np.ndarray, optional): Flat indices of the pixels to predict.
+        Defaults to the pixels with data in all feature bands (see
+        ``valid_pixels``).
+        batch_size (int): Number of pixels predicted at once (for all
+        scenarios).
+        nodata (float): Value of the pixels that are not predicted.
+
+    Raises:
+        ValueError: if a feature is not a band of the stack, or a scenario is
+        not valid.
+
+    Returns:
+        np.ndarray: Predictions of shape (1 + scenarios, height, width),
+        float32, the baseline first.
+    """
+    array, metadata = input_raster
+    _, height, width = array.shape
+    scenarios = check_scenarios(scenarios, features)
+    if pixels is None:
+        pixels = valid_pixels(input_raster, features)
+
+    out = np.full((1 + len(scenarios), height * width), nodata, dtype="float32")
+    for batch, X in _feature_batches(input_raster, features, pixels, batch_size):
+        out[:, batch] = predict_scenarios(model, X, features, scenarios)
+
+    logger.info(
+        f"Predicted {len(scenarios)} scenarios for {len(pixels)} of "
+        f"{height * width} pixels"
+    )
+    return out.reshape(-1, height, width)
+
+
+def _feature_batches(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    features: Sequence[str],
+    pixels: np.ndarray,
+    batch_size: int,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields batches of pixel indices and their (pixels, features) matrix."""
+    array, metadata = input_raster
+    indexes = np.array(resolve_bands(metadata["descriptions"], features)) - 1
+    flat = array.reshape(array.shape[0], -1)
+    for start in range(0, len(pixels), batch_size):
+        batch = pixels[start : start + batch_size]
+        yield batch, flat[indexes[:, np.newaxis], batch].T.astype("float32")
@@ -2,37 +2,88 @@
 # Adapted from:
 # https://github.com/rasterio/rasterio/blob/master/examples/reproject.py
 
-from typing import Any, Dict, Tuple
+import logging
+import math
+import os
+from functools import partial
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 import numpy as np
-from rasterio.warp import Resampling, calculate_default_transform, reproject
+import rasterio
+from rasterio.crs import CRS
+from rasterio.errors import WindowError
+from rasterio.warp import (
+    Resampling,
+    calculate_default_transform,
+    reproject,
+    transform_bounds,
+)
+from rasterio.windows import Window, from_bounds
+
+from urban_climate.utils.parallel import imap_bounded
+from urban_climate.utils.raster.grid import RasterGrid
+from urban_climate.utils.raster.windows import block_windows
+
+logger = logging.getLogger(__name__)
 
 
 def reproject_raster(
-    input_raster: Tuple[np.ndarray, Dict[str, Any]], dst_crs: str
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    dst_crs: Optional[str] = None,
+    resampling: str = "nearest",
+    num_threads: Optional[int] = 1,
+    warp_mem_limit: int = 0,
+    grid: Optional[RasterGrid] = None,
 ) -> Tuple[np.ndarray, Dict[str, Any]]:
-    """Reprojects the raster to the destination CRS.
+    """Reprojects the raster to the destination CRS or onto a target grid.
+
+    All bands are reprojected in a single warp into a preallocated
+    (bands, height, width) array. With a ``grid``, every raster is warped
+    directly onto that grid, and rasters already aligned with it (e.g. warped
+    while loading) are only cropped or padded. Without a grid, rasters already
+    in the destination CRS are returned unchanged.
 
     Args:
         raster (Tuple): Tuple containing the raw raster (numpy array) and the
         metadata (dict).
-        dst_crs (str): The destination CRS.
+        dst_crs (str, optional): The destination CRS, if no ``grid`` is given.
+        resampling (str): Name of the resampling method (e.g. "nearest",
+        "bilinear", "average"). Defaults to "nearest".
+        num_threads (int, optional): Number of warp threads, None for all
+        cores. Defaults to 1.
+        warp_mem_limit (int): Warp working memory in MB, 0 for GDAL's default.
+        grid (RasterGrid, optional): Target grid (CRS, transform and shape).
 
     Returns:
         Tuple: Reprojected raster (numpy array) and metadata (dict).
     """
 
-    # Unpack raster and metadata (image_dataset)
-    array, metadata = input_raster
+    # Unpack metadata first, so a lazy raster is only read after planning
+    metadata = input_raster[1]
 
-    # Calculate the transform for reprojection
-    transform, width, height = calculate_default_transform(
-        metadata["crs"],
-        dst_crs,
-        metadata["width"],
-        metadata["height"],
-        *metadata["bounds"]
-    )
+    if grid is not None:
+        window = grid.window(metadata)
+        if window is not None:
+            logger.info(f"Raster aligned with target grid at {window}.")
+            return align_to_grid(input_raster, grid, window)
+
+        dst_crs = grid.crs
+        transform, width, height = grid.transform, grid.width, grid.height
+
+    # rasters warped while loading are already in the destination CRS
+    elif CRS.from_user_input(metadata["crs"]) == CRS.from_user_input(dst_crs):
+        logger.info(f"Raster already in {dst_crs}, skipping reprojection.")
+        return input_raster
+
+    else:
+        # Calculate the transform for reprojection
+        transform, width, height = calculate_default_transform(
+            metadata["crs"],
+            dst_crs,
+            metadata["width"],
+            metadata["height"],
+            *metadata["bounds"],
+        )
 
     # Create new dict for reprojected metadata by copying the existing one
     reprojected_metadata = metadata.copy()
@@ -42,28 +93,270 @@ def reproject_raster(
     reprojected_metadata["transform"] = transform
     reprojected_metadata["width"] = width
     reprojected_metadata["height"] = height
-    # print(reprojected_metadata)
-
-    # reproject stack of numpy arrays
-    reprojected_arrays = []
-    for i in range(1, metadata["count"] + 1):
-        # create empty array
-        reprojected_array = np.empty((height, width), dtype=array.dtype)
-        # fill empty array with reprojected data
-        reproject(
-            source=array[i - 1],
-            destination=reprojected_array,
-            src_transform=metadata["transform"],
-            src_crs=metadata["crs"],
-            dst_transform=transform,
-            dst_crs=dst_crs,
-            resampling=Resampling.nearest,
-        )
-        reprojected_arrays.append(reprojected_array)
+    if grid is not None:
+        reprojected_metadata["bounds"] = grid.bounds
 
-    print(reprojected_metadata["descriptions"])
+    # reproject all bands at once into a preallocated array
+    array = input_raster[0]
+    reprojected_array = np.empty((array.shape[0], height, width), dtype=array.dtype)
+    reproject(
+        source=array,
+        destination=reprojected_array,
+        src_transform=metadata["transform"],
+        src_crs=metadata["crs"],
+        src_nodata=metadata.get("nodata"),
+        dst_transform=transform,
+        dst_crs=dst_crs,
+        dst_nodata=metadata.get("nodata"),
+        resampling=Resampling[resampling],
+        num_threads=num_threads or os.cpu_count(),
+        warp_mem_limit=warp_mem_limit,
+    )
+    logger.info(f"Reprojected {metadata['descriptions']}: {reprojected_array.shape}")
 
     # repack into Tuple
-    reprojected_raster = np.stack(reprojected_arrays), reprojected_metadata
+    reprojected_raster = reprojected_array, reprojected_metadata
 
     return reprojected_raster
+
+
+def align_to_grid(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    grid: RasterGrid,
+    window: Window,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Crops or pads a raster that is aligned with the grid onto the grid.
+
+    No resampling is needed: pixels are copied, and a raster that already
+    covers exactly the grid is returned without copying. Padding is set to
+    the raster nodata, or to NaN (the largest value of the type for integer
+    rasters) if it has none.
+
+    Args:
+        input_raster (Tuple): Raster (numpy array) and metadata (dict).
+        grid (RasterGrid): Target grid.
+        window (Window): Window of the grid covered by the raster (see
+        ``RasterGrid.window``).
+
+    Returns:
+        Tuple: Raster on the grid (numpy array) and metadata (dict).
+    """
+    metadata = input_raster[1]
+    grid_metadata = grid.to_meta(metadata)
+    if window == Window(0, 0, grid.width, grid.height):
+        return input_raster[0], grid_metadata
+
+    array = input_raster[0]
+    nodata = _fill_value(metadata.get("nodata"), array.dtype)
+    grid_metadata["nodata"] = nodata
+    out = np.full((array.shape[0], grid.height, grid.width), nodata, dtype=array.dtype)
+
+    # overlap of the raster and the grid, in grid and in raster pixels
+    row0, col0 = max(window.row_off, 0), max(window.col_off, 0)
+    row1 = min(window.row_off + window.height, grid.height)
+    col1 = min(window.col_off + window.width, grid.width)
+    if row1 > row0 and col1 > col0:
+        out[:, row0:row1, col0:col1] = array[
+            :,
+            row0 - window.row_off : row1 - window.row_off,
+            col0 - window.col_off : col1 - window.col_off,
+        ]
+    return out, grid_metadata
+
+
+def reproject_tiled(
+    src_path: str,
+    dst_path: str,
+    grid: RasterGrid,
+    resampling: str = "nearest",
+    tile_size: int = 512,
+    margin: int = 2,
+    processes: Optional[int] = None,
+    compress: str = "deflate",
+) -> Dict[str, Any]:
+    """Reprojects a raster file onto a grid, tile by tile (out-of-core).
+
+    The destination grid is split into ``tile_size`` tiles. For each tile,
+    only the source window covering it (plus ``margin`` pixels for the
+    resampling kernel) is read, reprojected and written straight into a tiled
+    GeoTIFF, so peak memory is bounded by the tile size rather than the raster
+    size. With ``processes``, tiles are reprojected in a process pool and
+    written by the calling process; at most two tiles per worker are in
+    flight at any time. Pixels not covered by the source are set to the
+    nodata of the output: the source nodata, or NaN for float rasters (the
+    largest value of the type for integer rasters) if the source has none.
+
+    Example:
+    ::
+
+        >>> grid = RasterGrid.from_bounds(bounds, "EPSG:25832", 10)
+        >>> reproject_tiled("data/01_raw/dtm.tif", "data/02_intermediate/dtm.tif",
+        ...                 grid, resampling="bilinear", processes=4)
+
+    Args:
+        src_path (str): Path of the source raster (any CRS).
+        dst_path (str): Path of the tiled GeoTIFF to write.
+        grid (RasterGrid): Target grid.
+        resampling (str): Name of the resampling method. Defaults to "nearest".
+        tile_size (int): Tile (and internal block) size in pixels, a multiple
+        of 16. Defaults to 512.
+        margin (int): Extra source pixels read around each tile. Defaults to 2.
+        processes (int, optional): Number of worker processes, None to
+        reproject in the calling process. Defaults to None.
+        compress (str): Compression of the output. Defaults to "deflate".
+
+    Raises:
+        ValueError: if ``tile_size`` is not a positive multiple of 16.
+
+    Returns:
+        Dict: Metadata of the written raster.
+    """
+    if tile_size <= 0 or tile_size % 16:
+        raise ValueError(f"tile_size must be a multiple of 16, got {tile_size}")
+
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        descriptions = src.descriptions
+    nodata = _fill_value(profile.get("nodata"), profile["dtype"])
+    profile.update(
+        driver="GTiff",
+        crs=grid.crs,
+        transform=grid.transform,
+        width=grid.width,
+        height=grid.height,
+        tiled=True,
+        blockxsize=tile_size,
+        blockysize=tile_size,
+        compress=compress,
+        nodata=nodata,
+        BIGTIFF="IF_SAFER",
+    )
+    tiles = [
+        window
+        for window, _ in block_windows(
+            Window(0, 0, grid.width, grid.height), (tile_size, tile_size)
+        )
+    ]
+    options = {
+        "grid": grid,
+        "resampling": resampling,
+        "margin": margin,
+        "nodata": nodata,
+    }
+    logger.info(f"Reprojecting {src_path} onto {grid} in {len(tiles)} tiles")
+
+    with rasterio.open(dst_path, "w", **profile) as dst:
+        dst.descriptions = descriptions
+        for window, array in _reproject_tiles(src_path, tiles, options, processes):
+            dst.write(array, window=window)
+
+    metadata = grid.to_meta(profile)
+    metadata["descriptions"] = descriptions
+    return metadata
+
+
+def _fill_value(nodata: Optional[float], dtype: Any) -> float:
+    """Nodata value for pixels not covered by a source raster.
+
+    The source nodata if it has one, else NaN for float rasters and the
+    largest value of the type for integer rasters, rather than 0, which is
+    usually valid data.
+    """
+    if nodata is not None:
+        return nodata
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.nan
+    return np.iinfo(dtype).max
+
+
+def _reproject_tiles(
+    src_path: str,
+    tiles: list,
+    options: Dict[str, Any],
+    processes: Optional[int],
+) -> Iterator[Tuple[Window, np.ndarray]]:
+    """Yields reprojected tiles, computed in-process or in a process pool."""
+    if not processes:
+        with rasterio.open(src_path) as src:
+            for window in tiles:
+                yield window, _reproject_tile(src, window, **options)
+        return
+
+    yield from imap_bounded(
+        partial(_reproject_tile_worker, options=options),
+        tiles,
+        processes,
+        initializer=_init_worker,
+        initargs=(src_path,),
+    )
+
+
+_worker_src = None
+
+
+def _init_worker(src_path: str) -> None:
+    """Opens the source raster once per worker process."""
+    global _worker_src
+    _worker_src = rasterio.open(src_path)
+
+
+def _reproject_tile_worker(
+    window: Window, options: Dict[str, Any]
+) -> Tuple[Window, np.ndarray]:
+    """Reprojects one tile with the source opened by ``_init_worker``."""
+    return window, _reproject_tile(_worker_src, window, **options)
+
+
+def _reproject_tile(
+    src,
+    window: Window,
+    grid: RasterGrid,
+    resampling: str,
+    margin: int,
+    nodata: float,
+) -> np.ndarray:
+    """Reprojects the source pixels covering one tile of the grid.
+
+    Args:
+        src: Open rasterio dataset.
+        window (Window): Tile of the grid.
+        grid (RasterGrid): Target grid.
+        resampling (str): Name of the resampling method.
+        margin (int): Extra source pixels read around the tile.
+        nodata (float): Value of the tile pixels not covered by the source.
+
+    Returns:
+        np.ndarray: Tile data of shape (bands, rows, cols).
+    """
+    tile_transform = rasterio.windows.transform(window, grid.transform)
+    tile_bounds = rasterio.windows.bounds(window, grid.transform)
+    tile = np.full(
+        (src.count, int(window.height), int(window.width)), nodata, dtype=src.dtypes[0]
+    )
+
+    # source window covering the tile, grown by the margin and clipped
+    src_bounds = transform_bounds(grid.crs, src.crs, *tile_bounds)
+    src_window = from_bounds(*src_bounds, transform=src.transform)
+    col0 = math.floor(src_window.col_off) - margin
+    row0 = math.floor(src_window.row_off) - margin
+    col1 = math.ceil(src_window.col_off + src_window.width) + margin
+    row1 = math.ceil(src_window.row_off + src_window.height) + margin
+    src_window = Window(col0, row0, col1 - col0, row1 - row0)
+    try:
+        src_window = src_window.intersection(Window(0, 0, src.width, src.height))
+    except WindowError:
+        return tile  # tile outside the source
+
+    reproject(
+        source=src.read(window=src_window),
+        destination=tile,
+        src_transform=src.window_transform(src_window),
+        src_crs=src.crs,
+        src_nodata=src.nodata,
+        dst_transform=tile_transform,
+        dst_crs=grid.crs,
+        dst_nodata=nodata,
+        resampling=Resampling[resampling],
+    )
+    return tile
@@ -1,46 +1,149 @@
 """ Module for resampling rasters using numpy. """
 # Adapted from: https://rasterio.readthedocs.io/en/stable/topics/resampling.html
 import logging
-from typing import Any, Dict, Tuple
+import math
+from functools import partial
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 import numpy as np
-from scipy.ndimage import zoom
+from scipy.ndimage import affine_transform
+
+from urban_climate.utils.parallel import imap_bounded
 
 logger = logging.getLogger(__name__)
 
 
 def resample_raster(
-    input_raster: Tuple[np.ndarray, Dict[str, Any]], scaling_factor: float
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    scaling_factor: float,
+    order: int = 1,
+    block_size: int = 2048,
+    halo: Optional[int] = None,
+    processes: Optional[int] = None,
+    out_path: Optional[str] = None,
 ) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Resamples the raster by a scaling factor, block by block.
+
+    Produces the same grid as ``scipy.ndimage.zoom(array, (1, f, f),
+    order=order, mode="nearest")``, but the output is split into blocks of
+    ``block_size`` rows and columns. Each block is interpolated from the
+    input window it covers, grown by a ``halo`` of pixels for the
+    interpolation kernel, so only one block is held in memory per worker.
+    Blocks are written into a preallocated array, or into a memory-mapped
+    ``.npy`` file if ``out_path`` is given, for outputs larger than memory.
+
+    Args:
+        input_raster (Tuple): Raster (numpy array of shape (bands, rows,
+        cols)) and metadata (dict). The metadata is not modified.
+        scaling_factor (float): Factor applied to the number of rows and
+        columns (e.g. 100 to go from 100 m to 1 m pixels).
+        order (int): Spline order, 0 (nearest) or 1 (bilinear) are exact,
+        higher orders are prefiltered per block. Defaults to 1.
+        block_size (int): Output block size in pixels. Defaults to 2048.
+        halo (int, optional): Extra input pixels around each block. Defaults
+        to the kernel size of ``order`` (plus 8 pixels for the prefilter of
+        orders > 1).
+        processes (int, optional): Number of worker processes, None to
+        resample in the calling process. Defaults to None.
+        out_path (str, optional): Path of a ``.npy`` file backing the output.
+
+    Returns:
+        Tuple: Resampled raster (numpy array or memmap) and new metadata.
+    """
     array, metadata = input_raster
+    bands, height, width = array.shape
+    out_height = int(round(height * scaling_factor))
+    out_width = int(round(width * scaling_factor))
+    if halo is None:
+        halo = order if order <= 1 else order + 8
+
+    # input coordinate step per output pixel, as in scipy.ndimage.zoom
+    steps = (
+        (height - 1) / (out_height - 1) if out_height > 1 else 1.0,
+        (width - 1) / (out_width - 1) if out_width > 1 else 1.0,
+    )
+
+    out_shape = (bands, out_height, out_width)
+    if out_path is not None:
+        out = np.lib.format.open_memmap(
+            out_path, mode="w+", dtype=array.dtype, shape=out_shape
+        )
+    else:
+        out = np.empty(out_shape, dtype=array.dtype)
 
-    # Resample (nearest neighbour interpolation)
-    scaling_factors = (1, scaling_factor, scaling_factor)
-    resampled_array = zoom(array, scaling_factors, order=1, mode="nearest")
+    blocks = _blocks(array, out_shape, steps, block_size, halo)
+    resample = partial(_resample_block, steps=steps, order=order)
+    for (rows, cols), block in imap_bounded(resample, blocks, processes):
+        out[:, rows, cols] = block
+    if isinstance(out, np.memmap):
+        out.flush()
 
     # log array resampling
-    logger.info("RESAMPLE ARRAY:")
-    logger.info(f"Array Shape: {array.shape}")
-    logger.info(f"Resampled Array Shape: {resampled_array.shape}")
-    # shape = (1, 64000, 50900)
+    logger.info(f"Resampled array from {array.shape} to {out.shape}")
 
     # scale image transform
     scaled_transform = metadata["transform"] * metadata["transform"].scale(
-        (metadata["width"] / resampled_array.shape[-1]),  # column
-        (metadata["height"] / resampled_array.shape[-2]),  # rows
+        (width / out_width),  # column
+        (height / out_height),  # rows
     )
-    # log transform rescaling
-    logger.info("RESCALE TRANSFROM:")
-    logger.info(f"Transform: {metadata['transform']}")
-    logger.info(f"Scaled Transform: {scaled_transform}")
-
-    # update metadata
-    new_metadata = metadata
-    new_metadata["width"] = resampled_array.shape[2]  # column
-    new_metadata["height"] = resampled_array.shape[1]  # rows
+
+    # new metadata, the input metadata is left untouched
+    new_metadata = metadata.copy()
+    new_metadata["width"] = out_width  # column
+    new_metadata["height"] = out_height  # rows
     new_metadata["transform"] = scaled_transform
-    new_metadata["descriptions"] = "Band 1"
 
-    resampled_raster = (resampled_array, new_metadata)
+    resampled_raster = (out, new_metadata)
 
     return resampled_raster
+
+
+def _blocks(
+    array: np.ndarray,
+    out_shape: Tuple[int, int, int],
+    steps: Tuple[float, float],
+    block_size: int,
+    halo: int,
+) -> Iterator[Tuple[Tuple[slice, slice], np.ndarray, Tuple[float, float]]]:
+    """Yields output blocks with the input window (and its origin) they need."""
+    _, out_height, out_width = out_shape
+    _, height, width = array.shape
+
+    for r0 in range(0, out_height, block_size):
+        r1 = min(r0 + block_size, out_height)
+        in_r0 = max(math.floor(r0 * steps[0]) - halo, 0)
+        in_r1 = min(math.ceil((r1 - 1) * steps[0]) + halo + 1, height)
+        for c0 in range(0, out_width, block_size):
+            c1 = min(c0 + block_size, out_width)
+            in_c0 = max(math.floor(c0 * steps[1]) - halo, 0)
+            in_c1 = min(math.ceil((c1 - 1) * steps[1]) + halo + 1, width)
+
+            # offset of the block's first output pixel in the input window
+            offset = (r0 * steps[0] - in_r0, c0 * steps[1] - in_c0)
+            yield (
+                (slice(r0, r1), slice(c0, c1)),
+                array[:, in_r0:in_r1, in_c0:in_c1],
+                offset,
+            )
+
+
+def _resample_block(
+    block: Tuple[Tuple[slice, slice], np.ndarray, Tuple[float, float]],
+    steps: Tuple[float, float],
+    order: int,
+) -> Tuple[Tuple[slice, slice], np.ndarray]:
+    """Interpolates one output block from its input window."""
+    (rows, cols), window, offset = block
+    shape = (rows.stop - rows.start, cols.stop - cols.start)
+    out = np.empty((window.shape[0],) + shape, dtype=window.dtype)
+    for band in range(window.shape[0]):
+        affine_transform(
+            window[band],
+            np.diag(steps),
+            offset=offset,
+            output_shape=shape,
+            output=out[band],
+            order=order,
+            mode="nearest",
+        )
+    return (rows, cols), out
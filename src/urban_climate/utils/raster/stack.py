@@ -0,0 +1,134 @@
+""" Module for stacking rasters on a common grid into one multi-band raster. """
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from rasterio.crs import CRS
+
+logger = logging.getLogger(__name__)
+
+
+def stack_rasters(
+    rasters: Iterable[Tuple[np.ndarray, Dict[str, Any]]],
+    dtype: Optional[str] = None,
+    out_path: Optional[str] = None,
+    nodata: Optional[float] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Stacks rasters on the same grid along the band axis.
+
+    The (bands, height, width) output is allocated once, after checking the
+    metadata of all rasters, and each raster is copied into its band slot in
+    turn, so peak memory is one stack (plus one input) rather than two
+    stacks as with ``np.concatenate``. Rasters loaded lazily
+    (``LazyRaster``) are only read when copied. With ``out_path``, the stack
+    is a memory-mapped ``.npy`` file, for grids larger than memory.
+
+    Band descriptions are taken from the metadata of the inputs. The nodata
+    pixels of every input (its own nodata value, masked pixels and NaN) are
+    set to the nodata value of the stack: ``nodata``, or else the first
+    nodata value of the inputs.
+
+    Args:
+        rasters (Iterable[Tuple]): Rasters (numpy array and metadata) on the
+        same grid, in band order.
+        dtype (str, optional): Data type of the stack. Defaults to the
+        smallest type all inputs can be cast to.
+        out_path (str, optional): Path of a ``.npy`` file backing the stack.
+        nodata (float, optional): Nodata value of the stack. Defaults to the
+        first nodata value of the inputs.
+
+    Raises:
+        ValueError: if there are no rasters, if their CRS or shape differ, or
+        if the nodata value does not fit the data type of the stack.
+
+    Returns:
+        Tuple: Stacked raster (numpy array or memmap) and metadata (dict).
+    """
+    rasters = list(rasters)
+    if not rasters:
+        raise ValueError("No rasters to stack.")
+
+    # unpack metadata (header only if the rasters are loaded lazily)
+    metadata = [raster[1] for raster in rasters]
+    _check_grid(metadata)
+
+    counts = [meta["count"] for meta in metadata]
+    dtype = np.dtype(dtype or np.result_type(*[meta["dtype"] for meta in metadata]))
+    shape = (sum(counts), metadata[0]["height"], metadata[0]["width"])
+    if nodata is None:
+        nodata = next(
+            (meta["nodata"] for meta in metadata if meta.get("nodata") is not None),
+            None,
+        )
+    if nodata is not None and not _fits(nodata, dtype):
+        raise ValueError(f"Nodata value {nodata} does not fit the stack {dtype}.")
+    if out_path is not None:
+        stack = np.lib.format.open_memmap(out_path, mode="w+", dtype=dtype, shape=shape)
+    else:
+        stack = np.empty(shape, dtype=dtype)
+    logger.info(f"Stack shape: {shape}, dtype: {dtype}, nodata: {nodata}")
+
+    band = 0
+    for raster, meta, count in zip(rasters, metadata, counts):
+        slot = stack[band : band + count]
+        data = raster[0]
+        array = np.ma.getdata(data)
+        slot[...] = array
+
+        # harmonize nodata with the stack
+        if nodata is not None:
+            missing = np.ma.getmaskarray(data)
+            if meta.get("nodata") is not None and not np.isnan(meta["nodata"]):
+                missing = missing | (array == meta["nodata"])
+            # NaN is missing for any stack nodata, including NaN itself
+            if np.issubdtype(array.dtype, np.floating):
+                missing = missing | np.isnan(array)
+            np.copyto(slot, nodata, where=missing)
+        elif isinstance(data, np.ma.MaskedArray):
+            # no nodata value: masked pixels are NaN, or 0 for integer stacks
+            np.copyto(slot, np.nan if dtype.kind == "f" else 0, where=data.mask)
+        band += count
+    if isinstance(stack, np.memmap):
+        stack.flush()
+
+    # CREATE METADATA FOR NUMPY STACK, starting from the first raster
+    stack_metadata = metadata[0].copy()
+    stack_metadata["descriptions"] = _descriptions(metadata)
+    stack_metadata["count"] = shape[0]
+    stack_metadata["dtype"] = dtype.name
+    stack_metadata["nodata"] = nodata
+    logger.info(f"Stack Descriptions: {stack_metadata['descriptions']}")
+
+    return stack, stack_metadata
+
+
+def _fits(value: float, dtype: np.dtype) -> bool:
+    """Whether a nodata value is represented exactly in ``dtype``."""
+    if np.isnan(value):
+        return dtype.kind == "f"
+    return bool(np.array(value).astype(dtype) == value)
+
+
+def _check_grid(metadata: List[Dict[str, Any]]) -> None:
+    """Checks that all rasters share the CRS and shape of the first one."""
+    crs = CRS.from_user_input(metadata[0]["crs"])
+    if not all(CRS.from_user_input(meta["crs"]) == crs for meta in metadata):
+        raise ValueError("Input rasters must have the same CRS.")
+    logger.info(f"CRS: {crs}")
+
+    shapes = [(meta["height"], meta["width"]) for meta in metadata]
+    if not all(shape == shapes[0] for shape in shapes):
+        raise ValueError(f"Input rasters must have the same shape, got {shapes}.")
+    logger.info(f"Array shape: {shapes[0]}")
+
+
+def _descriptions(metadata: List[Dict[str, Any]]) -> List[str]:
+    """Band descriptions of all inputs, ``band_<n>`` where missing."""
+    descriptions = []
+    for meta in metadata:
+        descriptions.extend(meta.get("descriptions") or [None] * meta["count"])
+    return [
+        description or f"band_{index}"
+        for index, description in enumerate(descriptions, start=1)
+    ]
@@ -0,0 +1,115 @@
+""" Module for converting rasters to pixel tables (one row per pixel). """
+
+import logging
+from typing import Any, Dict, Optional, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def raster_to_table(
+    input_raster: Tuple[np.ndarray, Dict[str, Any]],
+    valid: Optional[np.ndarray] = None,
+    geometry: bool = False,
+) -> Union[pd.DataFrame, gpd.GeoDataFrame]:
+    """Converts a raster to a table with one row per valid pixel.
+
+    The table is built with a few vectorized operations on the valid pixels
+    only, without coordinate grids or per-pixel objects. Columns:
+
+    - ``pixel``: flat index of the pixel in the grid (``row * width + col``).
+    - ``row``, ``col``: pixel position (int32).
+    - ``X``, ``Y``: coordinates of the pixel centre (float64).
+    - one float32 column per band, named after its description, with NaN
+      for nodata and non-finite values.
+
+    The CRS and transform of the grid are kept in ``table.attrs``, so the
+    table can be put back on the grid, and point geometries can be added
+    when needed with ``with_geometry``.
+
+    Example:
+    ::
+
+        >>> table = raster_to_table(raster_stack, valid=study_area_mask)
+        >>> table[["fractionCanopy", "LST"]].describe()
+
+    Args:
+        input_raster (Tuple): Raster (numpy array of shape (bands, height,
+        width)) and metadata (dict).
+        valid (np.ndarray, optional): Boolean mask of shape (height, width),
+        True for pixels to include (e.g. the study area). Pixels that are
+        nodata or non-finite (NaN, inf) in all bands are always excluded.
+        geometry (bool): Add point geometries and return a GeoDataFrame.
+
+    Returns:
+        pd.DataFrame: The pixel table (a GeoDataFrame with ``geometry``).
+    """
+    array, metadata = input_raster
+    bands, height, width = array.shape
+    nodata = metadata.get("nodata")
+
+    # valid pixels, with data in at least one band
+    if valid is None:
+        valid = np.ones((height, width), dtype=bool)
+    valid = valid & _has_data(array, nodata).any(axis=0)
+    pixel = np.flatnonzero(valid)
+    row, col = np.divmod(pixel, width)
+
+    # coordinates of the pixel centres, from the affine transform
+    xs, ys = metadata["transform"] * (col + 0.5, row + 0.5)
+
+    # one gather for all bands
+    values = array.reshape(bands, -1)[:, pixel].astype("float32")
+    values[~_has_data(values, nodata)] = np.nan
+
+    columns = {
+        "pixel": pixel,
+        "row": row.astype("int32"),
+        "col": col.astype("int32"),
+        "X": xs,
+        "Y": ys,
+    }
+    columns.update(zip(metadata["descriptions"], values))
+    table = pd.DataFrame(columns)
+    table.attrs.update(
+        {
+            "crs": str(metadata["crs"]),
+            "transform": tuple(metadata["transform"])[:6],
+            "width": width,
+            "height": height,
+        }
+    )
+    logger.info(f"Pixel table: {len(table)} of {height * width} pixels, {bands} bands")
+
+    if geometry:
+        return with_geometry(table)
+    return table
+
+
+def _has_data(array: np.ndarray, nodata: Optional[float]) -> np.ndarray:
+    """True where values are finite and not ``nodata``."""
+    if array.dtype.kind == "f":
+        has_data = np.isfinite(array)
+    else:
+        has_data = np.ones(array.shape, dtype=bool)
+    if nodata is not None and not np.isnan(nodata):
+        has_data &= array != nodata
+    return has_data
+
+
+def with_geometry(table: pd.DataFrame, crs: Any = None) -> gpd.GeoDataFrame:
+    """Adds pixel-centre point geometries to a pixel table.
+
+    Args:
+        table (pd.DataFrame): Pixel table with ``X`` and ``Y`` columns.
+        crs (optional): CRS of the points. Defaults to ``table.attrs["crs"]``.
+
+    Returns:
+        gpd.GeoDataFrame: The table with a ``geometry`` column.
+    """
+    crs = crs or table.attrs.get("crs")
+    geometry = gpd.points_from_xy(table["X"], table["Y"], crs=crs)
+    return gpd.GeoDataFrame(table, geometry=geometry, crs=crs)
@@ -0,0 +1,216 @@
+""" Module for block-wise (windowed) reading of rasters using rasterio. """
+# Adapted from:
+# https://rasterio.readthedocs.io/en/stable/topics/windowed-rw.html
+
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.windows import Window
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_bands(
+    descriptions: Sequence[Optional[str]], bands: Sequence[Union[int, str]]
+) -> List[int]:
+    """Resolves bands given by 1-based index or description to indexes.
+
+    Args:
+        descriptions (Sequence[str]): Band descriptions of the raster.
+        bands (Sequence[Union[int, str]]): Band indexes and/or descriptions,
+        e.g. ``[1, "LST"]``.
+
+    Raises:
+        ValueError: if a description or index does not exist in the raster.
+
+    Returns:
+        List[int]: 1-based band indexes, in the requested order.
+    """
+    indexes = []
+    for band in bands:
+        if isinstance(band, str):
+            if band not in descriptions:
+                raise ValueError(
+                    f"Band '{band}' not found, available bands: {descriptions}"
+                )
+            band = list(descriptions).index(band) + 1
+        if not 1 <= band <= len(descriptions):
+            raise ValueError(f"Band index {band} out of range 1..{len(descriptions)}")
+        indexes.append(int(band))
+    return indexes
+
+
+def read_window(
+    src,
+    window: Optional[Window] = None,
+    outside: Optional[np.ndarray] = None,
+    indexes: Optional[List[int]] = None,
+    out_dtype: Optional[str] = None,
+    masked: bool = False,
+) -> np.ndarray:
+    """Reads a window of an open raster and sets masked pixels to nodata.
+
+    All bands are read in a single call, cast by GDAL while reading.
+
+    Args:
+        src: Open rasterio dataset.
+        window (Window, optional): Window to read. Defaults to the full raster.
+        outside (np.ndarray, optional): Boolean mask of the window's shape,
+        True for pixels to set to nodata (0 if the raster has no nodata).
+        indexes (List[int], optional): 1-based bands to read. Defaults to all.
+        out_dtype (str, optional): Data type to cast to while reading.
+        masked (bool): Return a ``np.ma.MaskedArray`` with nodata and
+        ``outside`` pixels masked, instead of filling them with nodata.
+
+    Returns:
+        np.ndarray: Data of shape (bands, rows, cols).
+    """
+    array = src.read(indexes, window=window, out_dtype=out_dtype, masked=masked)
+    if outside is not None:
+        if masked:
+            array.mask = np.ma.getmaskarray(array) | outside
+        else:
+            array[:, outside] = src.nodata if src.nodata is not None else 0
+    return array
+
+
+def block_windows(
+    window: Window,
+    block_shape: Tuple[int, int],
+    tile_shape: Optional[Tuple[int, int]] = None,
+) -> Iterator[Tuple[Window, Window]]:
+    """Splits a window into tiles aligned to the internal block layout.
+
+    Tiles are made of whole internal blocks, so that every read touches each
+    block of the file only once. If ``tile_shape`` is given, each tile is
+    grown to the smallest multiple of the block shape covering it (useful for
+    striped files, where a block is a single row).
+
+    Args:
+        window (Window): Window of the file to split (e.g. the mask crop).
+        block_shape (Tuple[int, int]): Internal block shape (rows, cols).
+        tile_shape (Tuple[int, int], optional): Minimum tile shape (rows,
+        cols). Defaults to the internal block shape.
+
+    Yields:
+        Tuple[Window, Window]: Tile window relative to ``window`` and the
+        same tile as an absolute window in the file.
+    """
+    block_rows, block_cols = block_shape
+    if tile_shape is not None:
+        block_rows *= max(1, -(-int(tile_shape[0]) // block_rows))
+        block_cols *= max(1, -(-int(tile_shape[1]) // block_cols))
+
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    row_end, col_end = row_off + int(window.height), col_off + int(window.width)
+
+    # snap the first tile to the block grid of the file
+    first_row = (row_off // block_rows) * block_rows
+    first_col = (col_off // block_cols) * block_cols
+
+    for row in range(first_row, row_end, block_rows):
+        r0, r1 = max(row, row_off), min(row + block_rows, row_end)
+        for col in range(first_col, col_end, block_cols):
+            c0, c1 = max(col, col_off), min(col + block_cols, col_end)
+            absolute = Window(c0, r0, c1 - c0, r1 - r0)
+            relative = Window(c0 - col_off, r0 - row_off, c1 - c0, r1 - r0)
+            yield relative, absolute
+
+
+class RasterBlockReader:
+    """Lazy reader that streams a raster tile by tile.
+
+    The file is only opened when the reader is iterated, and each item holds
+    a single tile, so memory use is bounded by the tile size rather than the
+    raster size. Windows are relative to the grid described by ``meta`` (the
+    crop window if the raster was masked), so tiles can be written straight
+    into an output of shape ``(meta["count"], meta["height"], meta["width"])``.
+
+    Example:
+    ::
+
+        >>> for window, array, window_transform in reader:
+        ...     out[:, window.toslices()[0], window.toslices()[1]] = array
+    """
+
+    def __init__(
+        self,
+        opener: Callable[[], Any],
+        meta: Dict[str, Any],
+        block_shape: Tuple[int, int],
+        window: Optional[Window] = None,
+        tile_shape: Optional[Tuple[int, int]] = None,
+        outside: Optional[np.ndarray] = None,
+        read_args: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Creates a new block reader.
+
+        Args:
+            opener (Callable): Returns a context manager yielding the open
+            raster (a rasterio dataset or ``WarpedVRT``).
+            meta (Dict): Metadata of the grid that is read (cropped if masked).
+            block_shape (Tuple[int, int]): Internal block shape of the file.
+            window (Window, optional): Window of the file to read. Defaults to
+            the full file.
+            tile_shape (Tuple[int, int], optional): Minimum tile shape.
+            outside (np.ndarray, optional): Boolean mask of shape (height,
+            width), True for pixels to set to nodata.
+            read_args (Dict, optional): ``indexes``, ``out_dtype`` and
+            ``masked`` options of ``read_window``.
+        """
+        self._opener = opener
+        self.meta = meta
+        self.read_args = read_args or {}
+        self.block_shape = tuple(block_shape)
+        self.window = window or Window(0, 0, meta["width"], meta["height"])
+        self.tile_shape = tile_shape
+        self.outside = outside
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.windows())
+
+    def windows(self) -> Iterator[Window]:
+        """Yields the tile windows (relative to ``meta``) without reading."""
+        for relative, _ in block_windows(
+            self.window, self.block_shape, self.tile_shape
+        ):
+            yield relative
+
+    def __iter__(self) -> Iterator[Tuple[Window, np.ndarray, Affine]]:
+        """Reads the raster tile by tile.
+
+        Yields:
+            Tuple[Window, np.ndarray, Affine]: Tile window, tile data of shape
+            (bands, rows, cols) and the affine transform of the tile.
+        """
+        transform = self.meta["transform"]
+
+        with self._opener() as src:
+            for relative, absolute in block_windows(
+                self.window, self.block_shape, self.tile_shape
+            ):
+                outside = None
+                if self.outside is not None:
+                    rows, cols = relative.toslices()
+                    outside = self.outside[rows, cols]
+                array = read_window(src, absolute, outside, **self.read_args)
+                window_transform = rasterio.windows.transform(relative, transform)
+                yield relative, array, window_transform
+
+    def read(self) -> np.ndarray:
+        """Assembles all tiles into a single array (for small rasters).
+
+        Returns:
+            np.ndarray: Data of shape (bands, height, width).
+        """
+        shape = (self.meta["count"], self.meta["height"], self.meta["width"])
+        out = np.empty(shape, dtype=self.meta["dtype"])
+        if self.read_args.get("masked"):
+            out = np.ma.MaskedArray(out, mask=np.zeros(shape, dtype=bool))
+        for window, array, _ in self:
+            rows, cols = window.toslices()
+            out[:, rows, cols] = array
+        return out
@@ -0,0 +1,132 @@
+""" Module for applying feature scenarios (e.g. canopy changes) to a model. """
+
+import logging
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# transforms of a scenario, applied in this order
+TRANSFORMS = ("set", "scale", "add", "clip")
+
+
+def check_scenarios(
+    scenarios: Sequence[Dict[str, Any]], features: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """Checks scenario definitions against the features of a model.
+
+    A scenario has a ``name``, the ``feature`` it changes and one or more
+    transforms of that feature, applied in the order ``set`` (constant
+    value), ``scale`` (factor), ``add`` (offset) and ``clip`` (``[min,
+    max]``, either may be null):
+    ::
+
+        - name: no_canopy
+          feature: fractionCanopy
+          set: 0
+        - name: canopy_plus_10
+          feature: fractionCanopy
+          add: 0.1
+          clip: [0, 1]
+        - name: canopy_max_50
+          feature: fractionCanopy
+          clip: [null, 0.5]
+
+    Args:
+        scenarios (Sequence[Dict]): Scenario definitions.
+        features (Sequence[str]): Features of the model.
+
+    Raises:
+        ValueError: if a scenario has no or a duplicate name, an unknown
+        feature or key, or no transform.
+
+    Returns:
+        List[Dict]: The scenarios.
+    """
+    names = set()
+    for scenario in scenarios:
+        name = scenario.get("name")
+        if not name or name in names:
+            raise ValueError(f"Scenarios need a unique name, got '{name}'")
+        names.add(name)
+
+        if scenario.get("feature") not in features:
+            raise ValueError(
+                f"Scenario '{name}': feature '{scenario.get('feature')}' is not "
+                f"one of {list(features)}"
+            )
+        unknown = set(scenario) - {"name", "feature"} - set(TRANSFORMS)
+        if unknown:
+            raise ValueError(
+                f"Scenario '{name}': unknown keys {sorted(unknown)}, "
+                f"transforms are {TRANSFORMS}"
+            )
+        if not set(scenario) & set(TRANSFORMS):
+            raise ValueError(f"Scenario '{name}' has no transform {TRANSFORMS}")
+    return list(scenarios)
+
+
+def apply_scenarios(
+    X: np.ndarray, features: Sequence[str], scenarios: Sequence[Dict[str, Any]]
+) -> np.ndarray:
+    """Applies each scenario to a copy of the feature matrix.
+
+    Args:
+        X (np.ndarray): Feature matrix of shape (pixels, features).
+        features (Sequence[str]): Features, in the column order of ``X``.
+        scenarios (Sequence[Dict]): Scenario definitions (see
+        ``check_scenarios``).
+
+    Returns:
+        np.ndarray: Feature matrices of shape (scenarios, pixels, features).
+    """
+    out = np.repeat(X[np.newaxis], len(scenarios), axis=0)
+    for matrix, scenario in zip(out, scenarios):
+        values = matrix[:, list(features).index(scenario["feature"])]
+        if "set" in scenario:
+            values[:] = scenario["set"]
+        if "scale" in scenario:
+            values *= scenario["scale"]
+        if "add" in scenario:
+            values += scenario["add"]
+        if "clip" in scenario:
+            lower, upper = scenario["clip"]
+            np.clip(values, lower, upper, out=values)
+    return out
+
+
+def predict_scenarios(
+    model: Any,
+    X: np.ndarray,
+    features: Sequence[str],
+    scenarios: Sequence[Dict[str, Any]],
+) -> np.ndarray:
+    """Predicts the baseline and all scenarios in one call of the model.
+
+    The baseline and scenario feature matrices are stacked into one matrix,
+    so a linear model predicts all of them with a single matrix product.
+
+    Example:
+    ::
+
+        >>> y = predict_scenarios(regressor, X, features, scenarios)
+        >>> delta = y[1:] - y[0]
+
+    Args:
+        model: Fitted model with a scikit-learn style ``predict``.
+        X (np.ndarray): Feature matrix of shape (pixels, features).
+        features (Sequence[str]): Features, in the column order of ``X``.
+        scenarios (Sequence[Dict]): Scenario definitions (see
+        ``check_scenarios``).
+
+    Returns:
+        np.ndarray: Predictions of shape (1 + scenarios, pixels), the
+        baseline first.
+    """
+    stacked = np.concatenate([X[np.newaxis], apply_scenarios(X, features, scenarios)])
+    y = model.predict(
+        pd.DataFrame(stacked.reshape(-1, len(features)), columns=features)
+    )
+    return np.asarray(y).reshape(len(stacked), len(X))